@@ -3,7 +3,27 @@ from pathlib import Path
 
 import click
 
-from seigaiha.helper import read_json, files_in_dir
+from seigaiha.exception import InvalidPresetError
+from seigaiha.helper import (
+    PresetManifest,
+    read_json_files,
+    files_in_dir,
+)
+
+
+def _read_input_files(paths: list) -> list:
+    """
+    Returns the input items of preset files, where files which cannot be read have an error instead of content.
+    """
+
+    items = []
+    for path, content in zip(paths, read_json_files(paths)):
+        if isinstance(content, InvalidPresetError):
+            items.append({"path": path, "content": None, "error": content})
+        else:
+            items.append({"path": path, "content": content})
+
+    return items
 
 
 class InputPathChecker:
@@ -14,14 +34,27 @@ class InputPathChecker:
         results = []
         for batch_number, path in enumerate(value):
             current_batch = {"batch": batch_number + 1}
+            if path == "-":
+                current_batch = {
+                    **current_batch,
+                    "input": {"given": path, "resolved": PresetManifest()},
+                }
+                results.append(current_batch)
+                continue
+
             p = Path(path)
             if p.exists():
-                if p.is_file():
+                if p.is_file() and p.suffix.lower() in PresetManifest.extensions:
+                    current_batch = {
+                        **current_batch,
+                        "input": {"given": path, "resolved": PresetManifest(p)},
+                    }
+                elif p.is_file():
                     current_batch = {
                         **current_batch,
                         "input": {
                             "given": path,
-                            "resolved": [{"path": p, "content": read_json(p)}],
+                            "resolved": _read_input_files([p]),
                         },
                     }
                 elif p.is_dir():
@@ -30,11 +63,7 @@ class InputPathChecker:
                     if amount_of_files_in_directory == 0:
                         raise click.BadParameter("No files found in directory")
 
-                    for current_file_index, current_file_path in enumerate(files):
-                        files[current_file_index] = {
-                            "path": current_file_path,
-                            "content": read_json(current_file_path),
-                        }
+                    files = _read_input_files(files)
 
                     current_batch = {
                         **current_batch,
@@ -131,3 +160,73 @@ class OptionalValueChecker:
             results.append(current_batch)
 
         return results
+
+
+class ExtensionChecker(OptionalValueChecker):
+    def __init__(self, choices: list):
+        self.choices = choices
+
+    def __call__(self, ctx, param, value: tuple):
+        results = super().__call__(ctx, param, value)
+
+        for current_batch in results:
+            extensions = current_batch[param.name]
+            if not isinstance(extensions, list) or not extensions:
+                raise click.BadParameter(
+                    f"Expected a non-empty list of extensions, got `{extensions}`."
+                )
+
+            unsupported_extensions = [
+                extension for extension in extensions if extension not in self.choices
+            ]
+            if unsupported_extensions:
+                raise click.BadParameter(
+                    f"Unsupported extension(s) `{', '.join(map(str, unsupported_extensions))}`. "
+                    f"Choose from: {', '.join(self.choices)}."
+                )
+
+        return results
+
+
+class SizesChecker(OptionalValueChecker):
+    def __call__(self, ctx, param, value: tuple):
+        results = super().__call__(ctx, param, value)
+
+        for current_batch in results:
+            sizes = current_batch[param.name]
+            if sizes is None:
+                continue
+
+            if (
+                not isinstance(sizes, list)
+                or not sizes
+                or any(
+                    isinstance(size, bool)
+                    or not isinstance(size, (int, float))
+                    or size < 1
+                    for size in sizes
+                )
+            ):
+                raise click.BadParameter(
+                    f"Expected a non-empty list of sizes of at least 1, got `{sizes}`."
+                )
+
+        return results
+
+
+class ShardChecker:
+    def __call__(self, ctx, param, value):
+        if value is None:
+            return None
+
+        try:
+            index, count = (int(part) for part in value.split("/"))
+        except ValueError:
+            raise click.BadParameter(f"Expected a shard as `i/N`, got `{value}`.")
+
+        if count < 1 or not 1 <= index <= count:
+            raise click.BadParameter(
+                f"Expected a shard `i/N` with 1 <= i <= N, got `{value}`."
+            )
+
+        return index, count
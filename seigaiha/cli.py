@@ -2,267 +2,771 @@ import click
 
 from loguru import logger
 
+import dataclasses
 import random
-import math
-from itertools import cycle
-from shapely.geometry import Polygon, Point, LineString  # type: ignore[import-untyped]
-from shapely import affinity  # type: ignore[import-untyped]
+import sys
+import time
+from contextlib import ExitStack
+from functools import partial
+from pathlib import Path
+
 from seigaiha.args import (
     OutputPathChecker,
-    OptionalValueChecker,
+    ExtensionChecker,
+    SizesChecker,
+    ShardChecker,
     InputPathChecker,
 )
-from seigaiha.helper import combine_arguments_by_batch
+from seigaiha.colour import PatternColours, create_pattern_colours
+from seigaiha.cost import (
+    CostModel,
+    CostScheduler,
+    get_peak_memory,
+    get_preset_features,
+)
+from seigaiha.exception import InvalidManifestLineError, InvalidPresetError
+from seigaiha.geometry import (
+    GEOMETRY_EXTENSIONS,
+    create_geometry,
+    save_geometry_bin,
+    save_geometry_npz,
+)
+from seigaiha.helper import (
+    PresetManifest,
+    combine_arguments_by_batch,
+    files_in_dir,
+    read_json,
+)
+from seigaiha.index import (
+    PATTERN_INDEX_EXTENSION,
+    PatternIndex,
+    save_pattern_index,
+)
+from seigaiha.journal import CheckpointJournal, get_journal_path
+from seigaiha.occlusion import create_pattern_occlusion
+from seigaiha.parallel import PatternWorkerPool, get_pattern_workers
+from seigaiha.pattern import (
+    create_seamless_pattern,
+    get_broken_images,
+    get_native_pattern_area,
+    get_pattern_vertex_count,
+)
+from seigaiha.polygon import create_polygon
+from seigaiha.preset import (
+    Preset,
+    compile_preset,
+    get_preset_label,
+    iter_compiled_presets,
+)
+from seigaiha.preview import PREVIEW_EXTENSION, save_preview_png
+from seigaiha.pyramid import TilePyramid
+from seigaiha.shard import ShardPlan, get_unit_key, write_shard_manifest
+from seigaiha.spill import PatternDocument, PatternSpill
 from seigaiha.svg import SVGmaker
-
-
-def get_polygon_points(corners: int, width: int) -> list:
+from seigaiha.vector import (
+    VECTOR_EXTENSIONS,
+    VectorDocument,
+    VectorPage,
+    get_vector_document_path,
+    save_vector_eps,
+    save_vector_pdf,
+)
+from seigaiha.watch import InputWatcher, is_watchable
+from seigaiha.writer import OutputWriter
+
+EXTENSIONS = [
+    "svg",
+    "svgz",
+    "svg.br",
+    "svg.zst",
+    "png",
+    "pyramid",
+    PATTERN_INDEX_EXTENSION,
+    *GEOMETRY_EXTENSIONS,
+    *VECTOR_EXTENSIONS,
+    PREVIEW_EXTENSION,
+]
+
+
+def create_pattern_cells(
+    svg_maker: SVGmaker,
+    pattern_mode: str,
+    svg_pattern: list,
+    single_polygon: list,
+    broken_polygon: list,
+    colours: list,
+    broken_colours: list,
+    broken_images: dict,
+    spill_threshold: int | None = None,
+    pattern_pool: PatternWorkerPool | None = None,
+    pattern_colours: PatternColours | None = None,
+) -> tuple:
     """
-    Get coordinates for the polygon.
+    Create the pattern cells for the given pattern mode.
+
+    Returns the effective pattern mode, the cells grouped by row and their view box. Cells of patterns with at least
+    spill threshold vertices are stored in a pattern spill instead of memory. Grid cells are created by the pattern
+    pool if given, and coloured by the pattern colours if given. Hidden rings of grid cells are left out if the preset
+    culls them.
     """
 
-    radius = width / 2
-    points = []
-    for k in range(corners):
-        x_coordinate = radius + (
-            radius * math.cos(((2 * math.pi * k) / corners) - (1 / 2 * math.pi))
+    if pattern_mode == "native" and svg_maker.is_broken:
+        logger.warning(
+            "Broken polygons are not repeatable, falling back to `grid` mode."
         )
-        y_coordinate = radius + (
-            radius * math.sin(((2 * math.pi * k) / corners) - (1 / 2 * math.pi))
+        pattern_mode = "grid"
+
+    if pattern_mode in ["seamless", "native"]:
+        if pattern_mode == "seamless" and svg_maker.is_broken:
+            logger.warning(
+                "Broken polygons are not repeatable and are left out of the seamless pattern."
+            )
+
+        if pattern_colours is not None:
+            logger.warning(
+                f"Colour fields are not repeatable and are left out of the {pattern_mode} pattern."
+            )
+
+        seamless_view_box, pattern_polygon_coordinates = create_seamless_pattern(
+            svg_maker, single_polygon, colours
         )
-        points.append((x_coordinate, y_coordinate))
 
-    return points
+        return pattern_mode, pattern_polygon_coordinates, seamless_view_box
 
+    pattern_rows = (pattern_pool or PatternWorkerPool()).iter_pattern_rows(
+        svg_pattern,
+        single_polygon,
+        broken_polygon,
+        colours,
+        broken_colours,
+        broken_images,
+    )
+    if pattern_colours is not None:
+        pattern_rows = pattern_colours.apply(pattern_rows)
+
+    pattern_occlusion = create_pattern_occlusion(
+        svg_maker,
+        svg_pattern,
+        single_polygon,
+        broken_polygon,
+        colours,
+        broken_colours,
+        pattern_colours,
+    )
+    if pattern_occlusion is not None:
+        pattern_rows = pattern_occlusion.apply(pattern_rows)
 
-def create_polygon_object(points: list) -> Polygon:
-    """
-    Return a Shapely polygon from points.
-    """
-    return Polygon([[p[0], p[1]] for p in points])
+    if (
+        spill_threshold is not None
+        and get_pattern_vertex_count(svg_pattern, single_polygon) >= spill_threshold
+    ):
+        logger.info("Storing Seigaiha pattern cells in temporary files.")
+
+        return (
+            pattern_mode,
+            PatternSpill.from_rows(pattern_rows),
+            svg_maker.pattern_view_box(),
+        )
 
+    pattern_polygon_coordinates = list(pattern_rows)
 
-def get_polygon_coordinates(polygon_collection) -> list:
+    return pattern_mode, pattern_polygon_coordinates, svg_maker.pattern_view_box()
+
+
+def create_pattern_svg(
+    svg_maker: SVGmaker,
+    pattern_mode: str,
+    pattern_polygon_coordinates,
+    view_box: list,
+    svg_pattern: list,
+    single_polygon: list,
+) -> str | PatternDocument:
     """
-    Return polygon coordinates for given collection of polygons.
+    Create the SVG string of the pattern cells for the given pattern mode.
+
+    Cells in a pattern spill result in a pattern document, which is serialised while it is written.
     """
 
-    if isinstance(polygon_collection, list):
-        coordinates = []
-        for polygon in polygon_collection:
-            if isinstance(polygon, (Point, LineString)):
-                coordinates.append(polygon.coords[:-1])
-            else:
-                coordinates.append(polygon.exterior.coords[:-1])
-        return coordinates
+    if pattern_mode == "seamless":
+        svg_str_pattern = svg_maker.xml_initialise_seamless(view_box)
+        svg_poly_pattern = svg_maker.xml_create_pattern(pattern_polygon_coordinates)[
+            "string"
+        ]
+    elif pattern_mode == "native":
+        svg_str_pattern = svg_maker.xml_initialise_pattern()
+        svg_poly_pattern = svg_maker.xml_create_native_pattern(
+            pattern_polygon_coordinates,
+            view_box,
+            get_native_pattern_area(svg_maker, svg_pattern, single_polygon),
+        )
+    elif isinstance(pattern_polygon_coordinates, PatternSpill):
+        return PatternDocument(
+            svg_maker, svg_maker.xml_initialise_pattern(), pattern_polygon_coordinates
+        )
+    else:
+        svg_str_pattern = svg_maker.xml_initialise_pattern()
+        svg_poly_pattern = svg_maker.xml_create_pattern(pattern_polygon_coordinates)[
+            "string"
+        ]
 
-    return list(polygon_collection.exterior.coords)[:-1]
+    return svg_str_pattern.replace(svg_maker.poly_placeholder, svg_poly_pattern)
 
 
-def get_colours(polygon_collection: list, polygon_colours: list):
+def create_pattern_page(
+    svg_maker: SVGmaker,
+    pattern_mode: str,
+    pattern_polygon_coordinates,
+    view_box: list,
+    svg_pattern: list,
+    single_polygon: list,
+) -> VectorPage:
     """
-    Get alternating colours for polygon filling.
+    Create the vector page of the pattern cells for the given pattern mode, matching the pattern SVG.
     """
 
-    polygon_count = len(polygon_collection)
-    if len(polygon_colours) < polygon_count:
-        colour_cycle = cycle(polygon_colours)
-        colour_repeat_collection = []
-        for _ in range(0, polygon_count):
-            colour_repeat_collection.append(next(colour_cycle))
+    if pattern_mode == "seamless":
+        scale_x, scale_y, _, _ = svg_maker.pattern_viewport_transform()
 
-        return colour_repeat_collection
+        return VectorPage(
+            svg_maker,
+            [view_box[2] * scale_x, view_box[3] * scale_y],
+            view_box,
+            pattern_polygon_coordinates,
+        )
 
-    return polygon_colours
+    pattern_size = [svg_maker.pattern_width, svg_maker.pattern_height]
+    if pattern_mode == "native":
+        return VectorPage(
+            svg_maker,
+            pattern_size,
+            svg_maker.pattern_view_box(),
+            pattern_polygon_coordinates,
+            (
+                view_box,
+                get_native_pattern_area(svg_maker, svg_pattern, single_polygon),
+            ),
+        )
 
+    return VectorPage(
+        svg_maker,
+        pattern_size,
+        svg_maker.pattern_view_box(),
+        pattern_polygon_coordinates,
+    )
 
-def translate_polygon(
-    polygon: Polygon, x_direction: float, y_direction: float
-) -> Polygon:
-    """
-    Returns translated polygon with specified x/y offset.
-    """
-    return affinity.translate(polygon, x_direction, y_direction)
 
+def _release_png_tree(svg_maker: SVGmaker, content, _) -> None:
+    svg_maker.release_png_tree(content)
 
-def rotate_polygon(polygon: Polygon, rotation: int) -> Polygon:
+
+def submit_outputs(
+    svg_maker: SVGmaker,
+    output_writer: OutputWriter,
+    save_functions: dict,
+    contents: dict,
+    output_extensions: list,
+    current_file_path: Path,
+    current_output: Path,
+    unique_filename: bool,
+    description: str,
+    file_prefix: str = "",
+    vector_document: VectorDocument | None = None,
+) -> list:
     """
-    Returns rotated polygon.
+    Submit the content of every output extension to the writer.
+
+    PNG files are written at every output size of the preset if set, instead of the resolution. PDF output is added
+    as page to the vector document if given, instead of written to a file of its own.
+    Returns the (output path, write future) of all outputs.
     """
-    return affinity.rotate(polygon, rotation, origin="centroid")
 
+    outputs: list = []
+    for output_extension in output_extensions:
+        if output_extension == "pdf" and vector_document is not None:
+            vector_document.add_page(contents[output_extension])
+            outputs.append((vector_document.output_path, None))
+            continue
+
+        output_path = svg_maker.prepare_output_path(
+            current_file_path,
+            current_output,
+            output_extension,
+            unique_filename,
+            file_prefix,
+        )
 
-def scale_polygon(polygon: Polygon, scale_factor: float) -> Polygon:
-    """
-    Returns scaled polygon with specified scale factor.
-    """
-    return affinity.scale(
-        polygon, xfact=scale_factor, yfact=scale_factor, origin="center"
-    )
+        save_function = save_functions[output_extension]
+        sized_outputs = [(output_path, save_function)]
+        is_sized = output_extension == "png" and bool(svg_maker.png_sizes)
+        if is_sized:
+            sized_outputs = [
+                (
+                    svg_maker.sized_output_path(output_path, size),
+                    partial(save_function, size=size),
+                )
+                for size in svg_maker.png_sizes
+            ]
 
+            # The parsed document is held for every size, and released once its write is done, even if it fails
+            svg_maker.hold_png_tree(contents[output_extension], len(sized_outputs))
 
-def check_polygon_boundary_limit(value: float, limit: float = 0.1e-5) -> float:
-    """
-    Returns the checked value for polygon boundary.
-    """
-    if value < (round(value) + limit):
-        return round(value)
+        for sized_output_path, sized_save_function in sized_outputs:
+            future = output_writer.submit(
+                sized_save_function,
+                contents[output_extension],
+                sized_output_path,
+                description,
+            )
+            if is_sized:
+                future.add_done_callback(
+                    partial(_release_png_tree, svg_maker, contents[output_extension])
+                )
 
-    return value
+            outputs.append((sized_output_path, future))
 
+    return outputs
 
-def get_polygon_boundary(polygon: Polygon) -> list:
-    """
-    Returns the bounds of a polygon.
+
+def render_preset(
+    current_file_path: Path,
+    current_preset: Preset,
+    current_output: Path,
+    current_output_extension: list,
+    unique_filename: bool,
+    output_writer: OutputWriter,
+    spill_threshold: int | None = None,
+    pattern_pool: PatternWorkerPool | None = None,
+    output_sizes: list | None = None,
+    vector_document: VectorDocument | None = None,
+) -> list:
     """
-    return polygon.bounds
+    Render the element and pattern of a single preset and submit the output files to the writer.
 
+    Output sizes override the PNG output sizes of the preset. PDF output is added to the vector document if given.
 
-def get_polygon_dimensions(
-    x_coordinate_1: float,
-    y_coordinate_1: float,
-    x_coordinate_2: float,
-    y_coordinate_2: float,
-) -> dict:
+    Returns the (output path, write future) of all outputs, where outputs written directly have no future.
     """
-    Get Polygon dimensions.
-    """
-    return {
-        "width": max([x_coordinate_1, x_coordinate_2])
-        - min([x_coordinate_1, x_coordinate_2]),
-        "height": max([y_coordinate_1, y_coordinate_2])
-        - min([y_coordinate_1, y_coordinate_2]),
-    }
 
+    if output_sizes is not None:
+        current_preset = dataclasses.replace(
+            current_preset,
+            output=dataclasses.replace(
+                current_preset.output, sizes=tuple(output_sizes)
+            ),
+        )
 
-def create_polygon(
-    polygon_corners,
-    polygon_fractions,
-    polygon_colours,
-    polygon_width,
-    spacing=0.5,
-    polygon_rotation=0,
-):
-    """
-    Create a single polygon.
-    """
+    random.seed(current_preset.seed)
+
+    width = current_preset.output.resolution
+    fractions = current_preset.fractions
+    edges = current_preset.edges
+    spacing = current_preset.spacing
+    rotation = current_preset.rotation
+    pattern = current_preset.pattern
+    pattern_mode = current_preset.output.mode
+    colours = list(current_preset.colours)
+
+    # Create polygon object
+    box_dimensions, polygon_objects, polygon_coordinates, colours_format = (
+        create_polygon(edges, fractions, colours, width, spacing, rotation)
+    )
 
-    # Get polygon points
-    all_points = get_polygon_points(polygon_corners, polygon_width)
-
-    # Get polygon object
-    polygon = create_polygon_object(all_points)
-
-    # Retrieve polygon boundary box coordinates
-    (
-        x_coordinate_1,
-        y_coordinate_1,
-        x_coordinate_2,
-        y_coordinate_2,
-    ) = get_polygon_boundary(polygon)
-    boundary_box = get_polygon_dimensions(
-        x_coordinate_1, y_coordinate_1, x_coordinate_2, y_coordinate_2
+    # Init SVGmaker
+    svg_maker = SVGmaker(
+        current_preset, [box_dimensions["width"], box_dimensions["height"]]
     )
 
-    # Rotate
-    if polygon_rotation != 0:
-        polygon = rotate_polygon(polygon, polygon_rotation)
-        (
-            x_coordinate_1,
-            y_coordinate_1,
-            x_coordinate_2,
-            y_coordinate_2,
-        ) = get_polygon_boundary(polygon)
-
-        # Retranslate
-        polygon = translate_polygon(polygon, -x_coordinate_1, -y_coordinate_1)
-
-        (
-            x_coordinate_1,
-            y_coordinate_1,
-            x_coordinate_2,
-            y_coordinate_2,
-        ) = get_polygon_boundary(polygon)
-        boundary_box = get_polygon_dimensions(
-            x_coordinate_1, y_coordinate_1, x_coordinate_2, y_coordinate_2
+    # Create single SVG string
+    polygons_and_colours = [
+        {
+            "polygon": polygon_coordinates,
+            "broken": False,
+            "colour": colours_format,
+        }
+    ]
+    save_functions = {
+        "svg": svg_maker.save_svg,
+        "svgz": svg_maker.save_svgz,
+        "svg.br": svg_maker.save_svg_br,
+        "svg.zst": svg_maker.save_svg_zst,
+        "png": svg_maker.save_png,
+        "npz": save_geometry_npz,
+        "bin": save_geometry_bin,
+        "pdf": save_vector_pdf,
+        "eps": save_vector_eps,
+        PATTERN_INDEX_EXTENSION: save_pattern_index,
+        PREVIEW_EXTENSION: save_preview_png,
+    }
+
+    svg_output_extensions = [
+        output_extension
+        for output_extension in current_output_extension
+        if output_extension
+        not in [
+            "pyramid",
+            PATTERN_INDEX_EXTENSION,
+            *GEOMETRY_EXTENSIONS,
+            *VECTOR_EXTENSIONS,
+            PREVIEW_EXTENSION,
+        ]
+    ]
+    geometry_output_extensions = [
+        output_extension
+        for output_extension in current_output_extension
+        if output_extension in GEOMETRY_EXTENSIONS
+    ]
+    # Previews are rasterised from the same pages as the vector output
+    page_output_extensions = [
+        output_extension
+        for output_extension in current_output_extension
+        if output_extension in [*VECTOR_EXTENSIONS, PREVIEW_EXTENSION]
+    ]
+
+    element_contents = {}
+    if svg_output_extensions:
+        xml_result = svg_maker.xml_result(polygons_and_colours)
+        element_contents.update(dict.fromkeys(svg_output_extensions, xml_result))
+    if geometry_output_extensions:
+        element_geometry = create_geometry([polygons_and_colours], svg_maker.view_box)
+        element_contents.update(
+            dict.fromkeys(geometry_output_extensions, element_geometry)
+        )
+    if page_output_extensions:
+        element_page = VectorPage(
+            svg_maker,
+            [svg_maker.width, svg_maker.height],
+            svg_maker.view_box,
+            [polygons_and_colours],
         )
+        element_contents.update(dict.fromkeys(page_output_extensions, element_page))
+
+    outputs = submit_outputs(
+        svg_maker,
+        output_writer,
+        save_functions,
+        element_contents,
+        [
+            output_extension
+            for output_extension in current_output_extension
+            if output_extension not in ["pyramid", PATTERN_INDEX_EXTENSION]
+        ],
+        current_file_path,
+        current_output,
+        unique_filename,
+        "element",
+        vector_document=vector_document,
+    )
 
-    # Check if needs rescaling and translating
-    if (
-        check_polygon_boundary_limit(x_coordinate_1) != 0
-        or check_polygon_boundary_limit(y_coordinate_1) != 0
-        or check_polygon_boundary_limit(x_coordinate_2) != polygon_width
-    ):
-        # Scale
-        rescale_factor = polygon_width / boundary_box["width"]
-        polygon = scale_polygon(polygon, rescale_factor)
-
-        (
-            x_coordinate_1,
-            y_coordinate_1,
-            x_coordinate_2,
-            y_coordinate_2,
-        ) = get_polygon_boundary(polygon)
-        polygon = translate_polygon(polygon, -x_coordinate_1, -y_coordinate_1)
-
-        (
-            x_coordinate_1,
-            y_coordinate_1,
-            x_coordinate_2,
-            y_coordinate_2,
-        ) = get_polygon_boundary(polygon)
-        boundary_box = get_polygon_dimensions(
-            x_coordinate_1, y_coordinate_1, x_coordinate_2, y_coordinate_2
+    # %% pattern
+    if pattern is not None:
+        svg_pattern = svg_maker.xml_setup_pattern()
+
+        # "Broken" polygon should be a "normal" polygon if a broken pattern is not specified
+        broken_polygon = polygon_objects[:fractions]
+        broken_colours_format = colours_format
+
+        broken_pattern = pattern.broken
+        if broken_pattern is not None:
+            # Prepare broken polygon and colours
+            fractions = broken_pattern.fractions
+            _, broken_polygon_objects, _, broken_colours_format = create_polygon(
+                edges,
+                fractions,
+                list(broken_pattern.colours),
+                width,
+                spacing,
+                rotation,
+            )
+
+            broken_polygon = broken_polygon_objects[:fractions]
+
+        broken_images = get_broken_images(svg_maker, svg_pattern)
+        if broken_images and PREVIEW_EXTENSION in current_output_extension:
+            logger.warning("Broken images are left out of the pattern preview.")
+        pattern_colours = create_pattern_colours(
+            svg_maker, svg_pattern, colours_format, len(polygon_objects)
+        )
+
+        if "pyramid" in current_output_extension:
+            output_path = svg_maker.prepare_output_path(
+                current_file_path,
+                current_output,
+                "pyramid",
+                unique_filename,
+                "seigaiha",
+            )
+            output_directory = Path(output_path).with_suffix("")
+            tile_pyramid = TilePyramid(
+                svg_maker,
+                svg_pattern,
+                polygon_objects,
+                broken_polygon,
+                colours_format,
+                broken_colours_format,
+                broken_images,
+                pattern_colours,
+            )
+            outputs.append(
+                (
+                    output_directory,
+                    output_writer.submit(
+                        TilePyramid.save,
+                        tile_pyramid,
+                        output_directory,
+                        "pattern pyramid",
+                    ),
+                )
+            )
+
+        if PATTERN_INDEX_EXTENSION in current_output_extension:
+            if pattern_mode == "seamless":
+                logger.warning(
+                    "The pattern index describes the cells of the grid, which the seamless pattern does not contain, "
+                    "and is not written."
+                )
+            else:
+                outputs += submit_outputs(
+                    svg_maker,
+                    output_writer,
+                    save_functions,
+                    {
+                        PATTERN_INDEX_EXTENSION: PatternIndex.from_pattern(
+                            svg_maker, svg_pattern, polygon_objects, broken_polygon
+                        )
+                    },
+                    [PATTERN_INDEX_EXTENSION],
+                    current_file_path,
+                    current_output,
+                    unique_filename,
+                    "pattern index",
+                    "seigaiha",
+                )
+
+        pattern_output_extensions = [
+            output_extension
+            for output_extension in current_output_extension
+            if output_extension not in ["pyramid", PATTERN_INDEX_EXTENSION]
+        ]
+        pattern_contents = {}
+        if pattern_output_extensions:
+            pattern_mode, pattern_polygon_coordinates, pattern_view_box = (
+                create_pattern_cells(
+                    svg_maker,
+                    pattern_mode,
+                    svg_pattern,
+                    polygon_objects,
+                    broken_polygon,
+                    colours_format,
+                    broken_colours_format,
+                    broken_images,
+                    spill_threshold,
+                    pattern_pool,
+                    pattern_colours,
+                )
+            )
+        if svg_output_extensions:
+            svg_finalized_pattern = create_pattern_svg(
+                svg_maker,
+                pattern_mode,
+                pattern_polygon_coordinates,
+                pattern_view_box,
+                svg_pattern,
+                polygon_objects,
+            )
+            pattern_contents.update(
+                dict.fromkeys(svg_output_extensions, svg_finalized_pattern)
+            )
+        if geometry_output_extensions:
+            pattern_geometry = create_geometry(
+                pattern_polygon_coordinates, pattern_view_box
+            )
+            pattern_contents.update(
+                dict.fromkeys(geometry_output_extensions, pattern_geometry)
+            )
+        if page_output_extensions:
+            pattern_page = create_pattern_page(
+                svg_maker,
+                pattern_mode,
+                pattern_polygon_coordinates,
+                pattern_view_box,
+                svg_pattern,
+                polygon_objects,
+            )
+            pattern_contents.update(dict.fromkeys(page_output_extensions, pattern_page))
+
+        outputs += submit_outputs(
+            svg_maker,
+            output_writer,
+            save_functions,
+            pattern_contents,
+            pattern_output_extensions,
+            current_file_path,
+            current_output,
+            unique_filename,
+            "pattern",
+            "seigaiha",
+            vector_document,
         )
 
-    # Get center coordinates of polygon
-    px_center = polygon.centroid.x
-    py_center = polygon.centroid.y
+    return outputs
+
+
+def compile_batches(combined_result: list, manifest_offset: int) -> list:
+    """
+    Compile the presets of all batches up front, and returns the errors of all invalid presets.
+
+    Compiled presets of input files are stored with their input item. Manifests are only validated, as they are
+    read lazily while rendering, except for stdin which can only be read once.
+    """
+
+    invalid_presets: list = []
+    for item in combined_result:
+        input_files = item.get("input").get("resolved")
+        if isinstance(input_files, PresetManifest):
+            if input_files.path is None:
+                continue
 
-    # Get new coordinates for all points
-    all_points = get_polygon_coordinates(polygon)
+            input_files = input_files.read(manifest_offset, invalid_presets)
 
-    # Fractions list
-    if spacing is not None:
-        fractions = []
-        for i, fraction_value in enumerate(list(range(1, polygon_fractions + 1))):
-            if (i % 2) != 0:
-                fractions.append((fraction_value / polygon_fractions))
+        for input_item, compiled_preset, error in iter_compiled_presets(
+            input_files, item.get("extension")
+        ):
+            if error is not None:
+                invalid_presets.append(error)
                 continue
 
-            val = (fraction_value / polygon_fractions) - spacing * 1 / polygon_fractions
-            fractions.append(val if val <= 1 else 1)
-    else:
-        fractions = [
-            v / polygon_fractions for v in list(range(1, polygon_fractions + 1))
-        ]
+            if isinstance(input_files, list):
+                input_item["preset"] = compiled_preset
 
-    # Create all (sub)polygons
-    vct = []
-    for point in all_points:
-        pxl = [
-            (
-                (px_center - point[0]) * x + point[0],
-                (py_center - point[1]) * x + point[1],
-            )
-            for x in fractions
+    return invalid_presets
+
+
+def read_changed_items(item: dict, changed_paths: set):
+    """
+    Yields the input items of a batch of which the input files changed.
+
+    Files which cannot be read, e.g. while an editor is still writing them, are logged and left out.
+    """
+
+    input_path = Path(item["input"]["given"])
+    if input_path.is_dir():
+        changed_files = [
+            path for path in files_in_dir(input_path) if path in changed_paths
         ]
-        vct.append([point] + pxl)
+    else:
+        changed_files = [input_path] if input_path in changed_paths else []
+
+    for changed_file in changed_files:
+        if changed_file.suffix.lower() in PresetManifest.extensions:
+            try:
+                yield from PresetManifest(changed_file).read()
+            except InvalidManifestLineError as e:
+                logger.error(str(e))
+            continue
+
+        try:
+            yield {"path": changed_file, "content": read_json(changed_file)}
+        except (OSError, ValueError) as e:
+            logger.error(f"Seigaiha preset `{str(changed_file)}` cannot be read: {e}")
+
+
+def watch_batches(
+    combined_result: list,
+    unique_filename: bool,
+    output_writer: OutputWriter,
+    pattern_pool: PatternWorkerPool,
+    spill_threshold: int | None,
+    debounce: float,
+) -> None:
+    """
+    Re-render the presets of all batches when their input files change, until interrupted.
 
-    # Create polygons
-    polygon_collection = [Polygon(elk) for elk in zip(*vct)]
+    Only presets of which the content changed are rendered again, while the process, its worker pools and imports
+    stay warm in between.
+    """
+
+    watched_batches = [
+        item
+        for item in combined_result
+        if is_watchable(item.get("input").get("resolved"))
+    ]
+    if len(watched_batches) < len(combined_result):
+        logger.warning("Manifests read from stdin cannot be watched and are skipped.")
+
+    if not watched_batches:
+        return
+
+    # Presets rendered by the initial run, by batch and input path
+    rendered_presets = {}
+    for item in watched_batches:
+        resolved_input = item.get("input").get("resolved")
+        for input_item in resolved_input:
+            rendered_presets[(item.get("batch"), str(input_item.get("path")))] = (
+                input_item.get("content")
+            )
 
-    # If even, remove the last unnecessary entry (0 pixels)
-    if polygon_fractions % 2 == 0:
-        polygon_collection = polygon_collection[:-1]
+    with InputWatcher(
+        [item.get("input").get("given") for item in watched_batches], debounce
+    ) as input_watcher:
+        logger.info(
+            f"Watching Seigaiha presets for changes using "
+            f"{'inotify' if input_watcher.uses_inotify else 'polling'}, press Ctrl+C to stop."
+        )
 
-    # Get coords back
-    polygon_coordinates = get_polygon_coordinates(polygon_collection)
+        # Files changed during the initial run are only noticed by comparing their content
+        changed_paths: set = set(input_watcher.snapshot)
+        removed_paths: set = set()
+        try:
+            while True:
+                for removed_path in sorted(removed_paths):
+                    logger.info(f"Seigaiha preset `{str(removed_path)}` was removed.")
+
+                for item in watched_batches:
+                    shard_plan = item.get("shard")
+                    for input_item in read_changed_items(item, changed_paths):
+                        if shard_plan is not None and not shard_plan.owns(
+                            get_unit_key(item["input"]["given"], input_item)
+                        ):
+                            continue
+
+                        preset_key = (item.get("batch"), str(input_item.get("path")))
+                        if rendered_presets.get(preset_key) == input_item.get(
+                            "content"
+                        ):
+                            continue
+
+                        rendered_presets[preset_key] = input_item.get("content")
+                        logger.info(
+                            f"Seigaiha preset `{preset_key[1]}` changed, rendering."
+                        )
+                        try:
+                            render_preset(
+                                input_item.get("path"),
+                                compile_preset(
+                                    input_item.get("content"),
+                                    get_preset_label(input_item),
+                                    item.get("extension"),
+                                ),
+                                item.get("output").get("resolved"),
+                                item.get("extension"),
+                                unique_filename,
+                                output_writer,
+                                spill_threshold,
+                                pattern_pool,
+                                item.get("sizes"),
+                            )
+                        except InvalidPresetError as e:
+                            logger.error(f"Seigaiha preset skipped. {e}")
+                        except Exception as e:
+                            logger.exception(
+                                f"Seigaiha preset `{preset_key[1]}` failed: {e}"
+                            )
 
-    # Get colours to fill
-    polygon_colours = get_colours(polygon_collection, polygon_colours)
+                output_writer.flush()
 
-    return [boundary_box, polygon_collection, polygon_coordinates, polygon_colours]
+                changed_paths, removed_paths = input_watcher.wait()
+        except KeyboardInterrupt:
+            logger.info("Stopped watching Seigaiha presets.")
 
 
 @logger.catch
@@ -273,13 +777,19 @@ def create_polygon(
 @click.option(
     "--input-path",
     "-i",
-    type=click.Path(exists=True, dir_okay=True, file_okay=True, resolve_path=True),
+    type=click.Path(
+        exists=True,
+        dir_okay=True,
+        file_okay=True,
+        resolve_path=True,
+        allow_dash=True,
+    ),
     required=False,
     multiple=True,
     callback=InputPathChecker(),
     show_default=True,
     default=["./input"],
-    help="Path to input file or directory with preset options",
+    help="Path to input file, directory or JSONL manifest with preset options, or - to read a manifest from stdin",
 )
 @click.option(
     "--output-path",
@@ -295,13 +805,23 @@ def create_polygon(
 @click.option(
     "--extension",
     "-e",
-    type=click.Choice(['["svg", "png"]', '["svg"]', '["png"]']),
+    type=str,
     required=False,
     multiple=True,
-    callback=OptionalValueChecker(),
+    callback=ExtensionChecker(EXTENSIONS),
     show_default=True,
     default=['["svg", "png"]'],
-    help="Output file extension",
+    help=f"Output file extensions as list, choose from: {', '.join(EXTENSIONS)}",
+)
+@click.option(
+    "--sizes",
+    type=str,
+    required=False,
+    multiple=True,
+    callback=SizesChecker(),
+    show_default=True,
+    default=["None"],
+    help="PNG output sizes as list, rendered from a single parse of the SVG, None uses the sizes of the preset",
 )
 @click.option(
     "--unique-filename/--no-unique-filename",
@@ -310,270 +830,353 @@ def create_polygon(
     default=True,
     help="Create files with unique filenames by using current datetime suffix",
 )
+@click.option(
+    "--output-workers",
+    type=click.IntRange(min=0),
+    required=False,
+    show_default=True,
+    default=4,
+    help="Number of threads writing output files while rendering continues, 0 writes synchronously",
+)
+@click.option(
+    "--fsync-batch-size",
+    type=click.IntRange(min=0),
+    required=False,
+    show_default=True,
+    default=0,
+    help="Flush output files to disk after every N written files, 0 disables flushing",
+)
+@click.option(
+    "--manifest-offset",
+    type=click.IntRange(min=0),
+    required=False,
+    show_default=True,
+    default=0,
+    help="Skip the first N lines of JSONL manifest inputs, e.g. to resume an interrupted run",
+)
+@click.option(
+    "--resume/--no-resume",
+    is_flag=True,
+    show_default=True,
+    default=False,
+    help="Skip presets completed in a previous run according to the batch checkpoint journal, and retry failed ones",
+)
+@click.option(
+    "--max-retries",
+    type=click.IntRange(min=1),
+    required=False,
+    show_default=True,
+    default=3,
+    help="Stop retrying a preset with --resume after it failed this many times",
+)
+@click.option(
+    "--spill-threshold",
+    type=click.IntRange(min=0),
+    required=False,
+    show_default=True,
+    default=10_000_000,
+    help="Store pattern cells in memory-mapped temporary files for patterns with at least N vertices, 0 always stores them",
+)
+@click.option(
+    "--pattern-workers",
+    type=click.IntRange(min=0),
+    required=False,
+    show_default=True,
+    default=1,
+    help="Number of processes creating the cells of grid patterns, 0 uses all processors",
+)
+@click.option(
+    "--watch/--no-watch",
+    is_flag=True,
+    show_default=True,
+    default=False,
+    help="Keep running after rendering, and render presets again when their input files change",
+)
+@click.option(
+    "--watch-debounce",
+    type=click.FloatRange(min=0),
+    required=False,
+    show_default=True,
+    default=0.5,
+    help="Seconds without further changes to wait before rendering changed presets in watch mode",
+)
+@click.option(
+    "--skip-invalid/--no-skip-invalid",
+    is_flag=True,
+    show_default=True,
+    default=False,
+    help="Render the valid presets if some presets are invalid, instead of stopping before rendering",
+)
+@click.option(
+    "--pdf-document/--no-pdf-document",
+    is_flag=True,
+    show_default=True,
+    default=False,
+    help="Write the PDF output of all presets of a batch as pages of a single document, instead of a file per preset",
+)
+@click.option(
+    "--schedule",
+    type=click.Choice(["input", "longest-first"]),
+    required=False,
+    show_default=True,
+    default="input",
+    help="Order of rendering the presets of a batch, longest-first renders the presets predicted to take longest first",
+)
+@click.option(
+    "--memory-budget",
+    type=click.IntRange(min=0),
+    required=False,
+    show_default=True,
+    default=0,
+    help="Wait rendering the next preset until its predicted memory fits next to the presets still being written, in MB, 0 disables the budget",
+)
+@click.option(
+    "--shard",
+    type=str,
+    required=False,
+    callback=ShardChecker(),
+    default=None,
+    help="Render only shard i of N, e.g. 2/4, so N nodes can render the same input without overlap",
+)
 def cli(
     input_path,
     output_path,
     extension,
+    sizes,
     unique_filename,
+    output_workers,
+    fsync_batch_size,
+    manifest_offset,
+    resume,
+    max_retries,
+    spill_threshold,
+    pattern_workers,
+    watch,
+    watch_debounce,
+    skip_invalid,
+    pdf_document,
+    schedule,
+    memory_budget,
+    shard,
 ):
-    combined_result = combine_arguments_by_batch(input_path, output_path, extension)
-
-    for item in combined_result:
-        current_batch = item.get("batch")
-        current_output_extension = item.get("extension")
-        current_output = item.get("output").get("resolved")
-        current_input_original_batch_name = item.get("input").get("given")
-        current_input_files = item.get("input").get("resolved")
-        total_current_input_files = len(current_input_files)
-
-        for current_file_path_index, current_file_item in enumerate(
-            current_input_files
-        ):
-            if current_file_path_index == 0:
-                logger.info(
-                    f"Seigaiha batch `{current_batch}` for `{current_input_original_batch_name}` started."
-                )
-
-            current_file_path = current_file_item.get("path")
-            current_preset = current_file_item.get("content")
-
-            seed = current_preset.get("seed", None)
-            random.seed(seed)
-
-            default_resolution = 2500
-            width = current_preset.get(
-                "output", {"resolution": default_resolution}
-            ).get("resolution")
-            if width is None:
-                width = default_resolution
+    combined_result = combine_arguments_by_batch(
+        input_path, output_path, extension, sizes
+    )
 
-            fractions = current_preset.get("fractions")
-            edges = current_preset.get("edges", 36)
-            spacing = current_preset.get("spacing", 0)
-            rotation = current_preset.get("rotation", 0)
-            pattern = current_preset.get("pattern", False)
-            colours = current_preset.get("colours", [])
+    invalid_presets = compile_batches(combined_result, manifest_offset)
+    for invalid_preset in invalid_presets:
+        logger.error(str(invalid_preset))
 
-            # colours to tuple
-            colours = [tuple(el.values()) for el in colours]
+    # In watch mode invalid presets are rendered once they are fixed
+    if invalid_presets and not skip_invalid and not watch:
+        logger.error(
+            f"{len(invalid_presets)} invalid Seigaiha presets, nothing was rendered. "
+            f"Use --skip-invalid to render the valid presets."
+        )
+        sys.exit(1)
 
-            # Create polygon object
-            box_dimensions, polygon_objects, polygon_coordinates, colours_format = (
-                create_polygon(edges, fractions, colours, width, spacing, rotation)
-            )
+    # Manifests are read again while rendering, where their invalid lines are now left out
+    for item in combined_result:
+        if isinstance(item.get("input").get("resolved"), PresetManifest):
+            item.get("input").get("resolved").skip_invalid = skip_invalid or watch
+
+    failed_presets = 0
+    with OutputWriter(
+        output_workers, fsync_batch_size, memory_budget * 1024 * 1024
+    ) as output_writer, PatternWorkerPool(
+        get_pattern_workers(pattern_workers)
+    ) as pattern_pool:
+        for item in combined_result:
+            current_batch = item.get("batch")
+            current_output_extension = item.get("extension")
+            current_output = item.get("output").get("resolved")
+            current_input_original_batch_name = item.get("input").get("given")
+            current_input_files = item.get("input").get("resolved")
+            shard_plan = None
+            if shard is not None:
+                shard_plan = ShardPlan(*shard)
+                item["shard"] = shard_plan
+                current_input_files = shard_plan.select(
+                    current_input_original_batch_name,
+                    current_input_files,
+                    manifest_offset,
+                )
+            elif isinstance(current_input_files, PresetManifest):
+                current_input_files = current_input_files.read(manifest_offset)
 
-            # Init SVGmaker
-            svg_maker = SVGmaker(
-                current_preset, [box_dimensions["width"], box_dimensions["height"]]
+            logger.info(
+                f"Seigaiha batch `{current_batch}` for `{current_input_original_batch_name}` started"
+                f"{'' if shard_plan is None else f' as shard {shard_plan}'}."
             )
 
-            # Create single SVG string
-            polygons_and_colours = [
-                {
-                    "polygon": polygon_coordinates,
-                    "broken": False,
-                    "colour": colours_format,
-                }
-            ]
-            xml_result = svg_maker.xml_result(polygons_and_colours)
-
-            for output_extension in current_output_extension:
-                output_path = svg_maker.prepare_output_path(
-                    current_file_path,
-                    current_output,
-                    output_extension,
-                    unique_filename,
+            # The cost model learns from the reports of earlier runs, so it is read before the journal is rewritten
+            cost_model = CostModel()
+            if schedule == "longest-first" or memory_budget > 0:
+                cost_model = CostModel.from_journals(current_output)
+                logger.info(
+                    f"Seigaiha cost model learned from {cost_model.reports} reported presets."
+                    if cost_model.reports
+                    else "Seigaiha cost model uses its default coefficients."
                 )
-                if output_extension == "svg":
-                    svg_maker.save_svg(xml_result, output_path)
-
-                if output_extension == "png":
-                    svg_maker.save_png(xml_result, output_path)
 
-                logger.info(f"Saved Seigaiha element to `{str(output_path)}`.")
-
-            # %% pattern
-            if isinstance(pattern, dict):
-                svg_str_pattern = svg_maker.xml_initialise_pattern()
-                svg_pattern = svg_maker.xml_setup_pattern()
-
-                # "Broken" polygon should be a "normal" polygon if a broken pattern is not specified
-                broken_polygon = polygon_objects[:fractions]
-
-                broken_pattern = pattern.get("broken", False)
-                if broken_pattern:
-                    # Prepare broken polygon and colours
-                    broken_colours_tuple = [
-                        tuple(el.values())
-                        for el in broken_pattern.get(
-                            "colours", current_preset.get("colours", [])
-                        )
-                    ]
-
-                    fractions = broken_pattern.get("fractions", fractions)
-                    _, broken_polygon_objects, _, broken_colours_format = (
-                        create_polygon(
-                            edges,
-                            fractions,
-                            broken_colours_tuple,
-                            width,
-                            spacing,
-                            rotation,
-                        )
+            if schedule == "longest-first":
+                current_input_files = CostScheduler(
+                    cost_model, current_output_extension, item.get("sizes")
+                ).order(current_input_files)
+
+            checkpoint_journal = CheckpointJournal(
+                get_journal_path(
+                    current_output, current_input_original_batch_name, shard_plan
+                ),
+                resume,
+                max_retries,
+            )
+            vector_document = None
+            if pdf_document and "pdf" in current_output_extension:
+                vector_document = VectorDocument(
+                    get_vector_document_path(
+                        current_output,
+                        current_input_original_batch_name,
+                        unique_filename,
+                        shard_plan,
                     )
+                )
+            with checkpoint_journal, ExitStack() as batch_stack:
+                if vector_document is not None:
+                    batch_stack.enter_context(vector_document)
+
+                # Manifests which are not validated up front, e.g. stdin, end at their first invalid line
+                try:
+                    for current_file_item in current_input_files:
+                        current_file_path = current_file_item.get("path")
+                        current_preset = current_file_item.get("content")
+                        if not checkpoint_journal.should_render(
+                            current_file_path, current_preset, current_output_extension
+                        ):
+                            continue
+
+                        if "line" in current_file_item:
+                            logger.info(
+                                f"Seigaiha preset `{current_file_path}` from line {current_file_item.get('line')}."
+                            )
 
-                    broken_polygon = broken_polygon_objects[:fractions]
-
-                # Create copies of the initial "single" polygon and translate conform pattern
-                pattern_polygons_objects = []
-                for idx, row in enumerate(svg_pattern):
-                    pattern_polygons_objects.append([])
-                    polygons_row_objects = []
-                    for _, current_x_list in enumerate(row):
-                        x_point = current_x_list[0]
-                        y_point = current_x_list[1]
-                        is_broken = current_x_list[2]["broken"]
-
-                        single_polygon = polygon_objects
-                        if is_broken is True:
-                            single_polygon = broken_polygon
-
-                        transformed_polygon = [
-                            affinity.translate(p, x_point, y_point)
-                            for p in single_polygon
-                        ]
-
-                        polygons_row_objects.append(
-                            {"polygon": transformed_polygon, "broken": is_broken}
+                        current_features = get_preset_features(
+                            current_preset, current_output_extension, item.get("sizes")
                         )
+                        current_memory = cost_model.predict_memory(current_features)
+                        output_writer.admit(current_memory)
+
+                        started = time.monotonic()
+                        peak_memory = get_peak_memory()
+                        try:
+                            if "error" in current_file_item:
+                                raise current_file_item["error"]
+
+                            compiled_preset = current_file_item.get("preset")
+                            if compiled_preset is None:
+                                compiled_preset = compile_preset(
+                                    current_preset,
+                                    get_preset_label(current_file_item),
+                                    current_output_extension,
+                                )
 
-                    pattern_polygons_objects[idx] = polygons_row_objects
-
-                pattern_polygons_objects_copy = pattern_polygons_objects.copy()
-                first_polygon_bounds = pattern_polygons_objects[0][0]["polygon"][
-                    0
-                ].bounds
-                last_polygon_bounds = pattern_polygons_objects[-1][-1]["polygon"][
-                    -1
-                ].bounds
+                            outputs = render_preset(
+                                current_file_path,
+                                compiled_preset,
+                                current_output,
+                                current_output_extension,
+                                unique_filename,
+                                output_writer,
+                                spill_threshold,
+                                pattern_pool,
+                                item.get("sizes"),
+                                vector_document,
+                            )
+                        except InvalidPresetError as e:
+                            logger.error(f"Seigaiha preset skipped. {e}")
+                            checkpoint_journal.record(
+                                checkpoint_journal.preset_key(
+                                    current_file_path,
+                                    current_preset,
+                                    current_output_extension,
+                                ),
+                                [],
+                                e,
+                            )
+                            continue
+                        except Exception as e:
+                            logger.exception(
+                                f"Seigaiha preset `{str(current_file_path)}` failed: {e}"
+                            )
+                            checkpoint_journal.record(
+                                checkpoint_journal.preset_key(
+                                    current_file_path,
+                                    current_preset,
+                                    current_output_extension,
+                                ),
+                                [],
+                                e,
+                            )
+                            continue
 
-                polygon_width = first_polygon_bounds[2] - first_polygon_bounds[0]
-                polygon_height = first_polygon_bounds[3] - first_polygon_bounds[1]
+                        current_report = {"features": current_features}
+                        if peak_memory is not None:
+                            current_report["memory"] = get_peak_memory() - peak_memory
 
-                pattern_container = [
-                    (
-                        first_polygon_bounds[0] + (polygon_width / 2),
-                        first_polygon_bounds[1] + (polygon_height / 2),
-                    ),
-                    (
-                        first_polygon_bounds[0] + (polygon_width / 2),
-                        last_polygon_bounds[3],
-                    ),
-                    (
-                        last_polygon_bounds[2],
-                        last_polygon_bounds[3],
-                    ),
-                    (
-                        last_polygon_bounds[2],
-                        first_polygon_bounds[1] + (polygon_height / 2),
-                    ),
-                ]
-
-                pattern_polygon_container = Polygon(pattern_container)
-
-                pattern_polygon_coordinates = []
-                for idx, row in enumerate(pattern_polygons_objects):
-                    pattern_polygon_coordinates.append([])
-                    polygons_row_new = []
-                    for idy, col in enumerate(row):
-                        for idp, spol in enumerate(col["polygon"]):
-                            intersect = spol.intersection(pattern_polygon_container)
-                            if not intersect.is_empty:
-                                pattern_polygons_objects_copy[idx][idy]["polygon"][
-                                    idp
-                                ] = intersect
-
-                        single_polygon_coords_new = get_polygon_coordinates(
-                            pattern_polygons_objects_copy[idx][idy]["polygon"]
+                        output_writer.hold(
+                            [future for _, future in outputs], current_memory
                         )
-
-                        is_broken = pattern_polygons_objects[idx][idy]["broken"]
-
-                        if is_broken and svg_maker.repeat_broken_images:
-                            pos_x_offset = svg_maker.width / 2
-                            if idx & 1:
-                                pos_x_offset = svg_maker.width
-
-                            single_polygon_coords_new.append(
-                                random.choice(svg_maker.repeat_broken_images)
-                                .replace(
-                                    "%posX%",
-                                    str(
-                                        (
-                                            svg_maker.width
-                                            * svg_maker.repeat_horizontal_spacing
-                                            * idy
-                                        )
-                                        + pos_x_offset
-                                    ),
-                                )
-                                .replace(
-                                    "%posY%",
-                                    str(
-                                        (
-                                            svg_maker.height
-                                            * svg_maker.repeat_vertical_spacing
-                                            * idx
-                                        )
-                                        + (svg_maker.height / 2)
-                                    ),
-                                )
-                            )
-
-                        polygons_row_new.append(
-                            {
-                                "polygon": single_polygon_coords_new,
-                                "broken": is_broken,
-                                "colour": (
-                                    colours_format
-                                    if not is_broken
-                                    else broken_colours_format
-                                ),
-                            }
+                        checkpoint_journal.track(
+                            current_file_path,
+                            current_preset,
+                            current_output_extension,
+                            outputs,
+                            current_report,
+                            started,
                         )
+                except InvalidManifestLineError as e:
+                    logger.error(f"Seigaiha batch `{current_batch}` stopped. {e}")
+                    failed_presets += 1
 
-                    # If odd row in pattern, last element is unnecessary and was not correctly intersected earlier.
-                    if idx & 1:
-                        polygons_row_new = polygons_row_new[:-1]
+                output_writer.flush()
 
-                    pattern_polygon_coordinates[idx] = polygons_row_new
+            failed_presets += checkpoint_journal.failed
 
-                # Create the actual pattern
-                svg_poly_pattern = svg_maker.xml_create_pattern(
-                    pattern_polygon_coordinates
+            if shard_plan is not None:
+                write_shard_manifest(
+                    get_journal_path(
+                        current_output,
+                        current_input_original_batch_name,
+                        shard_plan,
+                        "shard",
+                    ),
+                    shard_plan,
+                    current_input_original_batch_name,
+                    checkpoint_journal,
                 )
-                svg_finalized_pattern = svg_str_pattern.replace(
-                    svg_maker.poly_placeholder, svg_poly_pattern["string"]
+                logger.info(
+                    f"Seigaiha shard {shard_plan} of batch `{current_batch}` was assigned "
+                    f"{shard_plan.units} of {shard_plan.total_units} presets."
                 )
-                for output_extension in current_output_extension:
-                    output_path = svg_maker.prepare_output_path(
-                        current_file_path,
-                        current_output,
-                        output_extension,
-                        unique_filename,
-                        "seigaiha",
-                    )
-                    if output_extension == "svg":
-                        svg_maker.save_svg(svg_finalized_pattern, output_path)
-
-                    if output_extension == "png":
-                        svg_maker.save_png(svg_finalized_pattern, output_path)
-
-                    logger.info(f"Saved Seigaiha pattern to `{str(output_path)}`.")
-
-            if current_file_path_index != total_current_input_files - 1:
-                continue
 
             logger.info(
-                f"Seigaiha batch `{current_batch}` for `{current_input_original_batch_name}` finished."
+                f"Seigaiha batch `{current_batch}` for `{current_input_original_batch_name}` finished "
+                f"({checkpoint_journal.completed} completed, {checkpoint_journal.failed} failed, "
+                f"{checkpoint_journal.skipped} skipped)."
             )
+
+        if watch:
+            watch_batches(
+                combined_result,
+                unique_filename,
+                output_writer,
+                pattern_pool,
+                spill_threshold,
+                watch_debounce,
+            )
+
+    if failed_presets and not watch:
+        logger.error(
+            f"{failed_presets} Seigaiha presets failed, rerun with --resume to retry them."
+        )
+        sys.exit(1)
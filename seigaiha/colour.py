@@ -0,0 +1,230 @@
+import numpy as np
+
+from seigaiha.rng import PresetRandom
+
+COLOUR_FUNCTIONS = ["gradient", "hue"]
+
+COLOUR_SOURCES = ["horizontal", "vertical", "diagonal", "radial", "noise"]
+
+
+def get_ring_colours(colours: list, rings: int) -> np.ndarray:
+    """
+    Returns the (rings, 4) RGBA array of colours cycled over the rings of a polygon.
+    """
+
+    return np.asarray(
+        [colours[ring % len(colours)] for ring in range(rings)], dtype=np.float64
+    )
+
+
+def rgb_to_hsv(rgb: np.ndarray) -> np.ndarray:
+    """
+    Returns the HSV values of RGB values, both in [0, 1] along the last axis.
+    """
+
+    maximum = rgb.max(axis=-1)
+    delta = maximum - rgb.min(axis=-1)
+    safe_delta = np.where(delta > 0, delta, 1)
+
+    red, green, blue = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    hue = np.select(
+        [delta == 0, maximum == red, maximum == green],
+        [
+            0,
+            ((green - blue) / safe_delta) % 6,
+            (blue - red) / safe_delta + 2,
+        ],
+        (red - green) / safe_delta + 4,
+    )
+
+    return np.stack(
+        (
+            hue / 6,
+            np.where(maximum > 0, delta / np.where(maximum > 0, maximum, 1), 0),
+            maximum,
+        ),
+        axis=-1,
+    )
+
+
+def hsv_to_rgb(hsv: np.ndarray) -> np.ndarray:
+    """
+    Returns the RGB values of HSV values, both in [0, 1] along the last axis.
+    """
+
+    hue, saturation, value = hsv[..., 0] % 1 * 6, hsv[..., 1], hsv[..., 2]
+    sector = np.floor(hue).astype(np.int64) % 6
+    fraction = hue - np.floor(hue)
+
+    p = value * (1 - saturation)
+    q = value * (1 - saturation * fraction)
+    t = value * (1 - saturation * (1 - fraction))
+
+    # Channel values of every sector, selected per value
+    channels = np.stack(
+        (
+            np.stack((value, q, p, p, t, value), axis=-1),
+            np.stack((t, value, value, q, p, p), axis=-1),
+            np.stack((p, p, t, value, value, q), axis=-1),
+        ),
+        axis=-1,
+    )
+
+    return np.take_along_axis(channels, sector[..., None, None], axis=-2)[..., 0, :]
+
+
+def get_colour_field_source(
+    source: str,
+    positions_x: np.ndarray,
+    positions_y: np.ndarray,
+    preset_random,
+    scale: float,
+) -> np.ndarray:
+    """
+    Returns the value in [0, 1] of a colour field source at cell positions, in polygon widths.
+    """
+
+    if source == "noise":
+        return preset_random.noise(
+            "colour_field",
+            (positions_x - positions_x.min()) / scale,
+            (positions_y - positions_y.min()) / scale,
+        )
+
+    normalised_x = (positions_x - positions_x.min()) / max(np.ptp(positions_x), 1e-12)
+    normalised_y = (positions_y - positions_y.min()) / max(np.ptp(positions_y), 1e-12)
+
+    match source:
+        case "vertical":
+            return normalised_y
+        case "diagonal":
+            return (normalised_x + normalised_y) / 2
+        case "radial":
+            return np.minimum(
+                np.hypot(normalised_x - 0.5, normalised_y - 0.5) / np.sqrt(0.5), 1
+            )
+        case _:
+            return normalised_x
+
+
+def create_colour_field(
+    colour_field,
+    colours: list,
+    rings: int,
+    positions_x: np.ndarray,
+    positions_y: np.ndarray,
+    preset_random,
+) -> np.ndarray:
+    """
+    Returns the (rows, columns, rings, 4) RGBA colours of all cells, in a single pass over all cells.
+
+    Positions are the (rows, columns) arrays of cell positions, in polygon widths.
+    """
+
+    field_value = get_colour_field_source(
+        colour_field.source, positions_x, positions_y, preset_random, colour_field.scale
+    )[..., None, None]
+    ring_colours = get_ring_colours(colours, rings)
+
+    if colour_field.function == "hue":
+        hsv = rgb_to_hsv(np.clip(ring_colours[:, :3], 0, 255) / 255)
+        hsv = np.broadcast_to(hsv, (*positions_x.shape, rings, 3)).copy()
+        hsv[..., 0] += field_value[..., 0] * colour_field.hue / 360
+
+        return np.concatenate(
+            (
+                hsv_to_rgb(hsv) * 255,
+                np.broadcast_to(ring_colours[:, 3:], (*positions_x.shape, rings, 1)),
+            ),
+            axis=-1,
+        )
+
+    target_colours = get_ring_colours(list(colour_field.colours), rings)
+
+    return ring_colours + (target_colours - ring_colours) * field_value
+
+
+class PatternColours:
+    """
+    Pattern colours.
+
+    Colours of the rings of all cells of a pattern, from a (rows, columns, rings, 4) RGBA colour field. Cells with
+    the same colours share a single colour list, so every distinct colour is formatted once when serialised and
+    stored once in a pattern spill.
+    """
+
+    def __init__(self, colour_field: np.ndarray):
+        rows, columns, rings, _ = colour_field.shape
+
+        quantised_field = np.concatenate(
+            (
+                np.clip(np.rint(colour_field[..., :3]), 0, 255),
+                np.clip(np.round(colour_field[..., 3:], 4), 0, 1),
+            ),
+            axis=-1,
+        ).reshape(rows * columns, rings * 4)
+        unique_colours, cell_index = np.unique(
+            quantised_field, axis=0, return_inverse=True
+        )
+
+        # Every distinct colour is a single tuple, shared by all lists containing it
+        colour_tuples: dict = {}
+        self.colour_lists = []
+        for cell_colours in unique_colours.reshape(-1, rings, 4).tolist():
+            colour_list = []
+            for red, green, blue, alpha in cell_colours:
+                colour = (
+                    int(red),
+                    int(green),
+                    int(blue),
+                    int(alpha) if alpha.is_integer() else alpha,
+                )
+                colour_list.append(colour_tuples.setdefault(colour, colour))
+            self.colour_lists.append(colour_list)
+
+        self.cell_index = cell_index.reshape(rows, columns).tolist()
+
+    def cell_colours(self, row: int, column: int) -> list:
+        """
+        Returns the colours of a cell.
+        """
+        return self.colour_lists[self.cell_index[row][column]]
+
+    def apply(self, rows):
+        """
+        Yields the rows of pattern cells with the colours of the colour field. Broken cells keep their colours.
+        """
+        for row, row_cells in enumerate(rows):
+            for column, cell in enumerate(row_cells):
+                if cell["broken"] is not True:
+                    cell["colour"] = self.cell_colours(row, column)
+
+            yield row_cells
+
+
+def create_pattern_colours(
+    svg_maker, svg_pattern: list, colours: list, rings: int
+) -> PatternColours | None:
+    """
+    Returns the colours of all pattern cells from the colour field of the preset, or None without colour field.
+    """
+
+    colour_field = svg_maker.preset.pattern.colour_field
+    if colour_field is None:
+        return None
+
+    positions = np.asarray(
+        [[cell[:2] for cell in row_cells] for row_cells in svg_pattern],
+        dtype=np.float64,
+    )
+
+    return PatternColours(
+        create_colour_field(
+            colour_field,
+            colours,
+            rings,
+            positions[..., 0] / svg_maker.width,
+            positions[..., 1] / svg_maker.width,
+            svg_maker.preset_random or PresetRandom(svg_maker.preset.seed),
+        )
+    )
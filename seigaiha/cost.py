@@ -0,0 +1,321 @@
+import json
+import sys
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+from seigaiha.preset import DEFAULT_RESOLUTION
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # type: ignore[assignment]
+
+# Features of the cost model, each scaled by a coefficient in seconds
+COST_FEATURES = (
+    "preset",
+    "element_vertices",
+    "pattern_vertices",
+    "broken_images",
+    "text_vertices",
+    "raster_vertices",
+    "raster_pixels",
+    "pyramid_vertices",
+)
+
+# Seconds per unit of every feature, used until enough presets are reported
+DEFAULT_TIME_COEFFICIENTS = {
+    "preset": 0.01,
+    "element_vertices": 2e-6,
+    "pattern_vertices": 2e-6,
+    "broken_images": 2e-4,
+    "text_vertices": 1e-6,
+    "raster_vertices": 2e-6,
+    "raster_pixels": 2e-8,
+    "pyramid_vertices": 4e-6,
+}
+
+# Bytes per preset and per vertex held in memory while rendering, used until enough presets are reported
+DEFAULT_MEMORY_COEFFICIENTS = {"preset": 16 << 20, "vertices": 256}
+
+# Reported presets needed before coefficients are learned
+COST_MIN_REPORTS = 8
+
+# Presets ordered at once when scheduling presets which are read lazily, e.g. from manifests
+SCHEDULE_WINDOW = 1024
+
+TEXT_EXTENSIONS = [
+    "svg",
+    "svgz",
+    "svg.br",
+    "svg.zst",
+    "pdf",
+    "eps",
+    "npz",
+    "bin",
+    "preview.png",
+]
+
+
+def get_preset_features(content, extensions: list, sizes: list | None = None) -> dict:
+    """
+    Returns the cost features of a preset and its requested extensions, optionally with the PNG sizes of the batch.
+
+    The features are read from the raw preset, so presets which are not compiled yet can be scheduled. Invalid
+    options are counted as their defaults.
+    """
+
+    def number(options, key, default):
+        try:
+            value = float(options.get(key, default))
+        except (AttributeError, TypeError, ValueError):
+            return default
+
+        return value if np.isfinite(value) and value >= 0 else default
+
+    content = content if isinstance(content, dict) else {}
+    fractions = max(number(content, "fractions", 1), 1)
+    edges = max(number(content, "edges", 36), 3)
+
+    output_options = content.get("output")
+    output_options = output_options if isinstance(output_options, dict) else {}
+    resolution = number(output_options, "resolution", DEFAULT_RESOLUTION)
+    if not sizes:
+        sizes = output_options.get("sizes")
+    if not isinstance(sizes, (list, tuple)) or not sizes:
+        sizes = [resolution]
+
+    pattern_options = content.get("pattern")
+    pattern_options = pattern_options if isinstance(pattern_options, dict) else {}
+    cells = 0.0
+    broken_cells = 0.0
+    broken_fractions = fractions
+    broken_images = 0
+    if pattern_options:
+        horizontal = pattern_options.get("horizontal")
+        vertical = pattern_options.get("vertical")
+        cells = number(horizontal if isinstance(horizontal, dict) else {}, "amount", 0)
+        cells *= number(vertical if isinstance(vertical, dict) else {}, "amount", 0)
+
+        broken_options = pattern_options.get("broken")
+        if isinstance(broken_options, dict):
+            broken_cells = cells * min(number(broken_options, "factor", 0), 1)
+            broken_fractions = max(number(broken_options, "fractions", fractions), 1)
+            if broken_options.get("images"):
+                broken_images = 1
+
+    element_vertices = fractions * edges
+    pattern_vertices = (
+        (cells - broken_cells) * fractions + broken_cells * broken_fractions
+    ) * edges
+    vertices = element_vertices + pattern_vertices
+    rasters = extensions.count("png") * len(sizes)
+
+    return {
+        "preset": 1.0,
+        "element_vertices": float(element_vertices),
+        "pattern_vertices": float(pattern_vertices),
+        "broken_images": float(broken_cells * broken_images),
+        "text_vertices": float(
+            vertices * sum(extension in TEXT_EXTENSIONS for extension in extensions)
+        ),
+        "raster_vertices": float(vertices * rasters),
+        "raster_pixels": float(
+            2
+            * extensions.count("png")
+            * sum(number({"size": size}, "size", resolution) ** 2 for size in sizes)
+        ),
+        "pyramid_vertices": float(pattern_vertices * ("pyramid" in extensions)),
+    }
+
+
+def get_peak_memory() -> int | None:
+    """
+    Returns the peak resident memory of the process in bytes, or None if it is unknown.
+    """
+
+    if resource is None:
+        return None
+
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS bytes
+    return peak_memory if sys.platform == "darwin" else peak_memory * 1024
+
+
+class CostModel:
+    """
+    Cost model.
+
+    Predicts the render time and memory of a preset from its features. Render time is linear in the features, with
+    coefficients learned from the reports of earlier runs by least squares, regularised towards the defaults so few
+    or similar reports do not give extreme coefficients. Memory is linear in the vertices, with a per-vertex
+    coefficient learned from the growth of the peak memory while rendering earlier presets.
+    """
+
+    def __init__(
+        self,
+        time_coefficients: dict | None = None,
+        memory_coefficients: dict | None = None,
+    ):
+        self.time_coefficients = dict(time_coefficients or DEFAULT_TIME_COEFFICIENTS)
+        self.memory_coefficients = dict(
+            memory_coefficients or DEFAULT_MEMORY_COEFFICIENTS
+        )
+        self.reports = 0
+
+    def predict_seconds(self, features: dict) -> float:
+        return sum(
+            self.time_coefficients[feature] * features.get(feature, 0.0)
+            for feature in COST_FEATURES
+        )
+
+    def predict_memory(self, features: dict) -> float:
+        return self.memory_coefficients["preset"] + self.memory_coefficients[
+            "vertices"
+        ] * (
+            features.get("element_vertices", 0.0)
+            + features.get("pattern_vertices", 0.0)
+        )
+
+    def learn(self, reports: list) -> None:
+        """
+        Learn the coefficients from reports of rendered presets, with their features, seconds and memory growth.
+        """
+        reports = [
+            report
+            for report in reports
+            if isinstance(report.get("features"), dict)
+            and isinstance(report.get("seconds"), (int, float))
+        ]
+        self.reports = len(reports)
+        if len(reports) < COST_MIN_REPORTS:
+            return
+
+        default_coefficients = np.asarray(
+            [DEFAULT_TIME_COEFFICIENTS[feature] for feature in COST_FEATURES]
+        )
+        scaled_features = (
+            np.asarray(
+                [
+                    [
+                        float(report["features"].get(feature, 0.0))
+                        for feature in COST_FEATURES
+                    ]
+                    for report in reports
+                ]
+            )
+            * default_coefficients
+        )
+        seconds = np.asarray([float(report["seconds"]) for report in reports])
+
+        # Ridge regression of the factors on the defaults, pulled towards a factor of 1
+        gram = scaled_features.T @ scaled_features
+        regularisation = 1e-3 * max(np.trace(gram), 1e-12) / len(COST_FEATURES)
+        factors = np.linalg.solve(
+            gram + regularisation * np.eye(len(COST_FEATURES)),
+            scaled_features.T @ seconds + regularisation,
+        )
+        self.time_coefficients = {
+            feature: float(coefficient)
+            for feature, coefficient in zip(
+                COST_FEATURES, default_coefficients * np.clip(factors, 0.0, None)
+            )
+        }
+
+        # The peak memory only grows for presets exceeding the earlier peak, so use a high quantile of those
+        bytes_per_vertex = [
+            float(report["memory"])
+            / (
+                report["features"].get("element_vertices", 0.0)
+                + report["features"].get("pattern_vertices", 0.0)
+            )
+            for report in reports
+            if isinstance(report.get("memory"), (int, float))
+            and report["memory"] > 0
+            and report["features"].get("element_vertices", 0.0)
+            + report["features"].get("pattern_vertices", 0.0)
+            > 0
+        ]
+        if len(bytes_per_vertex) >= COST_MIN_REPORTS:
+            self.memory_coefficients["vertices"] = float(
+                np.quantile(bytes_per_vertex, 0.9)
+            )
+
+    @classmethod
+    def from_journals(cls, output_path: Path):
+        """
+        Returns a cost model learned from the reports in the checkpoint journals next to the output.
+        """
+        cost_model = cls()
+        output_directory = output_path if output_path.is_dir() else output_path.parent
+        if not output_directory.is_dir():
+            return cost_model
+
+        reports = []
+        for journal_path in sorted(output_directory.glob(".seigaiha-journal-*.jsonl")):
+            try:
+                with journal_path.open("r") as journal_file:
+                    for line in journal_file:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+
+                        if entry.get("status") == "completed" and isinstance(
+                            entry.get("report"), dict
+                        ):
+                            reports.append(entry["report"])
+            except OSError:
+                continue
+
+        cost_model.learn(reports)
+
+        return cost_model
+
+
+class CostScheduler:
+    """
+    Cost scheduler.
+
+    Orders the presets of a batch longest first by their predicted render time, so the largest presets are not
+    left for the end, where they would hold up the whole run. Presets read lazily are ordered per window, so they
+    are still not all held in memory.
+    """
+
+    def __init__(
+        self,
+        cost_model: CostModel,
+        extensions: list,
+        sizes: list | None = None,
+        window: int = SCHEDULE_WINDOW,
+    ):
+        self.cost_model = cost_model
+        self.extensions = extensions
+        self.sizes = sizes
+        self.window = window
+
+    def order(self, input_files):
+        """
+        Yields the input items longest first.
+        """
+        if isinstance(input_files, list):
+            yield from self._order_window(input_files)
+            return
+
+        input_files = iter(input_files)
+        while True:
+            window_items = list(islice(input_files, self.window))
+            if not window_items:
+                return
+
+            yield from self._order_window(window_items)
+
+    def _order_window(self, items: list) -> list:
+        return sorted(
+            items,
+            key=lambda item: -self.cost_model.predict_seconds(
+                get_preset_features(item.get("content"), self.extensions, self.sizes)
+            ),
+        )
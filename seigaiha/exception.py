@@ -18,3 +18,53 @@ class SvgToPngImageError(Exception):
 
     def __str__(self):
         return self.message
+
+
+class VectorOutputError(Exception):
+    ERROR_MESSAGE = "Cannot draw {extension} output. Reason: {message}."
+
+    def __init__(self, extension, message):
+        self.message = self.ERROR_MESSAGE.format(extension=extension, message=message)
+        super().__init__(self.message)
+
+    def __str__(self):
+        return self.message
+
+
+class MissingOptionalDependencyError(Exception):
+    ERROR_MESSAGE = "The `{extension}` extension requires the optional `{package}` package. Install it with `pip install seigaiha[compression]`."
+
+    def __init__(self, package, extension):
+        self.message = self.ERROR_MESSAGE.format(package=package, extension=extension)
+        super().__init__(self.message)
+
+    def __str__(self):
+        return self.message
+
+
+class InvalidManifestLineError(Exception):
+    ERROR_MESSAGE = (
+        "Invalid preset on line {line} of manifest `{manifest}`. Reason: {message}."
+    )
+
+    def __init__(self, manifest, line, message):
+        self.message = self.ERROR_MESSAGE.format(
+            manifest=manifest, line=line, message=message
+        )
+        super().__init__(self.message)
+
+    def __str__(self):
+        return self.message
+
+
+class InvalidPresetError(Exception):
+    ERROR_MESSAGE = "Invalid preset `{path}`. Reason: {errors}."
+
+    def __init__(self, path, errors):
+        self.path = path
+        self.errors = errors
+        self.message = self.ERROR_MESSAGE.format(path=path, errors="; ".join(errors))
+        super().__init__(self.message)
+
+    def __str__(self):
+        return self.message
@@ -0,0 +1,118 @@
+import json
+from itertools import chain
+from pathlib import Path
+
+import numpy as np
+
+from seigaiha.helper import atomic_output_path
+
+GEOMETRY_EXTENSIONS = ["npz", "bin"]
+
+GEOMETRY_FORMAT_VERSION = 1
+
+# Alignment of the arrays in the raw buffer, so every array can be viewed in place
+GEOMETRY_BUFFER_ALIGNMENT = 16
+
+
+def create_geometry(rows: list, view_box: list) -> dict:
+    """
+    Create contiguous geometry arrays of pattern cells, grouped by row.
+
+    Ring vertices of all cells are concatenated, where ring `i` spans `vertices[ring_offsets[i]:ring_offsets[i + 1]]`.
+    Broken images are not part of the geometry.
+    """
+
+    ring_lengths: list = []
+    ring_rgba: list = []
+    ring_cell: list = []
+    cell_position: list = []
+    cell_broken: list = []
+    cell_rings: list = []
+    for row, row_cells in enumerate(rows):
+        for column, cell in enumerate(row_cells):
+            cell_index = len(cell_position)
+            cell_position.append((row, column))
+            cell_broken.append(bool(cell["broken"]))
+
+            rings = [ring for ring in cell["polygon"] if not isinstance(ring, str)]
+            cell_rings.append(rings[: len(cell["colour"])])
+            for ring, colour in zip(rings, cell["colour"]):
+                ring_lengths.append(len(ring))
+                ring_rgba.append(
+                    (
+                        max(0, min(colour[0], 255)) / 255,
+                        max(0, min(colour[1], 255)) / 255,
+                        max(0, min(colour[2], 255)) / 255,
+                        colour[3],
+                    )
+                )
+                ring_cell.append(cell_index)
+
+    vertex_count = sum(ring_lengths)
+    vertices = np.fromiter(
+        chain.from_iterable(chain.from_iterable(chain.from_iterable(cell_rings))),
+        dtype="<f4",
+        count=vertex_count * 2,
+    ).reshape(vertex_count, 2)
+
+    ring_offsets = np.zeros(len(ring_lengths) + 1, dtype="<u4")
+    np.cumsum(ring_lengths, out=ring_offsets[1:])
+
+    return {
+        "vertices": vertices,
+        "ring_offsets": ring_offsets,
+        "ring_rgba": np.asarray(ring_rgba, dtype="<f4").reshape(-1, 4),
+        "ring_cell": np.asarray(ring_cell, dtype="<u4"),
+        "cell_position": np.asarray(cell_position, dtype="<i4").reshape(-1, 2),
+        "cell_broken": np.asarray(cell_broken, dtype="u1"),
+        "view_box": np.asarray(view_box, dtype="<f8"),
+    }
+
+
+def save_geometry_npz(geometry: dict, output_path: Path) -> None:
+    """
+    Save the geometry arrays as uncompressed NumPy archive.
+    """
+    with atomic_output_path(output_path) as temporary_path:
+        with open(str(temporary_path), "wb") as npz_file:
+            np.savez(npz_file, **geometry)
+
+
+def save_geometry_bin(geometry: dict, output_path: Path) -> None:
+    """
+    Save the geometry arrays as single raw little-endian buffer, with a JSON index of the arrays next to it.
+
+    The index is written last, so an existing index always belongs to a complete buffer.
+    """
+    index: dict = {
+        "format": "seigaiha-geometry",
+        "version": GEOMETRY_FORMAT_VERSION,
+        "buffer": output_path.name,
+        "view_box": geometry["view_box"].tolist(),
+        "arrays": {},
+    }
+
+    with atomic_output_path(output_path) as temporary_path:
+        with open(str(temporary_path), "wb") as bin_file:
+            offset = 0
+            for name, array in geometry.items():
+                if name == "view_box":
+                    continue
+
+                padding = -offset % GEOMETRY_BUFFER_ALIGNMENT
+                bin_file.write(b"\0" * padding)
+                offset += padding
+
+                index["arrays"][name] = {
+                    "dtype": array.dtype.str,
+                    "shape": list(array.shape),
+                    "offset": offset,
+                }
+                bin_file.write(array.tobytes())
+                offset += array.nbytes
+
+    with atomic_output_path(
+        output_path.with_name(output_path.name + ".json")
+    ) as temporary_path:
+        with open(str(temporary_path), "w") as index_file:
+            json.dump(index, index_file, indent=4)
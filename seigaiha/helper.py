@@ -1,35 +1,89 @@
 import collections
 import fnmatch
 import json
+import os
+import sys
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from pathlib import Path
 
+from loguru import logger
+
+from seigaiha.exception import InvalidManifestLineError, InvalidPresetError
+
 
 def files_in_dir(
     path: Path,
     file_types=["*.json"],
+    workers: int | None = None,
 ):
     """
     Returns a list of files in the given directory that match the specified file types.
 
+    Directories are scanned in parallel, which mainly helps on network mounted volumes.
+    The files are returned in the same order as `Path.rglob`.
+
     Parameters:
         path (Path): The path to the directory.
         file_types (List[str], optional): A list of file types to match. Defaults to ["*.json"].
+        workers (int, optional): The number of threads scanning directories. Defaults to the executor default.
 
     Returns:
         List[Path]: A list of paths to the files in the directory that match the specified file types.
     """
 
-    file_list = [
-        f
-        for f in path.rglob("*")
-        if any(
-            fnmatch.fnmatch(f.name.lower(), pattern.lower()) for pattern in file_types
+    entries_by_directory = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(_scan_directory, path): path}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory = pending.pop(future)
+                entries_by_directory[directory] = future.result()
+                for entry_path, entry_is_dir in entries_by_directory[directory]:
+                    if entry_is_dir:
+                        pending[executor.submit(_scan_directory, entry_path)] = (
+                            entry_path
+                        )
+
+    file_list: list = []
+    directories = [path]
+    while directories:
+        directory = directories.pop()
+        entries = entries_by_directory[directory]
+        file_list.extend(
+            entry_path
+            for entry_path, _ in entries
+            if any(
+                fnmatch.fnmatch(entry_path.name.lower(), pattern.lower())
+                for pattern in file_types
+            )
+        )
+        directories.extend(
+            reversed(
+                [entry_path for entry_path, entry_is_dir in entries if entry_is_dir]
+            )
         )
-    ]
 
     return file_list
 
 
+def _scan_directory(path: Path) -> list:
+    """
+    Returns the (path, is directory) entries of a directory, without following symlinks.
+    """
+
+    try:
+        with os.scandir(path) as scandir_iterator:
+            return [
+                (path.joinpath(entry.name), entry.is_dir(follow_symlinks=False))
+                for entry in scandir_iterator
+            ]
+    except PermissionError:
+        return []
+
+
 def read_json(path: Path) -> dict:
     """
     Reads a JSON file from the given path and returns its contents as a dictionary.
@@ -47,6 +101,160 @@ def read_json(path: Path) -> dict:
     return data
 
 
+class PresetManifest:
+    """
+    Preset manifest.
+
+    Reads presets lazily from a JSON lines (JSONL/NDJSON) file or stdin, so memory use does not grow with the
+    amount of presets. Every line contains either a preset, or an object with the `preset` and an optional
+    output file `name`. Without a name, the output file is named after the manifest and the line number.
+
+    An invalid line ends the manifest, unless invalid lines are skipped, in which case they are logged and left out.
+    """
+
+    extensions = [".jsonl", ".ndjson"]
+
+    def __init__(self, path: Path | None = None, skip_invalid: bool = False):
+        self.path = path
+        self.name = "stdin" if path is None else path.stem
+        self.skip_invalid = skip_invalid
+
+    def __iter__(self):
+        return self.read()
+
+    def read(self, offset: int = 0, errors: list | None = None):
+        """
+        Yields the presets of the manifest, skipping the first `offset` lines.
+
+        Parameters:
+            offset (int, optional): The number of lines to skip. Defaults to 0.
+            errors (list, optional): Collects the errors of invalid lines, which are then left out. Defaults to None.
+
+        Yields:
+            dict: The output file path, the preset content and the line number.
+        """
+
+        if self.path is None:
+            yield from self._read_lines(sys.stdin, offset, errors)
+            return
+
+        with self.path.open("r") as file:
+            yield from self._read_lines(file, offset, errors)
+
+    def _read_lines(self, file, offset: int, errors: list | None):
+        for line_number, line in enumerate(file, start=1):
+            if line_number <= offset or not line.strip():
+                continue
+
+            try:
+                yield self._read_line(line, line_number)
+            except InvalidManifestLineError as e:
+                if errors is not None:
+                    errors.append(e)
+                elif self.skip_invalid:
+                    logger.error(f"Seigaiha preset skipped. {e}")
+                else:
+                    raise
+
+    def _read_line(self, line: str, line_number: int) -> dict:
+        try:
+            content = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise InvalidManifestLineError(self.name, line_number, str(e))
+
+        if not isinstance(content, dict):
+            raise InvalidManifestLineError(
+                self.name, line_number, "the line must be a JSON object"
+            )
+
+        name = f"{self.name}_{line_number}"
+        if "preset" in content:
+            name = content.get("name", name)
+            content = content["preset"]
+
+        return {"path": Path(name), "content": content, "line": line_number}
+
+
+def read_json_files(paths: list, workers: int | None = None) -> list:
+    """
+    Reads multiple JSON files in parallel and returns their contents in the same order.
+
+    Files which cannot be read or are not valid JSON are returned as an invalid preset error naming the file, so
+    all of them can be reported at once.
+
+    Parameters:
+        paths (List[Path]): The paths to the JSON files.
+        workers (int, optional): The number of threads reading files. Defaults to the executor default.
+
+    Returns:
+        List[dict | InvalidPresetError]: The contents of the JSON files as dictionaries, or their errors.
+    """
+
+    if len(paths) < 2:
+        return [_read_json_or_error(path) for path in paths]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_read_json_or_error, paths))
+
+
+def _read_json_or_error(path: Path):
+    try:
+        return read_json(path)
+    except (OSError, ValueError) as e:
+        return InvalidPresetError(path, [f"the file cannot be read, {e}"])
+
+
+@contextmanager
+def atomic_output_path(output_path: Path):
+    """
+    Yields a temporary path next to the output path, which replaces the output path once written.
+
+    Readers of the output path never see a partially written file.
+
+    Parameters:
+        output_path (Path): The path of the output file.
+
+    Yields:
+        Path: The temporary path to write to.
+    """
+
+    output_path = Path(output_path)
+    temporary_path = output_path.with_name(
+        f".{output_path.name}.{uuid.uuid4().hex}.tmp"
+    )
+    try:
+        yield temporary_path
+        os.replace(temporary_path, output_path)
+    finally:
+        temporary_path.unlink(missing_ok=True)
+
+
+def fsync_paths(paths: list) -> None:
+    """
+    Flushes written files and their directory entries to disk.
+
+    Parameters:
+        paths (List[Path]): The paths of the written files.
+    """
+
+    for path in paths:
+        file_descriptor = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(file_descriptor)
+        finally:
+            os.close(file_descriptor)
+
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+
+    for directory in {Path(path).parent for path in paths}:
+        directory_descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory_descriptor)
+        finally:
+            os.close(directory_descriptor)
+
+
 def combine_arguments_by_batch(*lists):
     """
     Combine arguments from multiple lists into batches based on the 'batch' key in each item.
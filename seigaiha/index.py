@@ -0,0 +1,311 @@
+import json
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+
+import numpy as np
+import shapely  # type: ignore[import-untyped]
+from shapely import wkt  # type: ignore[import-untyped]
+
+from seigaiha.helper import atomic_output_path
+from seigaiha.pattern import get_pattern_container, get_pattern_row_length
+
+PATTERN_INDEX_EXTENSION = "index.json"
+
+PATTERN_INDEX_FORMAT_VERSION = 1
+
+
+class PatternIndex:
+    """
+    Pattern index.
+
+    Spatial index of the cells of a grid pattern, answering which cells are painted at a point, within a region or
+    nearest to a point. Cells are identified by (row, column) and returned in painting order, and a cell covers the
+    outer ring of its polygon clipped to the pattern container.
+
+    Cells are placed on a grid with the same column positions for all even and for all odd rows, so candidate cells
+    are found by bisecting the row and column positions, and only the candidates are tested against the outer ring.
+    The index only stores the grid and the outer rings, so its size does not depend on the amount of cells.
+    """
+
+    def __init__(
+        self,
+        row_positions: list,
+        column_positions: list,
+        broken_cells: list,
+        single_outline,
+        broken_outline,
+        container_bounds: list,
+        view_box: list,
+        viewport_transform: list,
+    ):
+        self.row_positions = list(row_positions)
+        self.column_positions = [list(positions) for positions in column_positions]
+        self.broken_cells = {tuple(cell) for cell in broken_cells}
+        self.single_outline = single_outline
+        self.broken_outline = broken_outline
+        self.container_bounds = list(container_bounds)
+        self.view_box = list(view_box)
+        self.viewport_transform = list(viewport_transform)
+
+        shapely.prepare(self.single_outline)
+        shapely.prepare(self.broken_outline)
+
+        # Bounds of all outer rings relative to their cell position
+        single_bounds = self.single_outline.bounds
+        broken_bounds = self.broken_outline.bounds
+        self.outline_bounds = (
+            min(single_bounds[0], broken_bounds[0]),
+            min(single_bounds[1], broken_bounds[1]),
+            max(single_bounds[2], broken_bounds[2]),
+            max(single_bounds[3], broken_bounds[3]),
+        )
+
+    @classmethod
+    def from_pattern(
+        cls, svg_maker, svg_pattern: list, single_polygon: list, broken_polygon: list
+    ):
+        """
+        Returns the index of the cells of a pattern.
+        """
+        return cls(
+            [row_cells[0][1] for row_cells in svg_pattern],
+            [
+                [
+                    cell[0]
+                    for cell in svg_pattern[row][
+                        : get_pattern_row_length(svg_pattern, row)
+                    ]
+                ]
+                for row in range(min(2, len(svg_pattern)))
+            ],
+            [
+                (row, column)
+                for row, row_cells in enumerate(svg_pattern)
+                for column, (_, _, cell_options) in enumerate(row_cells)
+                if cell_options["broken"] is True
+            ],
+            single_polygon[0],
+            broken_polygon[0],
+            get_pattern_container(svg_pattern, single_polygon, broken_polygon).bounds,
+            svg_maker.pattern_view_box(),
+            svg_maker.pattern_viewport_transform(),
+        )
+
+    @classmethod
+    def from_dict(cls, index: dict):
+        """
+        Returns the index of a dictionary as written by `to_dict`.
+        """
+        return cls(
+            index["rows"],
+            index["columns"],
+            index["broken"],
+            wkt.loads(index["outlines"]["single"]),
+            wkt.loads(index["outlines"]["broken"]),
+            index["container"],
+            index["view_box"],
+            index["viewport_transform"],
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "format": "seigaiha-index",
+            "version": PATTERN_INDEX_FORMAT_VERSION,
+            "view_box": self.view_box,
+            "viewport_transform": self.viewport_transform,
+            "container": self.container_bounds,
+            "rows": self.row_positions,
+            "columns": self.column_positions,
+            "broken": sorted(list(cell) for cell in self.broken_cells),
+            "outlines": {
+                "single": self.single_outline.wkt,
+                "broken": self.broken_outline.wkt,
+            },
+        }
+
+    def pattern_point(
+        self, x_pixel: float, y_pixel: float, scale: float = 1.0
+    ) -> tuple:
+        """
+        Returns the pattern coordinates of a pixel of the pattern output, rendered at a scale of the resolution.
+        """
+        scale_x, scale_y, offset_x, offset_y = self.viewport_transform
+
+        return (
+            self.view_box[0] + (x_pixel / scale - offset_x) / scale_x,
+            self.view_box[1] + (y_pixel / scale - offset_y) / scale_y,
+        )
+
+    def cell_at(self, x: float, y: float) -> tuple | None:
+        """
+        Returns the cell painted on top at a point, or None if no cell is painted there.
+        """
+        cells = self.cells_at(x, y)
+
+        return cells[-1] if cells else None
+
+    def cells_at(self, x: float, y: float) -> list:
+        """
+        Returns all cells painted at a point.
+        """
+        container_x_1, container_y_1, container_x_2, container_y_2 = (
+            self.container_bounds
+        )
+        if not (container_x_1 <= x <= container_x_2) or not (
+            container_y_1 <= y <= container_y_2
+        ):
+            return []
+
+        cells, positions_x, positions_y, is_broken = self._candidates(x, y, x, y)
+        if not cells:
+            return []
+
+        is_hit = np.zeros(len(cells), dtype=bool)
+        for outline, is_outline in self._outlines(is_broken):
+            is_hit[is_outline] = shapely.intersects_xy(
+                outline, x - positions_x[is_outline], y - positions_y[is_outline]
+            )
+
+        return [cell for cell, hit in zip(cells, is_hit.tolist()) if hit]
+
+    def cells_in(self, x_1: float, y_1: float, x_2: float, y_2: float) -> list:
+        """
+        Returns all cells painted within a rectangular region.
+        """
+        container_x_1, container_y_1, container_x_2, container_y_2 = (
+            self.container_bounds
+        )
+        x_1, x_2 = max(min(x_1, x_2), container_x_1), min(max(x_1, x_2), container_x_2)
+        y_1, y_2 = max(min(y_1, y_2), container_y_1), min(max(y_1, y_2), container_y_2)
+        if x_1 > x_2 or y_1 > y_2:
+            return []
+
+        cells, positions_x, positions_y, is_broken = self._candidates(
+            x_1, y_1, x_2, y_2
+        )
+        if not cells:
+            return []
+
+        # The region is moved to the cells instead of the cells to the region
+        is_hit = np.zeros(len(cells), dtype=bool)
+        for outline, is_outline in self._outlines(is_broken):
+            is_hit[is_outline] = shapely.intersects(
+                outline,
+                shapely.box(
+                    x_1 - positions_x[is_outline],
+                    y_1 - positions_y[is_outline],
+                    x_2 - positions_x[is_outline],
+                    y_2 - positions_y[is_outline],
+                ),
+            )
+
+        return [cell for cell, hit in zip(cells, is_hit.tolist()) if hit]
+
+    def nearest_cell(self, x: float, y: float) -> tuple | None:
+        """
+        Returns the cell nearest to a point, preferring the cell painted on top if several are equally near.
+        """
+        cell = self.cell_at(x, y)
+        if cell is not None:
+            return cell
+
+        container_x_1, container_y_1, container_x_2, container_y_2 = (
+            self.container_bounds
+        )
+        outline_x_1, outline_y_1, outline_x_2, outline_y_2 = self.outline_bounds
+        extent = max(
+            container_x_2 - container_x_1,
+            container_y_2 - container_y_1,
+            abs(x - container_x_1),
+            abs(x - container_x_2),
+            abs(y - container_y_1),
+            abs(y - container_y_2),
+        )
+
+        # Cells at most a radius away are all within the candidates of that radius, so widen until one is found
+        radius = max(outline_x_2 - outline_x_1, outline_y_2 - outline_y_1)
+        while True:
+            cells, positions_x, positions_y, is_broken = self._candidates(
+                x - radius, y - radius, x + radius, y + radius
+            )
+            if cells:
+                distances = np.full(len(cells), np.inf)
+                for outline, is_outline in self._outlines(is_broken):
+                    # The container and point are moved to the cells instead of the cells to the container
+                    distances[is_outline] = shapely.distance(
+                        shapely.intersection(
+                            outline,
+                            shapely.box(
+                                container_x_1 - positions_x[is_outline],
+                                container_y_1 - positions_y[is_outline],
+                                container_x_2 - positions_x[is_outline],
+                                container_y_2 - positions_y[is_outline],
+                            ),
+                        ),
+                        shapely.points(
+                            x - positions_x[is_outline], y - positions_y[is_outline]
+                        ),
+                    )
+
+                distances = np.nan_to_num(distances, nan=np.inf)
+                nearest_distance = distances.min()
+                if nearest_distance <= radius or (
+                    radius > extent and np.isfinite(nearest_distance)
+                ):
+                    return cells[len(distances) - 1 - int(np.argmin(distances[::-1]))]
+
+            if radius > extent:
+                return None
+
+            radius *= 2
+
+    def _candidates(self, x_1: float, y_1: float, x_2: float, y_2: float) -> tuple:
+        """
+        Returns the cells of which the outer ring bounds overlap a region, with their positions and if they are
+        broken.
+        """
+        outline_x_1, outline_y_1, outline_x_2, outline_y_2 = self.outline_bounds
+
+        cells: list = []
+        positions_x: list = []
+        positions_y: list = []
+        for row in range(
+            bisect_left(self.row_positions, y_1 - outline_y_2),
+            bisect_right(self.row_positions, y_2 - outline_y_1),
+        ):
+            column_positions = self.column_positions[row & 1]
+            column_start = bisect_left(column_positions, x_1 - outline_x_2)
+            column_stop = bisect_right(column_positions, x_2 - outline_x_1)
+
+            cells.extend((row, column) for column in range(column_start, column_stop))
+            positions_x.extend(column_positions[column_start:column_stop])
+            positions_y.extend([self.row_positions[row]] * (column_stop - column_start))
+
+        return (
+            cells,
+            np.asarray(positions_x, dtype=np.float64),
+            np.asarray(positions_y, dtype=np.float64),
+            np.asarray([cell in self.broken_cells for cell in cells], dtype=bool),
+        )
+
+    def _outlines(self, is_broken):
+        yield self.single_outline, ~is_broken
+        if is_broken.any():
+            yield self.broken_outline, is_broken
+
+
+def save_pattern_index(pattern_index: PatternIndex, output_path: Path) -> None:
+    """
+    Save the pattern index as JSON.
+    """
+    with atomic_output_path(output_path) as temporary_path:
+        with open(str(temporary_path), "w") as index_file:
+            json.dump(pattern_index.to_dict(), index_file)
+
+
+def load_pattern_index(path: Path) -> PatternIndex:
+    """
+    Load a pattern index saved next to the pattern output.
+    """
+    with open(str(path), "r") as index_file:
+        return PatternIndex.from_dict(json.load(index_file))
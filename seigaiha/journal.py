@@ -0,0 +1,206 @@
+import datetime
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+
+from loguru import logger
+
+
+def get_journal_path(
+    output_path: Path, input_path_given: str, shard=None, kind: str = "journal"
+) -> Path:
+    """
+    Returns the path of the checkpoint journal for a batch, next to its output.
+
+    Shards of a batch each have their own journal, as they write to the same output concurrently. Other files of
+    a batch are named the same way with another kind.
+    """
+
+    output_directory = output_path if output_path.is_dir() else output_path.parent
+    input_hash = hashlib.sha1(str(input_path_given).encode("utf-8")).hexdigest()[:12]
+    shard_suffix = "" if shard is None else f"-{shard.index}-of-{shard.count}"
+    extension = "jsonl" if kind == "journal" else "json"
+
+    return output_directory.joinpath(
+        f".seigaiha-{kind}-{input_hash}{shard_suffix}.{extension}"
+    )
+
+
+class CheckpointJournal:
+    """
+    Checkpoint journal.
+
+    Records completed and failed presets of a batch, one JSON line per preset, so an interrupted or failed batch
+    can be resumed. A preset is identified by its input path, a hash of its content and the requested extensions.
+    """
+
+    def __init__(self, path: Path, resume: bool = False, max_retries: int = 3):
+        self.path = path
+        self.resume = resume
+        self.max_retries = max_retries
+
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+
+        self._previous_completed: set = set()
+        self._previous_failures: dict = {}
+        if self.resume and self.path.exists():
+            self._load()
+
+        self._file = self.path.open("a" if self.resume else "w")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._pending_done = threading.Condition(self._lock)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def preset_key(input_path: Path, preset: dict, extensions: list) -> tuple:
+        """
+        Returns the key identifying a preset and its requested extensions.
+        """
+        preset_hash = hashlib.sha256(
+            json.dumps(preset, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+
+        return str(input_path), preset_hash, ",".join(extensions)
+
+    def should_render(self, input_path: Path, preset: dict, extensions: list) -> bool:
+        """
+        Returns if the preset still needs to be rendered, skipping completed presets and presets without retries left.
+        """
+        if not self.resume:
+            return True
+
+        key = self.preset_key(input_path, preset, extensions)
+        if key in self._previous_completed:
+            logger.info(f"Skipping completed preset `{str(input_path)}`.")
+            self.skipped += 1
+            return False
+
+        failures = self._previous_failures.get(key, 0)
+        if failures >= self.max_retries:
+            logger.warning(
+                f"Skipping preset `{str(input_path)}`, which failed {failures} times."
+            )
+            self.skipped += 1
+            return False
+
+        return True
+
+    def track(
+        self,
+        input_path: Path,
+        preset: dict,
+        extensions: list,
+        outputs: list,
+        report: dict | None = None,
+        started: float | None = None,
+    ) -> None:
+        """
+        Record the preset once all of its (output path, future) outputs are written.
+
+        A report of the preset is recorded with the seconds from its start until all of its outputs are written.
+        """
+        key = self.preset_key(input_path, preset, extensions)
+        output_paths = [str(output_path) for output_path, _ in outputs]
+        futures = [future for _, future in outputs if future is not None]
+
+        def _report():
+            if report is None or started is None:
+                return report
+
+            return {**report, "seconds": time.monotonic() - started}
+
+        if not futures:
+            self.record(key, output_paths, report=_report())
+            return
+
+        with self._lock:
+            self._pending += 1
+
+        remaining = [len(futures)]
+        remaining_lock = threading.Lock()
+
+        def _on_done(_):
+            with remaining_lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+
+            errors = [future.exception() for future in futures if future.exception()]
+            self.record(key, output_paths, errors[0] if errors else None, _report())
+
+            with self._lock:
+                self._pending -= 1
+                self._pending_done.notify_all()
+
+        for future in futures:
+            future.add_done_callback(_on_done)
+
+    def record(
+        self,
+        key: tuple,
+        output_paths: list,
+        error: BaseException | None = None,
+        report: dict | None = None,
+    ) -> None:
+        """
+        Append the result of a preset to the journal.
+        """
+        input_path, preset_hash, extensions = key
+        entry = {
+            "input": input_path,
+            "hash": preset_hash,
+            "extensions": extensions,
+            "status": "failed" if error else "completed",
+            "outputs": output_paths,
+            "time": datetime.datetime.now().isoformat(),
+        }
+        if error:
+            entry["error"] = str(error)
+        elif report is not None:
+            entry["report"] = report
+
+        with self._lock:
+            if error:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            while self._pending > 0:
+                self._pending_done.wait()
+
+        self._file.close()
+
+    def _load(self) -> None:
+        with self.path.open("r") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be incomplete after a crash
+                    continue
+
+                key = (entry["input"], entry["hash"], entry["extensions"])
+                if entry["status"] == "completed":
+                    self._previous_completed.add(key)
+                else:
+                    self._previous_failures[key] = (
+                        self._previous_failures.get(key, 0) + 1
+                    )
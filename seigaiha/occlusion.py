@@ -0,0 +1,355 @@
+import numpy as np
+from shapely.geometry import Polygon  # type: ignore[import-untyped]
+from shapely.ops import unary_union  # type: ignore[import-untyped]
+
+from seigaiha.pattern import get_pattern_container, get_pattern_row_length
+from seigaiha.polygon import get_polygon_coordinates, translate_polygon
+
+# Precision of the offsets of covering cells, cells with equal offsets share their occlusion
+OCCLUSION_OFFSET_DECIMALS = 6
+
+
+def is_opaque(colour) -> bool:
+    return colour[3] >= 1
+
+
+class PatternOcclusion:
+    """
+    Pattern occlusion.
+
+    Rings of pattern cells which are hidden by the cells painted after them. Every cell is painted over the cells
+    before it in the same row and over the rows before it, so large parts of the outer rings of a row are never
+    visible.
+
+    Cells are covered by the outer rings of later cells, if these are opaque. The cover only depends on the offsets
+    of the covering cells, so it is computed once for all cells with the same offsets. Rings within the cover are
+    left out, and rings partly within the cover are trimmed to their visible part if this takes fewer vertices.
+    The cover is shrunk by a margin of a pixel, so anti-aliased edges look the same.
+
+    Edge cells and broken cells are painted as they are. Rings of cells clipped to the pattern container are
+    left out, but not trimmed.
+    """
+
+    def __init__(
+        self,
+        svg_pattern: list,
+        single_polygon: list,
+        broken_polygon: list,
+        colours: list,
+        broken_colours: list,
+        pattern_colours=None,
+        margin: float = 0.0,
+    ):
+        self.single_polygon = single_polygon
+        self.margin = margin
+
+        rows = len(svg_pattern)
+        columns = len(svg_pattern[0])
+        self.positions_x = np.asarray(
+            [[cell[0] for cell in row_cells] for row_cells in svg_pattern]
+        )
+        self.positions_y = np.asarray(
+            [[cell[1] for cell in row_cells] for row_cells in svg_pattern]
+        )
+
+        is_drawn = np.zeros((rows, columns), dtype=bool)
+        for row in range(rows):
+            is_drawn[row, : get_pattern_row_length(svg_pattern, row)] = True
+        is_broken = np.asarray(
+            [
+                [cell[2]["broken"] is True for cell in row_cells]
+                for row_cells in svg_pattern
+            ]
+        )
+        is_edge = np.asarray(
+            [[cell[2]["edge"] for cell in row_cells] for row_cells in svg_pattern]
+        )
+
+        # Cells of which the outer ring is opaque and has the outer ring of the polygon
+        is_covering = is_drawn & ~is_broken
+        if pattern_colours is None:
+            is_covering &= is_opaque(colours[0])
+        else:
+            is_covering &= np.asarray(
+                [
+                    [
+                        is_opaque(pattern_colours.cell_colours(row, column)[0])
+                        for column in range(columns)
+                    ]
+                    for row in range(rows)
+                ]
+            )
+        if is_opaque(broken_colours[0]) and broken_polygon[0].equals(single_polygon[0]):
+            is_covering |= is_drawn & is_broken
+
+        self.is_occludable = is_drawn & ~is_broken & ~is_edge
+        self.is_covering = is_covering
+
+        x_coordinate_1, y_coordinate_1, x_coordinate_2, y_coordinate_2 = single_polygon[
+            0
+        ].bounds
+        self.cell_width = x_coordinate_2 - x_coordinate_1
+        self.cell_height = y_coordinate_2 - y_coordinate_1
+
+        # Cells within the container, of which the rings are not clipped
+        (
+            container_x_1,
+            container_y_1,
+            container_x_2,
+            container_y_2,
+        ) = get_pattern_container(svg_pattern, single_polygon, broken_polygon).bounds
+        self.is_unclipped = (
+            (self.positions_x + x_coordinate_1 >= container_x_1)
+            & (self.positions_x + x_coordinate_2 <= container_x_2)
+            & (self.positions_y + y_coordinate_1 >= container_y_1)
+            & (self.positions_y + y_coordinate_2 <= container_y_2)
+        )
+
+        self._occlusions: dict = {}
+        self._cell_occlusions = self._assign_occlusions()
+        self._colour_lists: dict = {}
+
+    def _assign_occlusions(self) -> dict:
+        """
+        Returns the occlusion key of all occludable cells by (row, column), being the offsets of their cover.
+
+        Rows of the same parity share their cell positions, so the cells a given number of rows later which are within
+        a cell width of a cell are a few neighbouring columns, at the same column shift for all rows of that parity.
+        These columns are found once per row parity and row offset, and only they are compared.
+        """
+        rows, columns = self.positions_x.shape
+        row_indices = np.arange(rows)
+        column_indices = np.arange(columns)
+
+        cover_cells = []
+        for row_offset in range(rows):
+            offsets_y = (
+                self.positions_y[row_offset:, 0]
+                - self.positions_y[: rows - row_offset, 0]
+            )
+            covered_rows = row_indices[: rows - row_offset][
+                offsets_y < self.cell_height
+            ]
+            if not len(covered_rows):
+                break
+
+            for parity in (0, 1):
+                parity_rows = covered_rows[covered_rows % 2 == parity]
+                if not len(parity_rows):
+                    continue
+
+                # Neighbouring columns within a cell width, widened by a column on either side for rounding
+                first_row = parity_rows[0]
+                cover_positions_x = self.positions_x[first_row + row_offset]
+                first_columns = (
+                    np.searchsorted(
+                        cover_positions_x,
+                        self.positions_x[first_row] - self.cell_width,
+                    )
+                    - 1
+                )
+                last_columns = np.searchsorted(
+                    cover_positions_x,
+                    self.positions_x[first_row] + self.cell_width,
+                    side="right",
+                )
+
+                positions_x = self.positions_x[parity_rows]
+                cover_positions_x = self.positions_x[parity_rows + row_offset]
+                is_occludable = self.is_occludable[parity_rows]
+                is_covering = self.is_covering[parity_rows + row_offset]
+                for window_column in range(
+                    int((last_columns - first_columns).max()) + 1
+                ):
+                    cover_columns = first_columns + window_column
+                    is_window = (
+                        (cover_columns >= 0)
+                        & (cover_columns <= last_columns)
+                        & (cover_columns < columns)
+                    )
+                    if row_offset == 0:
+                        is_window &= cover_columns > column_indices
+                    cover_columns = np.clip(cover_columns, 0, columns - 1)
+
+                    offset_x = cover_positions_x[:, cover_columns] - positions_x
+                    is_cover = (
+                        is_window
+                        & is_occludable
+                        & is_covering[:, cover_columns]
+                        & (np.abs(offset_x) < self.cell_width)
+                    )
+
+                    cover_rows, cover_row_columns = np.nonzero(is_cover)
+                    cover_cells.append(
+                        (
+                            parity_rows[cover_rows],
+                            cover_row_columns,
+                            offset_x[is_cover],
+                            offsets_y[parity_rows[cover_rows]],
+                        )
+                    )
+
+        if not cover_cells:
+            return {}
+
+        cell_rows, cell_columns, offsets_x, offsets_y = (
+            np.concatenate(cover_arrays) for cover_arrays in zip(*cover_cells)
+        )
+        order = np.lexsort((cell_columns, cell_rows))
+        cell_keys = cell_rows[order] * columns + cell_columns[order]
+        cover_offsets = list(
+            zip(
+                [
+                    round(offset_x, OCCLUSION_OFFSET_DECIMALS)
+                    for offset_x in offsets_x[order].tolist()
+                ],
+                [
+                    round(offset_y, OCCLUSION_OFFSET_DECIMALS)
+                    for offset_y in offsets_y[order].tolist()
+                ],
+            )
+        )
+
+        # Every cell is a run of equal keys, holding the offsets of its cover
+        cell_starts = np.flatnonzero(np.diff(cell_keys, prepend=-1))
+        cell_occlusions = {}
+        for cell_key, offsets_start, offsets_stop in zip(
+            cell_keys[cell_starts].tolist(),
+            cell_starts.tolist(),
+            [*cell_starts[1:].tolist(), len(cell_keys)],
+        ):
+            cell_occlusions[divmod(cell_key, columns)] = tuple(
+                sorted(cover_offsets[offsets_start:offsets_stop])
+            )
+
+        return cell_occlusions
+
+    def occlusion(self, cover_offsets: tuple) -> dict:
+        """
+        Returns the rings hidden by a cover, as {ring index: None if left out, or the trimmed ring coordinates}.
+        """
+        occlusion = self._occlusions.get(cover_offsets)
+        if occlusion is not None:
+            return occlusion
+
+        cover = unary_union(
+            [
+                translate_polygon(self.single_polygon[0], offset_x, offset_y)
+                for offset_x, offset_y in cover_offsets
+            ]
+        )
+        if self.margin:
+            cover = cover.buffer(-self.margin)
+
+        occlusion = {}
+        for ring_index, polygon in enumerate(self.single_polygon):
+            if cover.contains(polygon):
+                occlusion[ring_index] = None
+                continue
+
+            if not isinstance(polygon, Polygon) or not polygon.intersects(cover):
+                continue
+
+            trimmed_polygon = polygon.difference(cover)
+            if (
+                isinstance(trimmed_polygon, Polygon)
+                and not trimmed_polygon.interiors
+                and len(trimmed_polygon.exterior.coords) < len(polygon.exterior.coords)
+            ):
+                occlusion[ring_index] = get_polygon_coordinates(trimmed_polygon)
+
+        self._occlusions[cover_offsets] = occlusion
+
+        return occlusion
+
+    def apply(self, rows):
+        """
+        Yields the rows of pattern cells without their hidden rings.
+        """
+        for row, row_cells in enumerate(rows):
+            for column, cell in enumerate(row_cells):
+                cover_offsets = self._cell_occlusions.get((row, column))
+                if cover_offsets is None:
+                    continue
+
+                occlusion = self.occlusion(cover_offsets)
+                if not occlusion:
+                    continue
+
+                x_point = float(self.positions_x[row, column])
+                y_point = float(self.positions_y[row, column])
+                is_unclipped = bool(self.is_unclipped[row, column])
+                cell["polygon"] = [
+                    (
+                        [
+                            (vertex_x + x_point, vertex_y + y_point)
+                            for vertex_x, vertex_y in occlusion[ring_index]
+                        ]
+                        if is_unclipped and occlusion.get(ring_index) is not None
+                        else ring
+                    )
+                    for ring_index, ring in enumerate(cell["polygon"])
+                    if occlusion.get(ring_index, True) is not None
+                ]
+                cell["colour"] = self._colour_list(cell["colour"], cover_offsets)
+
+                # Trimmed rings are no longer translated base rings
+                cell.pop("base_rings", None)
+
+            yield row_cells
+
+    def _colour_list(self, colours: list, cover_offsets: tuple) -> list:
+        # Cells with the same colours and cover share their colour list, like the cells of a pattern
+        # The colours are kept with their list, so their id is not reused
+        colour_key = (id(colours), cover_offsets)
+        if colour_key not in self._colour_lists:
+            occlusion = self._occlusions[cover_offsets]
+            self._colour_lists[colour_key] = (
+                colours,
+                [
+                    colour
+                    for ring_index, colour in enumerate(colours)
+                    if occlusion.get(ring_index, True) is not None
+                ],
+            )
+
+        return self._colour_lists[colour_key][1]
+
+
+def get_occlusion_margin(svg_maker) -> float:
+    """
+    Returns the width of a pixel of the largest PNG output of the pattern, in pattern coordinates.
+    """
+
+    scale_x, scale_y, _, _ = svg_maker.pattern_viewport_transform()
+    resolution = svg_maker.preset.output.resolution
+    size_factor = max([resolution, *svg_maker.png_sizes]) / resolution
+
+    return 1 / (min(scale_x, scale_y) * size_factor)
+
+
+def create_pattern_occlusion(
+    svg_maker,
+    svg_pattern: list,
+    single_polygon: list,
+    broken_polygon: list,
+    colours: list,
+    broken_colours: list,
+    pattern_colours=None,
+) -> PatternOcclusion | None:
+    """
+    Returns the occlusion of the pattern cells, or None if hidden rings are not left out.
+    """
+
+    if not svg_maker.preset.output.cull_hidden:
+        return None
+
+    return PatternOcclusion(
+        svg_pattern,
+        single_polygon,
+        broken_polygon,
+        colours,
+        broken_colours,
+        pattern_colours,
+        get_occlusion_margin(svg_maker),
+    )
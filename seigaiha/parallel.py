@@ -0,0 +1,419 @@
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from shapely.geometry import Polygon  # type: ignore[import-untyped]
+
+from seigaiha.colour import PatternColours
+from seigaiha.pattern import (
+    PatternClipper,
+    get_pattern_container,
+    get_pattern_row_length,
+    iter_pattern_rows,
+)
+from seigaiha.polygon import get_polygon_coordinates
+
+# Alignment of the arrays in the shared memory block
+SHARED_ARRAY_ALIGNMENT = 16
+
+# Row bands per worker, so workers finishing early pick up the remaining bands
+BANDS_PER_WORKER = 8
+
+# Colour lists kept by a pattern colour table, before they are looked up again
+COLOUR_TABLE_CACHE_SIZE = 4096
+
+_worker_geometry: dict = {}
+
+
+class SharedPatternGeometry:
+    """
+    Shared pattern geometry.
+
+    The base geometry of a pattern in a single block of shared memory: cell positions and broken flags, the rings
+    of the single and broken polygon, the container, the broken image definitions and optionally the colour field.
+    The layout maps every array to its (offset, dtype, shape) in the block, so the geometry is described by the block
+    name and layout only.
+    """
+
+    def __init__(self, arrays: dict):
+        self.layout: dict = {}
+        size = 0
+        for name, array in arrays.items():
+            size = -(-size // SHARED_ARRAY_ALIGNMENT) * SHARED_ARRAY_ALIGNMENT
+            self.layout[name] = (size, array.dtype.str, array.shape)
+            size += array.nbytes
+
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, array in arrays.items():
+            _view_array(self.shared_memory, self.layout[name])[...] = array
+
+    @property
+    def name(self) -> str:
+        return self.shared_memory.name
+
+    def close(self) -> None:
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+
+
+class PatternWorkerPool:
+    """
+    Pattern worker pool.
+
+    Creates the cells of grid patterns in a pool of processes, one band of rows per task. The base geometry of a
+    pattern is put in shared memory once, so a task only carries the block name, its layout and the band of rows,
+    instead of the polygons, images and SVG maker of the preset. Cell colours stay in this process and are
+    assigned to the returned rings, which come with their base rings for relative paths.
+
+    With fewer than two workers cells are created in this process.
+    """
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers
+
+        self._executor: ProcessPoolExecutor | None = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def iter_pattern_rows(
+        self,
+        svg_pattern: list,
+        single_polygon: list,
+        broken_polygon: list,
+        colours: list,
+        broken_colours: list,
+        broken_images: dict,
+    ):
+        """
+        Yields the pattern cells one row at a time, in row order.
+        """
+        if self.workers < 2:
+            yield from iter_pattern_rows(
+                svg_pattern,
+                single_polygon,
+                broken_polygon,
+                colours,
+                broken_colours,
+                broken_images,
+            )
+            return
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        row_count = len(svg_pattern)
+        band_rows = max(1, math.ceil(row_count / (self.workers * BANDS_PER_WORKER)))
+
+        shared_geometry = SharedPatternGeometry(
+            get_pattern_geometry_arrays(
+                svg_pattern, single_polygon, broken_polygon, broken_images
+            )
+        )
+        try:
+            # Bound the amount of pending bands, so finished rows are not held in memory until they are consumed
+            pending: deque = deque()
+            for row_start in range(0, row_count, band_rows):
+                if len(pending) >= self.workers * 2:
+                    yield from _assign_colours(
+                        pending.popleft().result(), colours, broken_colours
+                    )
+
+                pending.append(
+                    self._executor.submit(
+                        _create_worker_rows,
+                        shared_geometry.name,
+                        shared_geometry.layout,
+                        row_start,
+                        min(row_start + band_rows, row_count),
+                    )
+                )
+
+            while pending:
+                yield from _assign_colours(
+                    pending.popleft().result(), colours, broken_colours
+                )
+        finally:
+            for future in pending:
+                future.cancel()
+            shared_geometry.close()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+def get_pattern_workers(workers: int) -> int:
+    """
+    Returns the amount of pattern workers, where 0 uses all processors.
+    """
+
+    if workers == 0:
+        return os.cpu_count() or 1
+
+    return workers
+
+
+def get_pattern_geometry_arrays(
+    svg_pattern: list,
+    single_polygon: list,
+    broken_polygon: list,
+    broken_images: dict,
+    pattern_colours: PatternColours | None = None,
+) -> dict:
+    """
+    Returns the base geometry of a pattern as arrays, by name.
+    """
+
+    row_stride = len(svg_pattern[0])
+    container = get_pattern_container(svg_pattern, single_polygon, broken_polygon)
+
+    image_cells = sorted(
+        row * row_stride + column for row, column in broken_images.keys()
+    )
+    image_data = [
+        broken_images[divmod(cell, row_stride)].encode("utf-8") for cell in image_cells
+    ]
+
+    arrays = {
+        "cell_x": np.asarray(
+            [[cell[0] for cell in row_cells] for row_cells in svg_pattern],
+            dtype=np.float64,
+        ),
+        "cell_y": np.asarray(
+            [[cell[1] for cell in row_cells] for row_cells in svg_pattern],
+            dtype=np.float64,
+        ),
+        "cell_broken": np.asarray(
+            [
+                [cell[2]["broken"] is True for cell in row_cells]
+                for row_cells in svg_pattern
+            ],
+            dtype=bool,
+        ),
+        **_ring_arrays("single", single_polygon),
+        **_ring_arrays("broken", broken_polygon),
+        "container": np.asarray(get_polygon_coordinates(container), dtype=np.float64),
+        "image_cells": np.asarray(image_cells, dtype=np.int64),
+        "image_offsets": np.cumsum([0, *map(len, image_data)], dtype=np.int64),
+        "image_data": np.frombuffer(b"".join(image_data), dtype=np.uint8),
+    }
+    if pattern_colours is not None:
+        arrays["colour_index"] = np.asarray(pattern_colours.cell_index, dtype=np.int64)
+        arrays["colour_table"] = np.asarray(
+            pattern_colours.colour_lists, dtype=np.float64
+        )
+
+    return arrays
+
+
+def create_pattern_geometry(arrays: dict) -> dict:
+    """
+    Returns the base geometry of a pattern from its arrays, with its polygons rebuilt.
+
+    Broken images and cell colours are looked up in the arrays when needed, so the geometry does not hold anything
+    per cell besides the arrays.
+    """
+
+    def polygons(prefix: str) -> list:
+        vertices = arrays[f"{prefix}_vertices"].tolist()
+        ring_offsets = arrays[f"{prefix}_ring_offsets"].tolist()
+
+        return [
+            Polygon(vertices[ring_start:ring_stop])
+            for ring_start, ring_stop in zip(ring_offsets, ring_offsets[1:])
+        ]
+
+    return {
+        "cell_x": arrays["cell_x"],
+        "cell_y": arrays["cell_y"],
+        "cell_broken": arrays["cell_broken"],
+        "single_polygon": polygons("single"),
+        "broken_polygon": polygons("broken"),
+        "pattern_clipper": PatternClipper(Polygon(arrays["container"].tolist())),
+        "broken_images": PatternImages(
+            arrays["image_cells"], arrays["image_offsets"], arrays["image_data"]
+        ),
+        "pattern_colours": (
+            PatternColourTable(arrays["colour_index"], arrays["colour_table"])
+            if "colour_index" in arrays
+            else None
+        ),
+    }
+
+
+def attach_pattern_geometry(shared_name: str, layout: dict) -> dict:
+    """
+    Returns the base geometry of a pattern in shared memory, attached once per pattern and process.
+    """
+    global _worker_geometry
+    if _worker_geometry.get("name") == shared_name:
+        return _worker_geometry
+
+    if _worker_geometry:
+        # Views of the previous block have to be released before it can be closed
+        previous_block = _worker_geometry["shared_memory"]
+        _worker_geometry = {}
+        previous_block.close()
+
+    shared_block = shared_memory.SharedMemory(name=shared_name)
+
+    # Shapely objects are rebuilt once per pattern and worker, the cell arrays are read in place
+    _worker_geometry = {
+        "name": shared_name,
+        "shared_memory": shared_block,
+        **create_pattern_geometry(
+            {
+                name: _view_array(shared_block, descriptor)
+                for name, descriptor in layout.items()
+            }
+        ),
+    }
+
+    return _worker_geometry
+
+
+class PatternImages:
+    """
+    Pattern images.
+
+    Broken images of pattern cells by cell index, decoded from the image arrays when they are looked up.
+    """
+
+    def __init__(
+        self, image_cells: np.ndarray, image_offsets: np.ndarray, image_data: np.ndarray
+    ):
+        self.image_cells = image_cells
+        self.image_offsets = image_offsets
+        self.image_data = image_data
+
+    def get(self, cell: int) -> str | None:
+        image_index = int(np.searchsorted(self.image_cells, cell))
+        if (
+            image_index == len(self.image_cells)
+            or self.image_cells[image_index] != cell
+        ):
+            return None
+
+        image_start, image_stop = self.image_offsets[image_index : image_index + 2]
+
+        return self.image_data[image_start:image_stop].tobytes().decode("utf-8")
+
+
+class PatternColourTable:
+    """
+    Pattern colour table.
+
+    Colours of pattern cells from the arrays of a pattern colour field, with the colour lists of the cells that are
+    looked up. Cells with the same colours share a single colour list, like those of the pattern colours.
+    """
+
+    def __init__(self, colour_index: np.ndarray, colour_table: np.ndarray):
+        self.colour_index = colour_index
+        self.colour_table = colour_table
+
+        self._colour_lists: dict = {}
+
+    def cell_colours(self, row: int, column: int) -> list:
+        """
+        Returns the colours of a cell.
+        """
+        colour_index = int(self.colour_index[row, column])
+        colour_list = self._colour_lists.get(colour_index)
+        if colour_list is None:
+            # The colour lists of the looked up cells are kept, up to a bound
+            if len(self._colour_lists) >= COLOUR_TABLE_CACHE_SIZE:
+                self._colour_lists.clear()
+
+            colour_list = [
+                (
+                    int(red),
+                    int(green),
+                    int(blue),
+                    int(alpha) if alpha.is_integer() else alpha,
+                )
+                for red, green, blue, alpha in self.colour_table[colour_index].tolist()
+            ]
+            self._colour_lists[colour_index] = colour_list
+
+        return colour_list
+
+
+def _ring_arrays(prefix: str, polygons: list) -> dict:
+    rings = get_polygon_coordinates(polygons)
+
+    return {
+        f"{prefix}_vertices": np.asarray(
+            [vertex for ring in rings for vertex in ring], dtype=np.float64
+        ).reshape(-1, 2),
+        f"{prefix}_ring_offsets": np.cumsum([0, *map(len, rings)], dtype=np.int64),
+    }
+
+
+def _view_array(shared_block: shared_memory.SharedMemory, descriptor: tuple):
+    offset, dtype, shape = descriptor
+
+    return np.ndarray(shape, dtype=dtype, buffer=shared_block.buf, offset=offset)
+
+
+def _assign_colours(rows: list, colours: list, broken_colours: list):
+    for row_cells in rows:
+        yield [
+            {
+                "polygon": cell_coordinates,
+                "broken": is_broken,
+                "colour": colours if not is_broken else broken_colours,
+                "base_rings": base_rings,
+            }
+            for cell_coordinates, is_broken, base_rings in row_cells
+        ]
+
+
+def _create_worker_rows(
+    shared_name: str, layout: dict, row_start: int, row_stop: int
+) -> list:
+    geometry = attach_pattern_geometry(shared_name, layout)
+    row_stride = geometry["cell_x"].shape[1]
+
+    rows = []
+    for row in range(row_start, row_stop):
+        x_points = geometry["cell_x"][row].tolist()
+        y_points = geometry["cell_y"][row].tolist()
+        broken_cells = geometry["cell_broken"][row].tolist()
+
+        row_cells = []
+        for column in range(get_pattern_row_length(geometry["cell_x"], row)):
+            is_broken = broken_cells[column]
+            base_rings = geometry["pattern_clipper"].clip_rings(
+                (
+                    geometry["broken_polygon"]
+                    if is_broken
+                    else geometry["single_polygon"]
+                ),
+                x_points[column],
+                y_points[column],
+            )
+            cell_coordinates: list = [
+                [
+                    (vertex_x + x_points[column], vertex_y + y_points[column])
+                    for vertex_x, vertex_y in ring
+                ]
+                for ring in base_rings
+            ]
+
+            broken_image = geometry["broken_images"].get(row * row_stride + column)
+            if broken_image is not None:
+                cell_coordinates.append(broken_image)
+
+            # Base rings shared by cells of a band are pickled once, and stay shared once unpickled
+            row_cells.append((cell_coordinates, is_broken, base_rings))
+        rows.append(row_cells)
+
+    return rows
@@ -0,0 +1,124 @@
+from bisect import bisect_right
+from math import floor
+
+# Bucket size of the overlap grid, in polygon widths
+PATH_BUCKET_SIZE = 1 / 4
+
+# Rings merged before streamed documents start over, which bounds the memory of merged paths
+PATH_BATCH_RINGS = 1 << 18
+
+
+class PathBatcher:
+    """
+    Path batcher.
+
+    Merges the rings of pattern cells into one compound path per colour, as far as the painter's order allows.
+    Rings are added in painting order, and every ring joins the earliest path of its colour painted after all
+    earlier rings it overlaps. Rings therefore never move below a ring they were painted over, and never overlap
+    other rings of the same path, so the result does not depend on the fill rule or on the opacity.
+
+    Overlap is tested on the bounding boxes of the rings, on a grid of buckets storing the latest path painted in
+    each bucket. Images of broken cells are never merged, and no ring moves below an image.
+    """
+
+    def __init__(self, svg_maker, bucket_size: float | None = None):
+        self.svg_maker = svg_maker
+        self.bucket_size = bucket_size or svg_maker.width * PATH_BUCKET_SIZE
+
+        self.reset()
+
+    def reset(self) -> None:
+        # Paths in painting order, either [path fill, subpaths] or an image string
+        self._paths: list = []
+        self._paths_by_fill: dict = {}
+        self._bucket_paths: dict = {}
+        self._lowest_path = -1
+        self.rings = 0
+
+    def add_cells(self, cells: list) -> None:
+        """
+        Add the rings and images of pattern cells, in painting order.
+        """
+        for cell in cells:
+            colours = cell["colour"]
+            base_rings = cell.get("base_rings")
+            for ring_index, ring in enumerate(cell["polygon"]):
+                if isinstance(ring, str):
+                    self.add_image(ring)
+                    continue
+
+                self.add_ring(
+                    ring,
+                    colours[ring_index],
+                    base_rings[ring_index] if base_rings is not None else None,
+                )
+
+    def add_ring(self, ring: list, colour, base_ring: list | None = None) -> None:
+        """
+        Add a ring of (x, y) vertices with its colour, optionally translated from a base ring.
+        """
+        if not ring:
+            return
+
+        path_fill = self.svg_maker._path_fill(colour)
+
+        xs, ys = zip(*ring)
+        bucket_size = self.bucket_size
+        buckets = [
+            (bucket_x, bucket_y)
+            for bucket_x in range(
+                floor(min(xs) / bucket_size), floor(max(xs) / bucket_size) + 1
+            )
+            for bucket_y in range(
+                floor(min(ys) / bucket_size), floor(max(ys) / bucket_size) + 1
+            )
+        ]
+
+        # The latest path painted where this ring is painted
+        bucket_paths = self._bucket_paths
+        covering_path = self._lowest_path
+        for bucket in buckets:
+            bucket_path = bucket_paths.get(bucket, -1)
+            if bucket_path > covering_path:
+                covering_path = bucket_path
+
+        fill_paths = self._paths_by_fill.setdefault(path_fill, [])
+        fill_path_index = bisect_right(fill_paths, covering_path)
+        if fill_path_index < len(fill_paths):
+            path = fill_paths[fill_path_index]
+        else:
+            path = len(self._paths)
+            self._paths.append([path_fill, []])
+            fill_paths.append(path)
+
+        self._paths[path][1].append(self.svg_maker._ring_path(ring, base_ring))
+        self.rings += 1
+
+        for bucket in buckets:
+            if bucket_paths.get(bucket, -1) < path:
+                bucket_paths[bucket] = path
+
+    def add_image(self, image: str) -> None:
+        """
+        Add an image, which is painted over all earlier rings.
+        """
+        self._lowest_path = len(self._paths)
+        self._paths.append(image)
+
+    def flush(self) -> list:
+        """
+        Returns the SVG elements of all added rings and images in painting order, and starts over.
+
+        Paths added afterwards are painted over all flushed paths.
+        """
+        elements = [
+            (
+                path
+                if isinstance(path, str)
+                else '<path d="' + "Z".join(path[1]) + path[0]
+            )
+            for path in self._paths
+        ]
+        self.reset()
+
+        return elements
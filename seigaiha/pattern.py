@@ -0,0 +1,489 @@
+import math
+import random
+
+from shapely.geometry import Polygon, box  # type: ignore[import-untyped]
+
+from seigaiha.polygon import get_polygon_coordinates, translate_polygon
+from seigaiha.rng import get_cell_indices
+
+
+def get_pattern_row_length(svg_pattern: list, row: int) -> int:
+    """
+    Returns the amount of visible cells in a pattern row.
+
+    If odd row in pattern, last element is unnecessary and is not correctly intersected.
+    """
+
+    if row & 1:
+        return len(svg_pattern[row]) - 1
+
+    return len(svg_pattern[row])
+
+
+def get_pattern_container(
+    svg_pattern: list, single_polygon: list, broken_polygon: list
+) -> Polygon:
+    """
+    Returns the container polygon to which all pattern cells are clipped.
+    """
+
+    first_x, first_y, first_options = svg_pattern[0][0]
+    last_x, last_y, last_options = svg_pattern[-1][-1]
+
+    first_polygon = broken_polygon if first_options["broken"] else single_polygon
+    last_polygon = broken_polygon if last_options["broken"] else single_polygon
+
+    first_bounds = first_polygon[0].bounds
+    last_bounds = last_polygon[-1].bounds
+
+    first_polygon_bounds = (
+        first_bounds[0] + first_x,
+        first_bounds[1] + first_y,
+        first_bounds[2] + first_x,
+        first_bounds[3] + first_y,
+    )
+    last_polygon_bounds = (
+        last_bounds[0] + last_x,
+        last_bounds[1] + last_y,
+        last_bounds[2] + last_x,
+        last_bounds[3] + last_y,
+    )
+
+    polygon_width = first_polygon_bounds[2] - first_polygon_bounds[0]
+    polygon_height = first_polygon_bounds[3] - first_polygon_bounds[1]
+
+    return Polygon(
+        [
+            (
+                first_polygon_bounds[0] + (polygon_width / 2),
+                first_polygon_bounds[1] + (polygon_height / 2),
+            ),
+            (
+                first_polygon_bounds[0] + (polygon_width / 2),
+                last_polygon_bounds[3],
+            ),
+            (
+                last_polygon_bounds[2],
+                last_polygon_bounds[3],
+            ),
+            (
+                last_polygon_bounds[2],
+                first_polygon_bounds[1] + (polygon_height / 2),
+            ),
+        ]
+    )
+
+
+def place_broken_image(svg_maker, broken_image: str, row: int, column: int) -> str:
+    """
+    Returns the broken image definition positioned at the given pattern cell.
+    """
+
+    pos_x_offset = svg_maker.width / 2
+    if row & 1:
+        pos_x_offset = svg_maker.width
+
+    return broken_image.replace(
+        "%posX%",
+        str(
+            (svg_maker.width * svg_maker.repeat_horizontal_spacing * column)
+            + pos_x_offset
+        ),
+    ).replace(
+        "%posY%",
+        str(
+            (svg_maker.height * svg_maker.repeat_vertical_spacing * row)
+            + (svg_maker.height / 2)
+        ),
+    )
+
+
+def get_broken_images(svg_maker, svg_pattern: list) -> dict:
+    """
+    Returns the positioned broken images by (row, column) for all broken cells.
+
+    With the legacy random number generator, images are drawn in row-major order, so the result only depends on
+    the seed. Otherwise every image is chosen from the random stream of its cell.
+    """
+
+    broken_images: dict = {}
+    if not svg_maker.repeat_broken_images:
+        return broken_images
+
+    if svg_maker.preset_random is not None:
+        broken_cells = [
+            (row, column)
+            for row, row_cells in enumerate(svg_pattern)
+            for column, (_, _, cell_options) in enumerate(row_cells)
+            if cell_options["broken"] is True
+        ]
+        broken_image_choices = svg_maker.preset_random.choice(
+            "broken_images",
+            get_cell_indices(broken_cells, len(svg_pattern[0])),
+            len(svg_maker.repeat_broken_images),
+        )
+        for (row, column), broken_image_choice in zip(
+            broken_cells, broken_image_choices.tolist()
+        ):
+            broken_images[(row, column)] = place_broken_image(
+                svg_maker,
+                svg_maker.repeat_broken_images[broken_image_choice],
+                row,
+                column,
+            )
+
+        return broken_images
+
+    for row, row_cells in enumerate(svg_pattern):
+        for column, (_, _, cell_options) in enumerate(row_cells):
+            if cell_options["broken"] is not True:
+                continue
+
+            broken_images[(row, column)] = place_broken_image(
+                svg_maker,
+                random.choice(svg_maker.repeat_broken_images),
+                row,
+                column,
+            )
+
+    return broken_images
+
+
+class PatternClipper:
+    """
+    Pattern clipper.
+
+    Clips the rings of pattern cells to the container. Rings crossing the same container edges at the same distance
+    are equal up to translation, so every ring is clipped once per distance to the edges it crosses, and translated
+    to all other cells. Rings within the container are not clipped again at all, which covers all inner cells.
+    """
+
+    def __init__(self, container: Polygon):
+        self.container = container
+        self.container_bounds = container.bounds
+
+        self._polygon_bounds: dict = {}
+        self._clipped_rings: dict = {}
+
+    def __getstate__(self):
+        # Clipped rings are keyed by the id of their polygons, which does not hold in other processes
+        return {"container": self.container}
+
+    def __setstate__(self, state):
+        self.__init__(state["container"])
+
+    def clip(self, polygons: list, x_point: float, y_point: float) -> list:
+        """
+        Returns the ring coordinates of polygons translated to a cell position and clipped to the container.
+        """
+        return [
+            [(vertex_x + x_point, vertex_y + y_point) for vertex_x, vertex_y in ring]
+            for ring in self.clip_rings(polygons, x_point, y_point)
+        ]
+
+    def clip_rings(self, polygons: list, x_point: float, y_point: float) -> list:
+        """
+        Returns the ring coordinates of polygons clipped to the container at a cell position, relative to the cell
+        position.
+
+        Rings are shared by all cells clipped the same way, so they must not be changed.
+        """
+        polygons_key = id(polygons)
+        polygon_bounds = self._polygon_bounds.get(polygons_key)
+        if polygon_bounds is None:
+            # The polygons are kept with their bounds, so their id is not reused
+            polygon_bounds = (polygons, [polygon.bounds for polygon in polygons])
+            self._polygon_bounds[polygons_key] = polygon_bounds
+
+        container_x_1, container_y_1, container_x_2, container_y_2 = (
+            self.container_bounds
+        )
+
+        cell_coordinates = []
+        for ring_index, (x_1, y_1, x_2, y_2) in enumerate(polygon_bounds[1]):
+            # Distances to the crossed container edges, which determine the clipped ring
+            ring_key = (
+                polygons_key,
+                ring_index,
+                container_x_1 - x_point if x_1 + x_point <= container_x_1 else None,
+                container_y_1 - y_point if y_1 + y_point <= container_y_1 else None,
+                container_x_2 - x_point if x_2 + x_point >= container_x_2 else None,
+                container_y_2 - y_point if y_2 + y_point >= container_y_2 else None,
+            )
+            clipped_ring = self._clipped_rings.get(ring_key)
+            if clipped_ring is None:
+                clipped_ring = self._clip_ring(polygons[ring_index], x_point, y_point)
+                self._clipped_rings[ring_key] = clipped_ring
+
+            cell_coordinates.append(clipped_ring)
+
+        return cell_coordinates
+
+    def _clip_ring(self, polygon: Polygon, x_point: float, y_point: float) -> list:
+        """
+        Returns the coordinates of a ring clipped to the container, relative to the cell position.
+
+        Rings outside the container are not clipped.
+        """
+        intersect = polygon.intersection(
+            translate_polygon(self.container, -x_point, -y_point)
+        )
+
+        return get_polygon_coordinates([polygon if intersect.is_empty else intersect])[
+            0
+        ]
+
+
+def create_pattern_cell(
+    svg_pattern: list,
+    row: int,
+    column: int,
+    pattern_clipper: PatternClipper,
+    single_polygon: list,
+    broken_polygon: list,
+    colours: list,
+    broken_colours: list,
+    broken_image: str | None = None,
+) -> dict:
+    """
+    Create a single pattern cell, translated to its position and clipped to the container.
+
+    The cell keeps the rings relative to its position as base rings, which are shared by all cells clipped the same
+    way.
+    """
+
+    x_point, y_point, cell_options = svg_pattern[row][column]
+    is_broken = cell_options["broken"]
+
+    polygons = single_polygon
+    if is_broken is True:
+        polygons = broken_polygon
+
+    base_rings = pattern_clipper.clip_rings(polygons, x_point, y_point)
+    cell_coordinates: list = [
+        [(vertex_x + x_point, vertex_y + y_point) for vertex_x, vertex_y in ring]
+        for ring in base_rings
+    ]
+    if broken_image is not None:
+        cell_coordinates.append(broken_image)
+
+    return {
+        "polygon": cell_coordinates,
+        "broken": is_broken,
+        "colour": colours if not is_broken else broken_colours,
+        "base_rings": base_rings,
+    }
+
+
+def iter_pattern_rows(
+    svg_pattern: list,
+    single_polygon: list,
+    broken_polygon: list,
+    colours: list,
+    broken_colours: list,
+    broken_images: dict,
+):
+    """
+    Yields the pattern cells one row at a time.
+    """
+
+    pattern_clipper = PatternClipper(
+        get_pattern_container(svg_pattern, single_polygon, broken_polygon)
+    )
+
+    for row in range(len(svg_pattern)):
+        yield [
+            create_pattern_cell(
+                svg_pattern,
+                row,
+                column,
+                pattern_clipper,
+                single_polygon,
+                broken_polygon,
+                colours,
+                broken_colours,
+                broken_images.get((row, column)),
+            )
+            for column in range(get_pattern_row_length(svg_pattern, row))
+        ]
+
+
+def create_pattern(
+    svg_pattern: list,
+    single_polygon: list,
+    broken_polygon: list,
+    colours: list,
+    broken_colours: list,
+    broken_images: dict,
+) -> list:
+    """
+    Create all pattern cells, grouped by row.
+    """
+
+    return list(
+        iter_pattern_rows(
+            svg_pattern,
+            single_polygon,
+            broken_polygon,
+            colours,
+            broken_colours,
+            broken_images,
+        )
+    )
+
+
+def get_pattern_vertex_count(svg_pattern: list, single_polygon: list) -> int:
+    """
+    Returns an estimate of the amount of ring vertices of all pattern cells.
+    """
+
+    cell_vertex_count = sum(
+        len(get_polygon_coordinates(polygon)) for polygon in single_polygon
+    )
+
+    return cell_vertex_count * sum(
+        get_pattern_row_length(svg_pattern, row) for row in range(len(svg_pattern))
+    )
+
+
+def get_pattern_spacing(svg_maker) -> tuple:
+    """
+    Returns the distance (horizontal, vertical) between neighbouring cells, as laid out by the pattern setup.
+    """
+
+    return (
+        round(
+            svg_maker.width
+            * svg_maker.repeat_horizontal_spacing
+            * svg_maker.repeat_horizontal_amount
+        )
+        / svg_maker.repeat_horizontal_amount,
+        round(
+            svg_maker.height
+            * svg_maker.repeat_vertical_spacing
+            * svg_maker.repeat_vertical_amount
+        )
+        / svg_maker.repeat_vertical_amount,
+    )
+
+
+def get_seamless_period(svg_maker) -> tuple:
+    """
+    Returns the smallest repeating unit (width, height) of the pattern and the horizontal offset of odd rows.
+
+    With alternating rows the pattern only repeats every second row, otherwise every row.
+    """
+
+    period_width, period_height = get_pattern_spacing(svg_maker)
+
+    row_offset = (
+        svg_maker.single_polygon_x_center * svg_maker.repeat_alternate
+    ) % period_width
+    if math.isclose(row_offset, 0) or math.isclose(row_offset, period_width):
+        return period_width, period_height, 0.0
+
+    return period_width, period_height * 2, row_offset
+
+
+def create_seamless_pattern(svg_maker, single_polygon: list, colours: list) -> tuple:
+    """
+    Create the cells of a single repeating unit of the pattern, grouped by row.
+
+    Cells crossing the border of the unit are wrapped around, so the unit can be tiled seamlessly.
+    Returns the view box of the unit and the cells.
+    """
+
+    period_width, period_height, row_offset = get_seamless_period(svg_maker)
+    _, row_spacing = get_pattern_spacing(svg_maker)
+
+    (
+        x_coordinate_1,
+        y_coordinate_1,
+        x_coordinate_2,
+        y_coordinate_2,
+    ) = single_polygon[0].bounds
+    cell_width = x_coordinate_2 - x_coordinate_1
+    cell_height = y_coordinate_2 - y_coordinate_1
+
+    tile_x = svg_maker.single_polygon_x_center
+    tile_y = svg_maker.single_polygon_y_center
+    tile = box(tile_x, tile_y, tile_x + period_width, tile_y + period_height)
+
+    seamless_polygon_coordinates = []
+    for row in range(
+        -math.ceil(cell_height / row_spacing),
+        math.ceil(period_height / row_spacing),
+    ):
+        y_point = tile_y + row * row_spacing
+        x_offset = row_offset if row & 1 else 0.0
+
+        row_cells = []
+        for column in range(
+            math.floor((-cell_width - x_offset) / period_width),
+            math.ceil((period_width - x_offset) / period_width),
+        ):
+            x_point = tile_x + x_offset + column * period_width
+
+            cell_polygons = []
+            cell_colours = []
+            for polygon, colour in zip(single_polygon, colours):
+                intersect = translate_polygon(polygon, x_point, y_point).intersection(
+                    tile
+                )
+                if intersect.is_empty or intersect.area == 0:
+                    continue
+
+                cell_polygons.append(intersect)
+                cell_colours.append(colour)
+
+            if not cell_polygons:
+                continue
+
+            row_cells.append(
+                {
+                    "polygon": get_polygon_coordinates(cell_polygons),
+                    "broken": False,
+                    "colour": cell_colours,
+                }
+            )
+
+        seamless_polygon_coordinates.append(row_cells)
+
+    return [tile_x, tile_y, period_width, period_height], seamless_polygon_coordinates
+
+
+def get_native_pattern_area(svg_maker, svg_pattern: list, single_polygon: list) -> list:
+    """
+    Returns the area (x, y, width, height) of the pattern to fill with the repeating unit.
+
+    The area is limited to the visible part of the pattern and cut off below the last row,
+    as the repeating unit would otherwise show polygons the pattern does not have there.
+    """
+
+    (
+        x_coordinate_1,
+        y_coordinate_1,
+        x_coordinate_2,
+        y_coordinate_2,
+    ) = get_pattern_container(svg_pattern, single_polygon, single_polygon).bounds
+
+    view_box = svg_maker.pattern_view_box()
+    scale_x, scale_y, offset_x, offset_y = svg_maker.pattern_viewport_transform()
+    x_coordinate_1 = max(x_coordinate_1, view_box[0] - offset_x / scale_x)
+    y_coordinate_1 = max(y_coordinate_1, view_box[1] - offset_y / scale_y)
+    x_coordinate_2 = min(
+        x_coordinate_2,
+        view_box[0] + (svg_maker.pattern_width - offset_x) / scale_x,
+    )
+    y_coordinate_2 = min(
+        y_coordinate_2,
+        view_box[1] + (svg_maker.pattern_height - offset_y) / scale_y,
+        svg_pattern[-1][0][1] + get_pattern_spacing(svg_maker)[1],
+    )
+
+    return [
+        x_coordinate_1,
+        y_coordinate_1,
+        x_coordinate_2 - x_coordinate_1,
+        y_coordinate_2 - y_coordinate_1,
+    ]
@@ -0,0 +1,253 @@
+import math
+from itertools import cycle
+from shapely.geometry import Polygon, Point, LineString  # type: ignore[import-untyped]
+from shapely import affinity  # type: ignore[import-untyped]
+
+
+def get_polygon_points(corners: int, width: int) -> list:
+    """
+    Get coordinates for the polygon.
+    """
+
+    radius = width / 2
+    points = []
+    for k in range(corners):
+        x_coordinate = radius + (
+            radius * math.cos(((2 * math.pi * k) / corners) - (1 / 2 * math.pi))
+        )
+        y_coordinate = radius + (
+            radius * math.sin(((2 * math.pi * k) / corners) - (1 / 2 * math.pi))
+        )
+        points.append((x_coordinate, y_coordinate))
+
+    return points
+
+
+def create_polygon_object(points: list) -> Polygon:
+    """
+    Return a Shapely polygon from points.
+    """
+    return Polygon([[p[0], p[1]] for p in points])
+
+
+def get_polygon_coordinates(polygon_collection) -> list:
+    """
+    Return polygon coordinates for given collection of polygons.
+    """
+
+    if isinstance(polygon_collection, list):
+        coordinates = []
+        for polygon in polygon_collection:
+            if isinstance(polygon, (Point, LineString)):
+                coordinates.append(polygon.coords[:-1])
+            else:
+                coordinates.append(polygon.exterior.coords[:-1])
+        return coordinates
+
+    return list(polygon_collection.exterior.coords)[:-1]
+
+
+def get_colours(polygon_collection: list, polygon_colours: list):
+    """
+    Get alternating colours for polygon filling.
+    """
+
+    polygon_count = len(polygon_collection)
+    if len(polygon_colours) < polygon_count:
+        colour_cycle = cycle(polygon_colours)
+        colour_repeat_collection = []
+        for _ in range(0, polygon_count):
+            colour_repeat_collection.append(next(colour_cycle))
+
+        return colour_repeat_collection
+
+    return polygon_colours
+
+
+def translate_polygon(
+    polygon: Polygon, x_direction: float, y_direction: float
+) -> Polygon:
+    """
+    Returns translated polygon with specified x/y offset.
+    """
+    return affinity.translate(polygon, x_direction, y_direction)
+
+
+def rotate_polygon(polygon: Polygon, rotation: int) -> Polygon:
+    """
+    Returns rotated polygon.
+    """
+    return affinity.rotate(polygon, rotation, origin="centroid")
+
+
+def scale_polygon(polygon: Polygon, scale_factor: float) -> Polygon:
+    """
+    Returns scaled polygon with specified scale factor.
+    """
+    return affinity.scale(
+        polygon, xfact=scale_factor, yfact=scale_factor, origin="center"
+    )
+
+
+def check_polygon_boundary_limit(value: float, limit: float = 0.1e-5) -> float:
+    """
+    Returns the checked value for polygon boundary.
+    """
+    if value < (round(value) + limit):
+        return round(value)
+
+    return value
+
+
+def get_polygon_boundary(polygon: Polygon) -> list:
+    """
+    Returns the bounds of a polygon.
+    """
+    return polygon.bounds
+
+
+def get_polygon_dimensions(
+    x_coordinate_1: float,
+    y_coordinate_1: float,
+    x_coordinate_2: float,
+    y_coordinate_2: float,
+) -> dict:
+    """
+    Get Polygon dimensions.
+    """
+    return {
+        "width": max([x_coordinate_1, x_coordinate_2])
+        - min([x_coordinate_1, x_coordinate_2]),
+        "height": max([y_coordinate_1, y_coordinate_2])
+        - min([y_coordinate_1, y_coordinate_2]),
+    }
+
+
+def create_polygon(
+    polygon_corners,
+    polygon_fractions,
+    polygon_colours,
+    polygon_width,
+    spacing=0.5,
+    polygon_rotation=0,
+):
+    """
+    Create a single polygon.
+    """
+
+    # Get polygon points
+    all_points = get_polygon_points(polygon_corners, polygon_width)
+
+    # Get polygon object
+    polygon = create_polygon_object(all_points)
+
+    # Retrieve polygon boundary box coordinates
+    (
+        x_coordinate_1,
+        y_coordinate_1,
+        x_coordinate_2,
+        y_coordinate_2,
+    ) = get_polygon_boundary(polygon)
+    boundary_box = get_polygon_dimensions(
+        x_coordinate_1, y_coordinate_1, x_coordinate_2, y_coordinate_2
+    )
+
+    # Rotate
+    if polygon_rotation != 0:
+        polygon = rotate_polygon(polygon, polygon_rotation)
+        (
+            x_coordinate_1,
+            y_coordinate_1,
+            x_coordinate_2,
+            y_coordinate_2,
+        ) = get_polygon_boundary(polygon)
+
+        # Retranslate
+        polygon = translate_polygon(polygon, -x_coordinate_1, -y_coordinate_1)
+
+        (
+            x_coordinate_1,
+            y_coordinate_1,
+            x_coordinate_2,
+            y_coordinate_2,
+        ) = get_polygon_boundary(polygon)
+        boundary_box = get_polygon_dimensions(
+            x_coordinate_1, y_coordinate_1, x_coordinate_2, y_coordinate_2
+        )
+
+    # Check if needs rescaling and translating
+    if (
+        check_polygon_boundary_limit(x_coordinate_1) != 0
+        or check_polygon_boundary_limit(y_coordinate_1) != 0
+        or check_polygon_boundary_limit(x_coordinate_2) != polygon_width
+    ):
+        # Scale
+        rescale_factor = polygon_width / boundary_box["width"]
+        polygon = scale_polygon(polygon, rescale_factor)
+
+        (
+            x_coordinate_1,
+            y_coordinate_1,
+            x_coordinate_2,
+            y_coordinate_2,
+        ) = get_polygon_boundary(polygon)
+        polygon = translate_polygon(polygon, -x_coordinate_1, -y_coordinate_1)
+
+        (
+            x_coordinate_1,
+            y_coordinate_1,
+            x_coordinate_2,
+            y_coordinate_2,
+        ) = get_polygon_boundary(polygon)
+        boundary_box = get_polygon_dimensions(
+            x_coordinate_1, y_coordinate_1, x_coordinate_2, y_coordinate_2
+        )
+
+    # Get center coordinates of polygon
+    px_center = polygon.centroid.x
+    py_center = polygon.centroid.y
+
+    # Get new coordinates for all points
+    all_points = get_polygon_coordinates(polygon)
+
+    # Fractions list
+    if spacing is not None:
+        fractions = []
+        for i, fraction_value in enumerate(list(range(1, polygon_fractions + 1))):
+            if (i % 2) != 0:
+                fractions.append((fraction_value / polygon_fractions))
+                continue
+
+            val = (fraction_value / polygon_fractions) - spacing * 1 / polygon_fractions
+            fractions.append(val if val <= 1 else 1)
+    else:
+        fractions = [
+            v / polygon_fractions for v in list(range(1, polygon_fractions + 1))
+        ]
+
+    # Create all (sub)polygons
+    vct = []
+    for point in all_points:
+        pxl = [
+            (
+                (px_center - point[0]) * x + point[0],
+                (py_center - point[1]) * x + point[1],
+            )
+            for x in fractions
+        ]
+        vct.append([point] + pxl)
+
+    # Create polygons
+    polygon_collection = [Polygon(elk) for elk in zip(*vct)]
+
+    # If even, remove the last unnecessary entry (0 pixels)
+    if polygon_fractions % 2 == 0:
+        polygon_collection = polygon_collection[:-1]
+
+    # Get coords back
+    polygon_coordinates = get_polygon_coordinates(polygon_collection)
+
+    # Get colours to fill
+    polygon_colours = get_colours(polygon_collection, polygon_colours)
+
+    return [boundary_box, polygon_collection, polygon_coordinates, polygon_colours]
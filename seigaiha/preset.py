@@ -0,0 +1,640 @@
+import base64
+import binascii
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from seigaiha.colour import COLOUR_FUNCTIONS, COLOUR_SOURCES
+from seigaiha.exception import InvalidManifestLineError, InvalidPresetError
+from seigaiha.rng import RNG_ALGORITHMS
+from seigaiha.sampling import BROKEN_STRATEGIES
+
+PATTERN_MODES = ["grid", "seamless", "native"]
+
+PYRAMID_FORMATS = ["png", "svg"]
+
+BROKEN_FACTOR_ROUNDINGS = ["ceil", "floor", "round"]
+
+DEFAULT_RESOLUTION = 2500
+
+# Minimum, maximum and default compression level of every compressed SVG extension
+SVG_COMPRESS_LEVELS = {
+    "svgz": (0, 9, 9),
+    "svg.br": (0, 11, 9),
+    "svg.zst": (0, 22, 10),
+}
+
+PRESERVE_ASPECT_RATIO_PATTERN = re.compile(
+    r"^(none|x(Min|Mid|Max)Y(Min|Mid|Max))( (meet|slice))?$"
+)
+
+_REQUIRED = object()
+
+
+@dataclass(slots=True, frozen=True)
+class Repeat:
+    amount: int
+    spacing: int | float
+
+
+@dataclass(slots=True, frozen=True)
+class BrokenPattern:
+    factor: int | float | None
+    factor_rounding: str
+    fractions: int
+    skip_edge: bool
+    colours: tuple
+    images: tuple
+    strategy: str
+    cluster_size: int | float
+
+
+@dataclass(slots=True, frozen=True)
+class ColourField:
+    function: str
+    source: str
+    colours: tuple
+    hue: int | float
+    scale: int | float
+
+
+@dataclass(slots=True, frozen=True)
+class Pattern:
+    horizontal: Repeat
+    vertical: Repeat
+    alternate: int | float
+    broken: BrokenPattern | None
+    colour_field: ColourField | None
+
+
+@dataclass(slots=True, frozen=True)
+class SvgOutput:
+    preserve_aspect_ratio: str
+    shape_rendering: str
+    compress_level: int | None
+    merge_paths: bool
+    relative_paths: bool
+
+
+@dataclass(slots=True, frozen=True)
+class PngOutput:
+    compress_level: int
+    colours: int | None
+
+
+@dataclass(slots=True, frozen=True)
+class PyramidOutput:
+    tile_size: int
+    format: str
+    min_zoom: int
+    max_zoom: int | None
+    minimum_ring_size: int | float
+    workers: int | None
+
+
+@dataclass(slots=True, frozen=True)
+class PreviewOutput:
+    size: int | float
+    supersample: int
+    compress_level: int
+
+
+@dataclass(slots=True, frozen=True)
+class Output:
+    resolution: int | float
+    mode: str
+    svg: SvgOutput
+    png: PngOutput | None
+    pyramid: PyramidOutput
+    preview: PreviewOutput
+    sizes: tuple
+    cull_hidden: bool
+
+
+@dataclass(slots=True, frozen=True)
+class Preset:
+    """
+    Compiled preset.
+
+    Validated and normalised preset options, with defaults applied. The original preset is kept as source.
+    """
+
+    seed: int | float | str | None
+    rng: str
+    fractions: int
+    edges: int
+    spacing: int | float
+    rotation: int | float
+    colours: tuple
+    pattern: Pattern | None
+    output: Output
+    source: dict = field(repr=False, compare=False)
+
+
+class _PresetCompiler:
+    """
+    Reads preset options, collecting all errors instead of stopping at the first.
+    """
+
+    def __init__(self) -> None:
+        self.errors: list = []
+
+    def section(self, options: dict, key: str, option: str) -> dict:
+        value = options.get(key)
+        if value is None or isinstance(value, bool):
+            return {}
+
+        if not isinstance(value, dict):
+            self.errors.append(f"`{option}` must be an object")
+            return {}
+
+        return value
+
+    def number(
+        self,
+        options: dict,
+        key: str,
+        option: str,
+        default=_REQUIRED,
+        minimum=None,
+        maximum=None,
+        integer: bool = False,
+    ):
+        value = options.get(key)
+        if value is None:
+            if default is _REQUIRED:
+                self.errors.append(f"`{option}` is required")
+            return None if default is _REQUIRED else default
+
+        kind = "an integer" if integer else "a number"
+        if (
+            isinstance(value, bool)
+            or not isinstance(value, (int, float))
+            or (integer and not isinstance(value, int))
+        ):
+            self.errors.append(f"`{option}` must be {kind}, got `{value}`")
+            return default if default is not _REQUIRED else None
+
+        if (minimum is not None and value < minimum) or (
+            maximum is not None and value > maximum
+        ):
+            limits = (
+                f"between {minimum} and {maximum}"
+                if minimum is not None and maximum is not None
+                else (
+                    f"of at least {minimum}"
+                    if minimum is not None
+                    else f"of at most {maximum}"
+                )
+            )
+            self.errors.append(f"`{option}` must be {kind} {limits}, got `{value}`")
+
+        return value
+
+    def choice(self, options: dict, key: str, option: str, default, choices: list):
+        value = options.get(key, default)
+        if value is None:
+            return default
+
+        if value not in choices:
+            self.errors.append(
+                f"`{option}` must be one of {', '.join(map(str, choices))}, got `{value}`"
+            )
+
+        return value
+
+    def string(self, options: dict, key: str, option: str, default: str) -> str:
+        value = options.get(key, default)
+        if not isinstance(value, str):
+            self.errors.append(f"`{option}` must be a string, got `{value}`")
+            return default
+
+        return value
+
+    def colours(self, options: dict, key: str, option: str, default=_REQUIRED):
+        value = options.get(key)
+        if value is None and default is not _REQUIRED:
+            return default
+
+        if not isinstance(value, list) or not value:
+            self.errors.append(f"`{option}` must be a non-empty list of colours")
+            return ()
+
+        colours = []
+        for index, colour in enumerate(value):
+            if not isinstance(colour, dict):
+                self.errors.append(f"`{option}[{index}]` must be an object")
+                continue
+
+            colours.append(
+                (
+                    self.number(colour, "R", f"{option}[{index}].R", integer=True),
+                    self.number(colour, "G", f"{option}[{index}].G", integer=True),
+                    self.number(colour, "B", f"{option}[{index}].B", integer=True),
+                    self.number(colour, "A", f"{option}[{index}].A", 1),
+                )
+            )
+
+        return tuple(colours)
+
+    def images(self, options: dict, key: str, option: str) -> tuple:
+        value = options.get(key)
+        if value is None:
+            return ()
+
+        if not isinstance(value, list):
+            self.errors.append(f"`{option}` must be a list of base64 encoded images")
+            return ()
+
+        for index, image in enumerate(value):
+            try:
+                base64.b64decode(image, validate=True).decode("utf-8")
+            except (TypeError, binascii.Error, UnicodeDecodeError):
+                self.errors.append(
+                    f"`{option}[{index}]` must be a base64 encoded SVG image"
+                )
+
+        return tuple(value)
+
+    def sizes(self, options: dict, key: str, option: str) -> tuple:
+        value = options.get(key)
+        if value is None:
+            return ()
+
+        if not isinstance(value, list) or not value:
+            self.errors.append(f"`{option}` must be a non-empty list of sizes")
+            return ()
+
+        sizes = {str(index): size for index, size in enumerate(value)}
+
+        return tuple(
+            self.number(sizes, index, f"{option}[{index}]", minimum=1)
+            for index in sizes
+        )
+
+    def repeat(self, options: dict, key: str, option: str) -> Repeat:
+        repeat_options = self.section(options, key, option)
+
+        return Repeat(
+            self.number(
+                repeat_options,
+                "amount",
+                f"{option}.amount",
+                minimum=2,
+                integer=True,
+            ),
+            self.number(repeat_options, "spacing", f"{option}.spacing", minimum=0),
+        )
+
+    def broken(
+        self, options: dict, fractions: int, colours: tuple
+    ) -> BrokenPattern | None:
+        broken_options = self.section(options, "broken", "pattern.broken")
+        if not broken_options:
+            return None
+
+        return BrokenPattern(
+            self.number(
+                broken_options,
+                "factor",
+                "pattern.broken.factor",
+                None,
+                minimum=0,
+                maximum=1,
+            ),
+            self.choice(
+                broken_options,
+                "factor_rounding",
+                "pattern.broken.factor_rounding",
+                "round",
+                BROKEN_FACTOR_ROUNDINGS,
+            ),
+            self.number(
+                broken_options,
+                "fractions",
+                "pattern.broken.fractions",
+                fractions,
+                minimum=1,
+                integer=True,
+            ),
+            bool(broken_options.get("skip_edge", False)),
+            self.colours(broken_options, "colours", "pattern.broken.colours", colours),
+            self.images(broken_options, "images", "pattern.broken.images"),
+            self.choice(
+                broken_options,
+                "strategy",
+                "pattern.broken.strategy",
+                "uniform",
+                BROKEN_STRATEGIES,
+            ),
+            self.number(
+                broken_options,
+                "cluster_size",
+                "pattern.broken.cluster_size",
+                4,
+                minimum=1,
+            ),
+        )
+
+    def colour_field(self, options: dict) -> ColourField | None:
+        colour_field_options = self.section(
+            options, "colour_field", "pattern.colour_field"
+        )
+        if not colour_field_options:
+            return None
+
+        function = self.choice(
+            colour_field_options,
+            "function",
+            "pattern.colour_field.function",
+            "gradient",
+            COLOUR_FUNCTIONS,
+        )
+
+        # Gradients need the colours to shift to, other functions only shift the pattern colours
+        colours = (
+            self.colours(
+                colour_field_options, "colours", "pattern.colour_field.colours"
+            )
+            if function == "gradient"
+            else self.colours(
+                colour_field_options, "colours", "pattern.colour_field.colours", ()
+            )
+        )
+
+        return ColourField(
+            function,
+            self.choice(
+                colour_field_options,
+                "source",
+                "pattern.colour_field.source",
+                "horizontal",
+                COLOUR_SOURCES,
+            ),
+            colours,
+            self.number(colour_field_options, "hue", "pattern.colour_field.hue", 360),
+            self.number(
+                colour_field_options,
+                "scale",
+                "pattern.colour_field.scale",
+                4,
+                minimum=1,
+            ),
+        )
+
+    def pattern(self, options: dict, fractions: int, colours: tuple) -> Pattern | None:
+        pattern_options = self.section(options, "pattern", "pattern")
+        if not pattern_options:
+            return None
+
+        return Pattern(
+            self.repeat(pattern_options, "horizontal", "pattern.horizontal"),
+            self.repeat(pattern_options, "vertical", "pattern.vertical"),
+            self.number(pattern_options, "alternate", "pattern.alternate", 1),
+            self.broken(pattern_options, fractions, colours),
+            self.colour_field(pattern_options),
+        )
+
+    def output(self, options: dict) -> Output:
+        output_options = self.section(options, "output", "output")
+        svg_options = self.section(output_options, "svg", "output.svg")
+        svg_style_options = self.section(svg_options, "style", "output.svg.style")
+        png_options = self.section(output_options, "png", "output.png")
+        pyramid_options = self.section(output_options, "pyramid", "output.pyramid")
+        preview_options = self.section(output_options, "preview", "output.preview")
+
+        preserve_aspect_ratio = self.string(
+            svg_options,
+            "preserveAspectRatio",
+            "output.svg.preserveAspectRatio",
+            "xMinYMin meet",
+        )
+        if not PRESERVE_ASPECT_RATIO_PATTERN.match(preserve_aspect_ratio):
+            self.errors.append(
+                f"`output.svg.preserveAspectRatio` is invalid, got `{preserve_aspect_ratio}`"
+            )
+
+        return Output(
+            self.number(
+                output_options,
+                "resolution",
+                "output.resolution",
+                DEFAULT_RESOLUTION,
+                minimum=1,
+            ),
+            self.choice(output_options, "mode", "output.mode", "grid", PATTERN_MODES),
+            SvgOutput(
+                preserve_aspect_ratio,
+                self.string(
+                    svg_style_options,
+                    "shape-rendering",
+                    "output.svg.style.shape-rendering",
+                    "geometricPrecision",
+                ),
+                self.number(
+                    svg_options,
+                    "compress_level",
+                    "output.svg.compress_level",
+                    None,
+                    minimum=0,
+                    maximum=22,
+                    integer=True,
+                ),
+                bool(svg_options.get("merge_paths", False)),
+                bool(svg_options.get("relative_paths", False)),
+            ),
+            (
+                PngOutput(
+                    self.number(
+                        png_options,
+                        "compress_level",
+                        "output.png.compress_level",
+                        6,
+                        minimum=0,
+                        maximum=9,
+                        integer=True,
+                    ),
+                    self.number(
+                        png_options,
+                        "colours",
+                        "output.png.colours",
+                        None,
+                        minimum=1,
+                        maximum=256,
+                        integer=True,
+                    ),
+                )
+                if png_options
+                else None
+            ),
+            PyramidOutput(
+                self.number(
+                    pyramid_options,
+                    "tile_size",
+                    "output.pyramid.tile_size",
+                    256,
+                    minimum=1,
+                    integer=True,
+                ),
+                self.choice(
+                    pyramid_options,
+                    "format",
+                    "output.pyramid.format",
+                    "png",
+                    PYRAMID_FORMATS,
+                ),
+                self.number(
+                    pyramid_options,
+                    "min_zoom",
+                    "output.pyramid.min_zoom",
+                    0,
+                    minimum=0,
+                    integer=True,
+                ),
+                self.number(
+                    pyramid_options,
+                    "max_zoom",
+                    "output.pyramid.max_zoom",
+                    None,
+                    minimum=0,
+                    integer=True,
+                ),
+                self.number(
+                    pyramid_options,
+                    "minimum_ring_size",
+                    "output.pyramid.minimum_ring_size",
+                    1,
+                    minimum=0,
+                ),
+                self.number(
+                    pyramid_options,
+                    "workers",
+                    "output.pyramid.workers",
+                    None,
+                    minimum=1,
+                    integer=True,
+                ),
+            ),
+            PreviewOutput(
+                self.number(
+                    preview_options,
+                    "size",
+                    "output.preview.size",
+                    256,
+                    minimum=1,
+                ),
+                self.number(
+                    preview_options,
+                    "supersample",
+                    "output.preview.supersample",
+                    1,
+                    minimum=1,
+                    maximum=8,
+                    integer=True,
+                ),
+                self.number(
+                    preview_options,
+                    "compress_level",
+                    "output.preview.compress_level",
+                    6,
+                    minimum=0,
+                    maximum=9,
+                    integer=True,
+                ),
+            ),
+            self.sizes(output_options, "sizes", "output.sizes"),
+            bool(output_options.get("cull_hidden", False)),
+        )
+
+
+def compile_preset(
+    preset: dict, path: Path | str = "", extensions: list | None = None
+) -> Preset:
+    """
+    Validate and normalise the preset options, optionally for the output extensions it is rendered to.
+
+    Raises an invalid preset error listing all invalid options.
+    """
+
+    if not isinstance(preset, dict):
+        raise InvalidPresetError(path, ["the preset must be an object"])
+
+    compiler = _PresetCompiler()
+
+    seed = preset.get("seed")
+    if seed is not None and (
+        isinstance(seed, bool) or not isinstance(seed, (int, float, str))
+    ):
+        compiler.errors.append(f"`seed` must be an integer or string, got `{seed}`")
+
+    fractions = compiler.number(
+        preset, "fractions", "fractions", minimum=1, integer=True
+    )
+    colours = compiler.colours(preset, "colours", "colours")
+
+    compiled_preset = Preset(
+        seed,
+        compiler.choice(preset, "rng", "rng", "legacy", RNG_ALGORITHMS),
+        fractions,
+        compiler.number(preset, "edges", "edges", 36, minimum=3, integer=True),
+        compiler.number(preset, "spacing", "spacing", 0),
+        compiler.number(preset, "rotation", "rotation", 0),
+        colours,
+        compiler.pattern(preset, fractions, colours),
+        compiler.output(preset),
+        preset,
+    )
+
+    # Every compressed SVG extension has a compression level range of its own
+    compress_level = compiled_preset.output.svg.compress_level
+    for extension in extensions or []:
+        if compress_level is None or extension not in SVG_COMPRESS_LEVELS:
+            continue
+
+        minimum, maximum, _ = SVG_COMPRESS_LEVELS[extension]
+        if not minimum <= compress_level <= maximum:
+            compiler.errors.append(
+                f"`output.svg.compress_level` must be an integer between {minimum} and {maximum} "
+                f"for the `{extension}` extension, got `{compress_level}`"
+            )
+
+    if compiler.errors:
+        raise InvalidPresetError(path, compiler.errors)
+
+    return compiled_preset
+
+
+def get_preset_label(item: dict) -> str:
+    """
+    Returns the label of an input item in messages, with the manifest line if available.
+    """
+
+    if "line" in item:
+        return f"{str(item.get('path'))} (line {item.get('line')})"
+
+    return str(item.get("path"))
+
+
+def iter_compiled_presets(items, extensions: list | None = None):
+    """
+    Yields every input item with its compiled preset and None, or with None and the error if the preset is invalid.
+
+    Presets are compiled for the output extensions, if given.
+
+    An invalid manifest line ends the manifest, which is yielded as error without item.
+    """
+
+    try:
+        for item in items:
+            if "error" in item:
+                yield item, None, item["error"]
+                continue
+
+            try:
+                yield item, compile_preset(
+                    item.get("content"), get_preset_label(item), extensions
+                ), None
+            except InvalidPresetError as e:
+                yield item, None, e
+    except InvalidManifestLineError as e:
+        yield None, None, e
@@ -0,0 +1,287 @@
+import struct
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from seigaiha.geometry import create_geometry
+from seigaiha.helper import atomic_output_path
+
+PREVIEW_EXTENSION = "preview.png"
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _scanline_spans(
+    vertices: np.ndarray, ring_offsets: np.ndarray, width: int, height: int
+) -> tuple:
+    """
+    Returns the (ring, row, start, stop) spans of pixels of which the centre is inside a ring, by the even-odd rule.
+
+    Every edge is intersected with the centre line of all rows it crosses at once. The crossings of a ring on a row
+    are sorted, and every pair of crossings bounds a span. Spans are ordered by ring.
+    """
+    ring_lengths = np.diff(ring_offsets)
+    is_ring = ring_lengths > 0
+    if not is_ring.any():
+        return (np.empty(0, dtype=np.int64),) * 4
+
+    # Every vertex starts an edge to the next vertex of its ring, and the last vertex closes the ring
+    next_vertices = np.arange(1, len(vertices) + 1)
+    next_vertices[ring_offsets[1:][is_ring] - 1] = ring_offsets[:-1][is_ring]
+    edge_rings = np.repeat(np.arange(len(ring_lengths)), ring_lengths)
+
+    x_1, y_1 = vertices[:, 0], vertices[:, 1]
+    x_2, y_2 = vertices[next_vertices, 0], vertices[next_vertices, 1]
+
+    # Rows of which the centre is within [top, bottom) of the edge, so horizontal edges cross no rows
+    row_start = np.clip(np.ceil(np.minimum(y_1, y_2) - 0.5), 0, height).astype(np.int64)
+    row_stop = np.clip(np.ceil(np.maximum(y_1, y_2) - 0.5), 0, height).astype(np.int64)
+    row_counts = np.maximum(row_stop - row_start, 0)
+
+    crossing_edges = np.repeat(np.arange(len(row_counts)), row_counts)
+    if not len(crossing_edges):
+        return (np.empty(0, dtype=np.int64),) * 4
+
+    crossing_rows = row_start[crossing_edges] + (
+        np.arange(len(crossing_edges))
+        - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+    )
+    edge_x_1 = x_1[crossing_edges]
+    edge_y_1 = y_1[crossing_edges]
+    crossing_x = edge_x_1 + (crossing_rows + 0.5 - edge_y_1) * (
+        x_2[crossing_edges] - edge_x_1
+    ) / (y_2[crossing_edges] - edge_y_1)
+
+    # Every ring crosses every row an even number of times, so consecutive crossings pair up
+    crossing_keys = edge_rings[crossing_edges] * height + crossing_rows
+    order = np.lexsort((crossing_x, crossing_keys))
+    span_keys = crossing_keys[order[0::2]]
+    span_start = np.clip(np.ceil(crossing_x[order[0::2]] - 0.5), 0, width)
+    span_stop = np.clip(np.ceil(crossing_x[order[1::2]] - 0.5), 0, width)
+
+    is_span = span_stop > span_start
+    span_keys = span_keys[is_span]
+
+    return (
+        span_keys // height,
+        span_keys % height,
+        span_start[is_span].astype(np.int64),
+        span_stop[is_span].astype(np.int64),
+    )
+
+
+def rasterise_rings(
+    vertices: np.ndarray,
+    ring_offsets: np.ndarray,
+    ring_rgba: np.ndarray,
+    width: int,
+    height: int,
+) -> np.ndarray:
+    """
+    Returns the premultiplied (height, width, 4) RGBA image of rings in pixel coordinates, painted in ring order.
+
+    A pixel is covered by a ring if its centre is inside the ring. Every pixel takes the colour of the last opaque
+    ring covering it, with the translucent rings painted after it composited on top.
+    """
+    ring_rgba = np.asarray(ring_rgba, dtype=np.float32).reshape(-1, 4)
+    ring_alpha = np.clip(ring_rgba[:, 3], 0.0, 1.0)
+
+    # Colour 0 is transparent, so ring i has colour i + 1
+    colours = np.zeros((len(ring_rgba) + 1, 4), dtype=np.float32)
+    colours[1:, :3] = ring_rgba[:, :3] * ring_alpha[:, None]
+    colours[1:, 3] = ring_alpha
+
+    span_rings, span_rows, span_start, span_stop = _scanline_spans(
+        np.asarray(vertices, dtype=np.float64),
+        np.asarray(ring_offsets, dtype=np.int64),
+        width,
+        height,
+    )
+    top_colours = np.zeros(height * width, dtype=np.int32)
+    if not len(span_rings):
+        return colours[top_colours].reshape(height, width, 4)
+
+    # Pixels of all spans at once, where span pixels follow each other in ring order
+    span_lengths = span_stop - span_start
+    span_offsets = np.cumsum(span_lengths) - span_lengths
+    pixel_colours = np.repeat((span_rings + 1).astype(np.int32), span_lengths)
+    pixels = np.repeat(
+        span_rows * width + span_start - span_offsets, span_lengths
+    ) + np.arange(len(pixel_colours))
+
+    # Opaque rings hide everything painted before them
+    is_opaque_colour = colours[:, 3] >= 1.0
+    if is_opaque_colour[1:].all():
+        np.maximum.at(top_colours, pixels, pixel_colours)
+
+        return colours[top_colours].reshape(height, width, 4)
+
+    is_opaque = is_opaque_colour[pixel_colours]
+    np.maximum.at(top_colours, pixels[is_opaque], pixel_colours[is_opaque])
+    image = colours[top_colours]
+
+    is_translucent = ~is_opaque & (pixel_colours > top_colours[pixels])
+    if not is_translucent.any():
+        return image.reshape(height, width, 4)
+
+    # Painting over a pixel in order scales what is below by the transparency of every later ring
+    order = np.argsort(pixels[is_translucent], kind="stable")
+    pixels = pixels[is_translucent][order]
+    pixel_colours = pixel_colours[is_translucent][order]
+    transparency = np.log1p(-colours[pixel_colours, 3].astype(np.float64))
+
+    remaining_transparency = np.append(np.cumsum(transparency[::-1])[::-1], 0.0)
+    group_end = np.flatnonzero(np.append(pixels[1:] != pixels[:-1], True))
+    group_start = np.append(0, group_end[:-1] + 1)
+    weights = np.exp(
+        remaining_transparency[1:]
+        - np.repeat(remaining_transparency[group_end + 1], group_end - group_start + 1)
+    )
+
+    image[pixels[group_end]] *= np.exp(
+        remaining_transparency[group_start] - remaining_transparency[group_end + 1]
+    )[:, None]
+    for channel in range(4):
+        image[:, channel] += np.bincount(
+            pixels,
+            weights=colours[pixel_colours, channel] * weights,
+            minlength=height * width,
+        )
+
+    return image.reshape(height, width, 4)
+
+
+def downsample_image(image: np.ndarray, supersample: int) -> np.ndarray:
+    """
+    Returns the straight RGBA image of a premultiplied image, averaged over blocks of supersample pixels.
+    """
+    if supersample > 1:
+        height, width = image.shape[0] // supersample, image.shape[1] // supersample
+        blocks = image.reshape(height, supersample, width, supersample, 4)
+        image = blocks[:, 0, :, 0].copy()
+        for row in range(supersample):
+            for column in range(supersample):
+                if row or column:
+                    image += blocks[:, row, :, column]
+        image /= supersample * supersample
+
+    # Transparent pixels have no colour, so dividing by any alpha leaves them transparent
+    alpha = image[:, :, 3:]
+    straight = image / np.maximum(alpha, np.float32(1e-12))
+    straight[:, :, 3:] = alpha
+
+    return (np.minimum(straight, 1.0) * 255 + 0.5).astype(np.uint8)
+
+
+def encode_png(image: np.ndarray, compress_level: int = 6) -> bytes:
+    """
+    Returns the PNG file of a straight (height, width, 4) RGBA image.
+    """
+    height, width = image.shape[:2]
+
+    # Every row starts with the filter type, where 0 leaves the row unfiltered
+    rows = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    rows[:, 1:] = image.reshape(height, width * 4)
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data))
+            + chunk_type
+            + data
+            + struct.pack(">I", zlib.crc32(chunk_type + data))
+        )
+
+    return (
+        PNG_SIGNATURE
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows.tobytes(), compress_level))
+        + chunk(b"IEND", b"")
+    )
+
+
+def render_preview(page, size: int | float, supersample: int = 1) -> np.ndarray:
+    """
+    Returns the straight RGBA image of a vector page, at an output size relative to the resolution.
+
+    The rings of the page are filled straight from their vertex arrays, with every pixel split into supersample ×
+    supersample samples. Broken images are left out. A repeated tile is filled once, and sampled for every pixel
+    within the repeated area.
+    """
+    svg_maker = page.svg_maker
+    pixel_scale = size / svg_maker.preset.output.resolution
+    width = max(1, round(page.size[0] * pixel_scale))
+    height = max(1, round(page.size[1] * pixel_scale))
+
+    scale_x, scale_y, offset_x, offset_y = svg_maker.viewport_transform(
+        page.size, page.view_box
+    )
+    sample_scale = pixel_scale * supersample
+    scale_x, scale_y = scale_x * sample_scale, scale_y * sample_scale
+    offset_x, offset_y = offset_x * sample_scale, offset_y * sample_scale
+    sample_width, sample_height = width * supersample, height * supersample
+
+    geometry = create_geometry(page.rows, page.view_box)
+    vertices = geometry["vertices"].astype(np.float64)
+
+    if page.repeat is None:
+        vertices[:, 0] = (vertices[:, 0] - page.view_box[0]) * scale_x + offset_x
+        vertices[:, 1] = (vertices[:, 1] - page.view_box[1]) * scale_y + offset_y
+        image = rasterise_rings(
+            vertices,
+            geometry["ring_offsets"],
+            geometry["ring_rgba"],
+            sample_width,
+            sample_height,
+        )
+
+        return downsample_image(image, supersample)
+
+    # Tile pixels have the scale of the page, so the tile is sampled at about one tile pixel per page pixel
+    (tile_x, tile_y, tile_width, tile_height), (
+        area_x,
+        area_y,
+        area_width,
+        area_height,
+    ) = page.repeat
+    tile_pixel_width = max(1, int(np.ceil(tile_width * scale_x)))
+    tile_pixel_height = max(1, int(np.ceil(tile_height * scale_y)))
+    vertices[:, 0] = (vertices[:, 0] - tile_x) * scale_x
+    vertices[:, 1] = (vertices[:, 1] - tile_y) * scale_y
+    tile_image = rasterise_rings(
+        vertices,
+        geometry["ring_offsets"],
+        geometry["ring_rgba"],
+        tile_pixel_width,
+        tile_pixel_height,
+    )
+
+    user_x = (np.arange(sample_width) + 0.5 - offset_x) / scale_x + page.view_box[0]
+    user_y = (np.arange(sample_height) + 0.5 - offset_y) / scale_y + page.view_box[1]
+    tile_columns = np.minimum(
+        (np.mod(user_x - tile_x, tile_width) * scale_x).astype(np.int64),
+        tile_pixel_width - 1,
+    )
+    tile_rows = np.minimum(
+        (np.mod(user_y - tile_y, tile_height) * scale_y).astype(np.int64),
+        tile_pixel_height - 1,
+    )
+
+    image = tile_image[tile_rows[:, None], tile_columns[None, :]]
+    is_outside_x = (user_x < area_x) | (user_x >= area_x + area_width)
+    is_outside_y = (user_y < area_y) | (user_y >= area_y + area_height)
+    image[is_outside_y, :] = 0.0
+    image[:, is_outside_x] = 0.0
+
+    return downsample_image(image, supersample)
+
+
+def save_preview_png(page, output_path: Path) -> None:
+    """
+    Save a preview of a vector page as PNG, with the preview options of the preset.
+    """
+    preview_options = page.svg_maker.preset.output.preview
+    image = render_preview(page, preview_options.size, preview_options.supersample)
+
+    with atomic_output_path(output_path) as temporary_path:
+        temporary_path.write_bytes(encode_png(image, preview_options.compress_level))
@@ -0,0 +1,511 @@
+import io
+import json
+import math
+import os
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+from cairocffi import CairoError  # type: ignore[import-untyped]
+from cairosvg import svg2png  # type: ignore[import-untyped]
+from PIL import Image
+
+from seigaiha.colour import PatternColours
+from seigaiha.exception import SvgToPngImageError
+from seigaiha.helper import atomic_output_path
+from seigaiha.parallel import (
+    SharedPatternGeometry,
+    attach_pattern_geometry,
+    create_pattern_geometry,
+    get_pattern_geometry_arrays,
+)
+from seigaiha.pattern import get_pattern_row_length
+from seigaiha.preview import downsample_image, encode_png
+
+# Cells smaller than this size in pixels are not rendered, their zoom levels are built from the tiles one level deeper
+PYRAMID_DETAIL_CELL_SIZE = 16
+
+_worker_pyramid = None
+
+
+class TilePyramid:
+    """
+    Z/X/Y tile pyramid of a pattern.
+
+    Tiles of zoom levels at which cells are at least `PYRAMID_DETAIL_CELL_SIZE` (or the minimum ring size) pixels
+    are rendered from the pattern cells they cover. Tiles of lower zoom levels are built from the four tiles one
+    level deeper, so they do not hold more than a tile of pixels however large the pattern is.
+    """
+
+    def __init__(
+        self,
+        svg_maker,
+        svg_pattern: list,
+        single_polygon: list,
+        broken_polygon: list,
+        colours: list,
+        broken_colours: list,
+        broken_images: dict,
+        pattern_colours: PatternColours | None = None,
+    ):
+        self.svg_maker = svg_maker
+        self.colours = colours
+        self.broken_colours = broken_colours
+        self.options = svg_maker.preset.output.pyramid
+
+        # The base geometry of the pattern as arrays, which workers attach in shared memory
+        self.arrays: dict | None = get_pattern_geometry_arrays(
+            svg_pattern, single_polygon, broken_polygon, broken_images, pattern_colours
+        )
+        self.geometry: dict | None = create_pattern_geometry(self.arrays)
+
+        self.canvas_size = [svg_maker.pattern_width, svg_maker.pattern_height]
+        self.view_box = svg_maker.pattern_view_box()
+        self.scale_x, self.scale_y, self.offset_x, self.offset_y = (
+            svg_maker.pattern_viewport_transform()
+        )
+
+        # Cell positions by row, used to find the cells covering a tile
+        self.cell_width = svg_maker.width
+        self.cell_height = svg_maker.height
+        self.row_positions = [row_cells[0][1] for row_cells in svg_pattern]
+        self.column_positions = [
+            [
+                cell[0]
+                for cell in svg_pattern[row][: get_pattern_row_length(svg_pattern, row)]
+            ]
+            for row in range(min(2, len(svg_pattern)))
+        ]
+
+        tile_size = self.options.tile_size
+        self.native_zoom = max(
+            0, math.ceil(math.log2(max(self.canvas_size) / tile_size))
+        )
+        self.min_zoom = self.options.min_zoom
+        self.max_zoom = self.options.max_zoom
+        if self.max_zoom is None:
+            self.max_zoom = self.native_zoom
+        self.detail_zoom = self._get_detail_zoom()
+
+        self.single_ring_widths = [
+            polygon.bounds[2] - polygon.bounds[0] for polygon in single_polygon
+        ]
+        self.broken_ring_widths = [
+            polygon.bounds[2] - polygon.bounds[0] for polygon in broken_polygon
+        ]
+
+    def __getstate__(self):
+        # Workers attach the geometry in shared memory instead
+        state = self.__dict__.copy()
+        state["arrays"] = None
+        state["geometry"] = None
+
+        return state
+
+    def _get_detail_zoom(self) -> int:
+        """
+        Returns the lowest zoom level of which the tiles are rendered from the pattern cells.
+
+        Tiles of the maximum zoom level are always rendered from the pattern cells.
+        """
+        cell_size = self.cell_width * self.scale_x * self.zoom_factor(self.min_zoom)
+        detail_size = max(PYRAMID_DETAIL_CELL_SIZE, self.options.minimum_ring_size)
+        if cell_size >= detail_size:
+            return self.min_zoom
+
+        detail_zoom = self.min_zoom + math.ceil(math.log2(detail_size / cell_size))
+
+        return min(detail_zoom, self.max_zoom)
+
+    def zoom_factor(self, zoom: int) -> float:
+        """
+        Scale factor of a zoom level relative to the native pattern resolution.
+        """
+        return 2.0 ** (zoom - self.native_zoom)
+
+    def zoom_tiles(self, zoom: int) -> tuple:
+        """
+        Returns the amount of tiles (columns, rows) of a zoom level.
+        """
+        zoom_factor = self.zoom_factor(zoom)
+        tile_size = self.options.tile_size
+
+        return (
+            max(1, math.ceil(self.canvas_size[0] * zoom_factor / tile_size)),
+            max(1, math.ceil(self.canvas_size[1] * zoom_factor / tile_size)),
+        )
+
+    def ring_level_of_detail(self, ring_widths: list, zoom: int) -> int:
+        """
+        Returns the amount of rings large enough to be visible at a zoom level.
+        """
+        minimum_width = self.options.minimum_ring_size / (
+            self.scale_x * self.zoom_factor(zoom)
+        )
+
+        return max(1, sum(1 for width in ring_widths if width >= minimum_width))
+
+    def tile_cells(self, zoom: int, x: int, y: int) -> list:
+        """
+        Create the pattern cells covering a tile, grouped by row.
+        """
+        geometry = self.geometry
+        assert geometry is not None
+
+        zoom_factor = self.zoom_factor(zoom)
+        tile_size = self.options.tile_size
+
+        user_x1 = self.view_box[0] + (x * tile_size / zoom_factor - self.offset_x) / (
+            self.scale_x
+        )
+        user_x2 = user_x1 + tile_size / (zoom_factor * self.scale_x)
+        user_y1 = self.view_box[1] + (y * tile_size / zoom_factor - self.offset_y) / (
+            self.scale_y
+        )
+        user_y2 = user_y1 + tile_size / (zoom_factor * self.scale_y)
+
+        single_rings = self.ring_level_of_detail(self.single_ring_widths, zoom)
+        broken_rings = self.ring_level_of_detail(self.broken_ring_widths, zoom)
+
+        row_stride = geometry["cell_x"].shape[1]
+        pattern_colours = geometry["pattern_colours"]
+
+        rows = []
+        for row in range(
+            bisect_left(self.row_positions, user_y1 - self.cell_height),
+            bisect_right(self.row_positions, user_y2),
+        ):
+            column_positions = self.column_positions[row & 1]
+            cells = []
+            for column in range(
+                bisect_left(column_positions, user_x1 - self.cell_width),
+                bisect_right(column_positions, user_x2),
+            ):
+                x_point = float(geometry["cell_x"][row, column])
+                y_point = float(geometry["cell_y"][row, column])
+                is_broken = bool(geometry["cell_broken"][row, column])
+
+                base_rings = geometry["pattern_clipper"].clip_rings(
+                    (
+                        geometry["broken_polygon"]
+                        if is_broken
+                        else geometry["single_polygon"]
+                    ),
+                    x_point,
+                    y_point,
+                )[: broken_rings if is_broken else single_rings]
+                cell_coordinates: list = [
+                    [
+                        (vertex_x + x_point, vertex_y + y_point)
+                        for vertex_x, vertex_y in ring
+                    ]
+                    for ring in base_rings
+                ]
+
+                broken_image = geometry["broken_images"].get(row * row_stride + column)
+                if broken_image is not None:
+                    cell_coordinates.append(broken_image)
+
+                colour = self.broken_colours if is_broken else self.colours
+                if pattern_colours is not None and not is_broken:
+                    colour = pattern_colours.cell_colours(row, column)
+
+                cells.append(
+                    {
+                        "polygon": cell_coordinates,
+                        "broken": is_broken,
+                        "colour": colour,
+                        "base_rings": base_rings,
+                    }
+                )
+            rows.append(cells)
+
+        return rows
+
+    def render_tile(self, zoom: int, x: int, y: int) -> str:
+        """
+        Render a single tile to an SVG string.
+        """
+        zoom_factor = self.zoom_factor(zoom)
+        tile_size = self.options.tile_size
+
+        svg_str_tile = self.svg_maker.xml_initialise_tile(
+            [x * tile_size, y * tile_size, tile_size, tile_size],
+            tile_size,
+            [
+                self.canvas_size[0] * zoom_factor,
+                self.canvas_size[1] * zoom_factor,
+            ],
+        )
+        svg_poly_tile = self.svg_maker.xml_create_pattern(self.tile_cells(zoom, x, y))
+
+        return svg_str_tile.replace(
+            self.svg_maker.poly_placeholder, svg_poly_tile["string"]
+        )
+
+    def tile_path(self, zoom: int, x: int, y: int, output_directory: Path) -> Path:
+        """
+        Returns the path of a tile, `{zoom}/{x}/{y}.{format}`.
+        """
+        output_path = output_directory.joinpath(
+            str(zoom), str(x), f"{y}.{self.options.format}"
+        )
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        return output_path
+
+    def save_tile(
+        self, zoom: int, x: int, y: int, output_directory: Path, raster: bool = False
+    ):
+        """
+        Render and save a single tile to `{zoom}/{x}/{y}.{format}`.
+
+        With `raster`, the tile is returned as a straight RGBA image, to build the tile one level up from.
+        """
+        output_path = self.tile_path(zoom, x, y, output_directory)
+
+        svg_tile = self.render_tile(zoom, x, y)
+        if self.options.format == "svg":
+            self.svg_maker.save_svg(svg_tile, output_path)
+        else:
+            self.svg_maker.save_png(svg_tile, output_path)
+
+        if not raster:
+            return output_path
+
+        # PNG tiles are read back, so the levels above have the colours of the saved tiles
+        if self.options.format == "png":
+            with Image.open(output_path) as png_image:
+                return np.asarray(png_image.convert("RGBA"))
+
+        try:
+            png_bytes = svg2png(bytestring=svg_tile)
+        except CairoError as e:
+            raise SvgToPngImageError(str(e))
+
+        with Image.open(io.BytesIO(png_bytes)) as png_image:
+            return np.asarray(png_image.convert("RGBA"))
+
+    def save_parent_tile(
+        self, zoom: int, x: int, y: int, output_directory: Path, detail_rasters
+    ) -> np.ndarray:
+        """
+        Build and save a tile from the four tiles one level deeper, down to the detail zoom level.
+
+        The rasters of the detail tiles below the tile are taken from `detail_rasters`, in the order of
+        `parent_tiles`. Returns the tile as a straight RGBA image.
+        """
+        if zoom == self.detail_zoom:
+            return next(detail_rasters)
+
+        tile_size = self.options.tile_size
+        tiles_x, tiles_y = self.zoom_tiles(zoom + 1)
+
+        # Children are averaged as premultiplied colours, so transparent pixels do not darken the edges
+        image = np.zeros((tile_size * 2, tile_size * 2, 4), dtype=np.float32)
+        for child_x in (x * 2, x * 2 + 1):
+            for child_y in (y * 2, y * 2 + 1):
+                if child_x >= tiles_x or child_y >= tiles_y:
+                    continue
+
+                child_image = (
+                    self.save_parent_tile(
+                        zoom + 1, child_x, child_y, output_directory, detail_rasters
+                    ).astype(np.float32)
+                    / 255
+                )
+                child_image[:, :, :3] *= child_image[:, :, 3:]
+
+                top = (child_y - y * 2) * tile_size
+                left = (child_x - x * 2) * tile_size
+                image[top : top + tile_size, left : left + tile_size] = child_image
+
+        tile_image = downsample_image(image, 2)
+
+        output_path = self.tile_path(zoom, x, y, output_directory)
+        if self.options.format == "svg":
+            self.svg_maker.save_svg(
+                self.svg_maker.xml_image_tile(tile_size, encode_png(tile_image)),
+                output_path,
+            )
+        else:
+            self.svg_maker.save_png_image(
+                Image.fromarray(tile_image, "RGBA"), output_path
+            )
+
+        return tile_image
+
+    def parent_tiles(self):
+        """
+        Yields the (zoom, x, y) tiles of the zoom levels built from deeper tiles, children before their parent.
+
+        The detail tiles below them are yielded as well, in the order they are needed to build their parents.
+        """
+
+        def child_tiles(zoom: int, x: int, y: int):
+            if zoom < self.detail_zoom:
+                tiles_x, tiles_y = self.zoom_tiles(zoom + 1)
+                for child_x in (x * 2, x * 2 + 1):
+                    for child_y in (y * 2, y * 2 + 1):
+                        if child_x < tiles_x and child_y < tiles_y:
+                            yield from child_tiles(zoom + 1, child_x, child_y)
+
+            yield zoom, x, y
+
+        tiles_x, tiles_y = self.zoom_tiles(self.min_zoom)
+        for x in range(tiles_x):
+            for y in range(tiles_y):
+                yield from child_tiles(self.min_zoom, x, y)
+
+    def tiles(self):
+        """
+        Yields all (zoom, x, y) tiles of the pyramid.
+        """
+        for zoom in range(self.min_zoom, self.max_zoom + 1):
+            tiles_x, tiles_y = self.zoom_tiles(zoom)
+            for x in range(tiles_x):
+                for y in range(tiles_y):
+                    yield zoom, x, y
+
+    def save(self, output_directory: Path) -> int:
+        """
+        Render and save all tiles of the pyramid, in parallel if multiple workers are available.
+
+        The `pyramid.json` is written once all tiles are saved, so a pyramid without it is incomplete.
+        """
+        output_directory.mkdir(parents=True, exist_ok=True)
+
+        workers = self.options.workers or os.cpu_count() or 1
+        if workers == 1:
+            saved_tiles = self._save_tiles(output_directory, None, 1)
+        else:
+            assert self.arrays is not None
+            shared_geometry = SharedPatternGeometry(self.arrays)
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=_initialise_worker,
+                    initargs=(self, shared_geometry.name, shared_geometry.layout),
+                ) as executor:
+                    saved_tiles = self._save_tiles(output_directory, executor, workers)
+            finally:
+                shared_geometry.close()
+
+        self._save_metadata(output_directory)
+
+        return saved_tiles
+
+    def _save_tiles(self, output_directory: Path, executor, workers: int) -> int:
+        saved_tiles = 0
+
+        # Zoom levels from which on tiles are rendered from the pattern cells on their own
+        cell_zoom = self.min_zoom
+        if self.detail_zoom > self.min_zoom:
+            cell_zoom = self.detail_zoom + 1
+
+        if self.detail_zoom > self.min_zoom:
+            detail_tiles = [
+                (zoom, x, y)
+                for zoom, x, y in self.parent_tiles()
+                if zoom == self.detail_zoom
+            ]
+            detail_rasters = self._iter_detail_rasters(
+                detail_tiles, output_directory, executor, workers
+            )
+
+            tiles_x, tiles_y = self.zoom_tiles(self.min_zoom)
+            for x in range(tiles_x):
+                for y in range(tiles_y):
+                    self.save_parent_tile(
+                        self.min_zoom, x, y, output_directory, detail_rasters
+                    )
+
+            saved_tiles += sum(1 for _ in self.parent_tiles())
+
+        tiles = ((zoom, x, y) for zoom, x, y in self.tiles() if zoom >= cell_zoom)
+        if executor is None:
+            for zoom, x, y in tiles:
+                self.save_tile(zoom, x, y, output_directory)
+                saved_tiles += 1
+
+            return saved_tiles
+
+        # Bound the amount of pending tiles, so memory does not grow with the pyramid size
+        pending: set = set()
+        for zoom, x, y in tiles:
+            if len(pending) >= workers * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                saved_tiles += len(done)
+
+            pending.add(
+                executor.submit(_save_worker_tile, zoom, x, y, output_directory)
+            )
+
+        for future in pending:
+            future.result()
+        saved_tiles += len(pending)
+
+        return saved_tiles
+
+    def _iter_detail_rasters(
+        self, detail_tiles: list, output_directory: Path, executor, workers: int
+    ):
+        """
+        Yields the rasters of the detail tiles in order, rendered ahead in the pool up to a bound.
+        """
+        if executor is None:
+            for zoom, x, y in detail_tiles:
+                yield self.save_tile(zoom, x, y, output_directory, raster=True)
+            return
+
+        pending: deque = deque()
+        for zoom, x, y in detail_tiles:
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+
+            pending.append(
+                executor.submit(
+                    _save_worker_tile, zoom, x, y, output_directory, raster=True
+                )
+            )
+
+        while pending:
+            yield pending.popleft().result()
+
+    def _save_metadata(self, output_directory: Path) -> None:
+        with atomic_output_path(
+            output_directory.joinpath("pyramid.json")
+        ) as temporary_path, temporary_path.open("w") as file:
+            json.dump(
+                {
+                    "width": self.canvas_size[0],
+                    "height": self.canvas_size[1],
+                    "tile_size": self.options.tile_size,
+                    "format": self.options.format,
+                    "min_zoom": self.min_zoom,
+                    "max_zoom": self.max_zoom,
+                    "native_zoom": self.native_zoom,
+                },
+                file,
+                indent=4,
+            )
+
+
+def _initialise_worker(
+    tile_pyramid: TilePyramid, shared_name: str, layout: dict
+) -> None:
+    global _worker_pyramid
+    tile_pyramid.geometry = attach_pattern_geometry(shared_name, layout)
+    _worker_pyramid = tile_pyramid
+
+
+def _save_worker_tile(
+    zoom: int, x: int, y: int, output_directory: Path, raster: bool = False
+):
+    return _worker_pyramid.save_tile(  # type: ignore[union-attr]
+        zoom, x, y, output_directory, raster
+    )
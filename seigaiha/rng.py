@@ -0,0 +1,141 @@
+import hashlib
+
+import numpy as np
+
+RNG_ALGORITHMS = ["legacy", "philox"]
+
+# Stream identifiers are part of the output, so they must never be renumbered
+RNG_STREAMS = {
+    "broken_cells": 1,
+    "broken_images": 2,
+    "broken_clusters": 3,
+    "colour_field": 4,
+}
+
+
+def get_seed_entropy(seed) -> int | None:
+    """
+    Returns the entropy of a preset seed. Seeds other than non-negative integers are hashed.
+    """
+
+    if seed is None:
+        return None
+
+    if isinstance(seed, int) and not isinstance(seed, bool) and seed >= 0:
+        return seed
+
+    return int.from_bytes(
+        hashlib.sha256(f"{type(seed).__name__}:{seed!r}".encode("utf-8")).digest(),
+        "little",
+    )
+
+
+def get_cell_indices(cells: list, row_stride: int) -> np.ndarray:
+    """
+    Returns the flat indices of (row, column) cells, in a grid of row stride columns per row.
+    """
+
+    if not cells:
+        return np.empty(0, dtype=np.int64)
+
+    cell_array = np.asarray(cells, dtype=np.int64)
+
+    return cell_array[:, 0] * row_stride + cell_array[:, 1]
+
+
+class PresetRandom:
+    """
+    Preset random.
+
+    Independent random streams of a preset, derived from its seed with a seed sequence. Every value is a pure
+    function of the seed, the stream and the cell index, so values can be drawn for any cells in any order.
+
+    Values are built from the raw output of the Philox bit generator only, which is stable across NumPy versions,
+    unlike the distributions of the NumPy generator.
+    """
+
+    def __init__(self, seed=None):
+        self.seed_sequence = np.random.SeedSequence(get_seed_entropy(seed))
+
+    def stream_key(self, stream: str) -> np.ndarray:
+        """
+        Returns the Philox key of a stream.
+        """
+        return np.random.SeedSequence(
+            self.seed_sequence.entropy,
+            spawn_key=(RNG_STREAMS[stream],),
+        ).generate_state(2, np.uint64)
+
+    def uniform(self, stream: str, indices: np.ndarray) -> np.ndarray:
+        """
+        Returns uniform floats in [0, 1) of a stream for the given cell indices.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if not indices.size:
+            return np.empty(0, dtype=np.float64)
+
+        bit_generator = np.random.Philox(key=self.stream_key(stream))
+        raw_values = bit_generator.random_raw(int(indices.max()) + 1)[indices]
+
+        # Use the upper 53 bits, which is the precision of a double
+        return (raw_values >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+    def sample(self, stream: str, indices: np.ndarray, amount: int) -> np.ndarray:
+        """
+        Returns a uniform sample without replacement of amount cell indices, being the cells with the lowest values.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        amount = min(amount, indices.size)
+        if amount <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        if amount == indices.size:
+            return np.sort(indices)
+
+        # Ties are broken by cell index, so the sample never depends on the sorting algorithm
+        values = self.uniform(stream, indices)
+
+        return np.sort(indices[np.lexsort((indices, values))[:amount]])
+
+    def choice(self, stream: str, indices: np.ndarray, choices: int) -> np.ndarray:
+        """
+        Returns a choice out of the number of choices for each of the given cell indices.
+        """
+        return np.minimum(
+            (self.uniform(stream, indices) * choices).astype(np.int64), choices - 1
+        )
+
+    def noise(
+        self, stream: str, lattice_x: np.ndarray, lattice_y: np.ndarray
+    ) -> np.ndarray:
+        """
+        Returns smooth value noise in [0, 1) of a stream at non-negative positions, in units of the noise lattice.
+
+        Random values on the lattice points are interpolated with smoothstep weights, so the noise has no visible
+        lattice structure.
+        """
+        lattice_column = np.floor(lattice_x).astype(np.int64)
+        lattice_row = np.floor(lattice_y).astype(np.int64)
+        if not lattice_column.size:
+            return np.empty(0, dtype=np.float64)
+
+        lattice_columns = int(lattice_column.max()) + 2
+
+        def lattice_value(row_offset: int, column_offset: int) -> np.ndarray:
+            return self.uniform(
+                stream,
+                (lattice_row + row_offset) * lattice_columns
+                + lattice_column
+                + column_offset,
+            )
+
+        weight_x = lattice_x - lattice_column
+        weight_x = weight_x * weight_x * (3 - 2 * weight_x)
+        weight_y = lattice_y - lattice_row
+        weight_y = weight_y * weight_y * (3 - 2 * weight_y)
+
+        return (1 - weight_y) * (
+            (1 - weight_x) * lattice_value(0, 0) + weight_x * lattice_value(0, 1)
+        ) + weight_y * (
+            (1 - weight_x) * lattice_value(1, 0) + weight_x * lattice_value(1, 1)
+        )
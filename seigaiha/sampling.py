@@ -0,0 +1,151 @@
+import math
+
+import numpy as np
+
+BROKEN_STRATEGIES = ["uniform", "blue_noise", "clustered"]
+
+# Fraction of a stratum around its centre preferred by blue noise sampling, keeping samples of neighbouring
+# strata apart
+BLUE_NOISE_INNER_STRATUM = 0.7
+
+# Weight of the per cell jitter relative to the cluster noise, roughening the cluster borders
+CLUSTER_JITTER = 0.25
+
+
+def _lowest(indices: np.ndarray, values: np.ndarray, amount: int) -> np.ndarray:
+    """
+    Returns the amount of indices with the lowest values, with ties broken by index.
+    """
+
+    return indices[np.lexsort((indices, values))[:amount]]
+
+
+def sample_uniform(preset_random, candidates: np.ndarray, amount: int) -> np.ndarray:
+    """
+    Returns a uniform sample of the candidate cells.
+    """
+
+    return preset_random.sample("broken_cells", candidates, amount)
+
+
+def sample_blue_noise(
+    preset_random,
+    candidates: np.ndarray,
+    amount: int,
+    positions_x: np.ndarray,
+    positions_y: np.ndarray,
+) -> np.ndarray:
+    """
+    Returns a blue noise sample of the candidate cells, which are spread evenly without clumps.
+
+    The area of the candidates is divided in about amount square strata, of which the cell with the lowest random
+    value is sampled. Cells in the inner part of a stratum are preferred, so samples keep a minimum distance.
+    """
+
+    candidate_x = positions_x[candidates]
+    candidate_y = positions_y[candidates]
+    values = preset_random.uniform("broken_cells", candidates)
+
+    area = max(np.ptp(candidate_x), 1.0) * max(np.ptp(candidate_y), 1.0)
+    stratum_size = math.sqrt(area / amount)
+
+    stratum_x = (candidate_x - candidate_x.min()) / stratum_size
+    stratum_y = (candidate_y - candidate_y.min()) / stratum_size
+    stratum_column = np.floor(stratum_x).astype(np.int64)
+    stratum_row = np.floor(stratum_y).astype(np.int64)
+    stratum = stratum_row * (int(stratum_column.max()) + 1) + stratum_column
+
+    inner_margin = BLUE_NOISE_INNER_STRATUM / 2
+    is_inner = (np.abs(stratum_x - stratum_column - 0.5) <= inner_margin) & (
+        np.abs(stratum_y - stratum_row - 0.5) <= inner_margin
+    )
+
+    # Sort by stratum, then inner cells first, then by value
+    order = np.lexsort((candidates, values, ~is_inner, stratum))
+    first_of_stratum = order[
+        np.concatenate(([True], stratum[order][1:] != stratum[order][:-1]))
+    ]
+
+    sampled = _lowest(candidates[first_of_stratum], values[first_of_stratum], amount)
+    if sampled.size < amount:
+        remaining = np.ones(candidates.size, dtype=bool)
+        remaining[first_of_stratum] = False
+        sampled = np.concatenate(
+            (
+                sampled,
+                _lowest(
+                    candidates[remaining], values[remaining], amount - sampled.size
+                ),
+            )
+        )
+
+    return np.sort(sampled)
+
+
+def sample_clustered(
+    preset_random,
+    candidates: np.ndarray,
+    amount: int,
+    positions_x: np.ndarray,
+    positions_y: np.ndarray,
+    cluster_size: float,
+) -> np.ndarray:
+    """
+    Returns a clustered sample of the candidate cells.
+
+    Random values on a lattice with a spacing of cluster size are interpolated to the cells, and the cells with
+    the lowest interpolated values are sampled, forming clusters around the lowest lattice values.
+    """
+
+    candidate_x = positions_x[candidates]
+    candidate_y = positions_y[candidates]
+
+    noise = preset_random.noise(
+        "broken_clusters",
+        (candidate_x - candidate_x.min()) / cluster_size,
+        (candidate_y - candidate_y.min()) / cluster_size,
+    )
+    values = noise + CLUSTER_JITTER * preset_random.uniform("broken_cells", candidates)
+
+    return np.sort(_lowest(candidates, values, amount))
+
+
+def sample_broken_cells(
+    strategy: str,
+    preset_random,
+    candidates: np.ndarray,
+    amount: int,
+    positions_x: np.ndarray,
+    positions_y: np.ndarray,
+    cluster_size: float = 4,
+) -> np.ndarray:
+    """
+    Returns the sampled broken cells out of the candidate cells, as sorted flat cell indices.
+
+    Positions are the flat arrays of cell positions, in polygon widths.
+    """
+
+    candidates = np.asarray(candidates, dtype=np.int64)
+    amount = min(amount, candidates.size)
+    if amount <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    if amount == candidates.size:
+        return np.sort(candidates)
+
+    match strategy:
+        case "blue_noise":
+            return sample_blue_noise(
+                preset_random, candidates, amount, positions_x, positions_y
+            )
+        case "clustered":
+            return sample_clustered(
+                preset_random,
+                candidates,
+                amount,
+                positions_x,
+                positions_y,
+                cluster_size,
+            )
+        case _:
+            return sample_uniform(preset_random, candidates, amount)
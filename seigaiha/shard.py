@@ -0,0 +1,189 @@
+import datetime
+import hashlib
+import json
+from pathlib import Path
+
+from seigaiha.helper import PresetManifest, atomic_output_path
+
+
+def get_unit_key(input_path_given: str, item: dict) -> str:
+    """
+    Returns the key of a preset unit, being its path relative to the given input path.
+
+    Manifest lines are keyed by the manifest name and line number. The key does not depend on where the shared
+    volume is mounted, so all nodes derive the same key for the same preset.
+    """
+
+    if "line" in item:
+        return f"{Path(input_path_given).name}:{item.get('line')}"
+
+    input_path = Path(input_path_given)
+    path = Path(item["path"])
+    if input_path.is_dir():
+        try:
+            return path.relative_to(input_path).as_posix()
+        except ValueError:
+            pass
+
+    return path.name
+
+
+def get_stable_hash(key: str) -> int:
+    """
+    Returns a 64-bit hash of a key, which is equal across processes, nodes and Python versions.
+    """
+
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "little")
+
+
+def estimate_preset_cost(content) -> float:
+    """
+    Returns the relative cost of rendering a preset, being the amount of rings of its element and pattern.
+
+    The estimate is read from the raw preset, so invalid presets have the cost of a single ring.
+    """
+
+    try:
+        fractions = max(int(content.get("fractions", 1)), 1)
+        pattern = content.get("pattern") or {}
+        cells = int(pattern.get("horizontal", {}).get("amount", 0)) * int(
+            pattern.get("vertical", {}).get("amount", 0)
+        )
+    except (AttributeError, TypeError, ValueError):
+        return 1.0
+
+    return float(fractions * (1 + max(cells, 0)))
+
+
+class ShardPlan:
+    """
+    Shard plan.
+
+    Splits the preset units of a batch over N shards, so N nodes can render one shared input volume without
+    coordinating and without overlap. Units are assigned longest first to the shard with the lowest total
+    estimated cost, with ties broken by a stable hash of the unit key and shard. The assignment only depends on
+    the set of units, so every node computes the same plan.
+
+    Manifests read from stdin can only be read once, so their lines are assigned by the stable hash alone.
+    """
+
+    def __init__(self, index: int, count: int):
+        self.index = index
+        self.count = count
+
+        self.units = 0
+        self.total_units = 0
+        self.estimated_cost = 0.0
+
+        self._assignments: dict = {}
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def select(self, input_path_given: str, input_files, manifest_offset: int = 0):
+        """
+        Yields the input items of the batch assigned to this shard.
+        """
+
+        if isinstance(input_files, PresetManifest):
+            if input_files.path is None:
+                yield from self._select_by_hash(
+                    input_path_given, input_files.read(manifest_offset)
+                )
+                return
+
+            # Only keys and costs are kept, the manifest is read again while rendering
+            self.assign(
+                [
+                    (
+                        get_unit_key(input_path_given, item),
+                        estimate_preset_cost(item.get("content")),
+                    )
+                    for item in input_files.read(manifest_offset)
+                ]
+            )
+            input_files = input_files.read(manifest_offset)
+        else:
+            self.assign(
+                [
+                    (
+                        get_unit_key(input_path_given, item),
+                        estimate_preset_cost(item.get("content")),
+                    )
+                    for item in input_files
+                ]
+            )
+
+        for item in input_files:
+            if self.owns(get_unit_key(input_path_given, item)):
+                yield item
+
+    def assign(self, units: list) -> None:
+        """
+        Assign (key, estimated cost) units to the shards, longest first to the shard with the lowest total cost.
+        """
+
+        shard_costs = [0.0] * self.count
+        for key, cost in sorted(
+            units, key=lambda unit: (-unit[1], get_stable_hash(unit[0]))
+        ):
+            shard = min(
+                range(self.count),
+                key=lambda candidate: (
+                    shard_costs[candidate],
+                    get_stable_hash(f"{candidate}:{key}"),
+                ),
+            )
+            shard_costs[shard] += cost
+            self._assignments[key] = shard + 1
+
+            self.total_units += 1
+            if shard + 1 == self.index:
+                self.units += 1
+                self.estimated_cost += cost
+
+    def owns(self, key: str) -> bool:
+        """
+        Returns if a unit belongs to this shard. Units unknown to the plan, e.g. files created in watch mode, are
+        assigned by their stable hash.
+        """
+
+        shard = self._assignments.get(key)
+        if shard is None:
+            shard = get_stable_hash(key) % self.count + 1
+
+        return shard == self.index
+
+    def _select_by_hash(self, input_path_given: str, input_files):
+        for item in input_files:
+            self.total_units += 1
+            key = get_unit_key(input_path_given, item)
+            if self.owns(key):
+                self.units += 1
+                self.estimated_cost += estimate_preset_cost(item.get("content"))
+                yield item
+
+
+def write_shard_manifest(
+    path: Path, shard_plan: ShardPlan, input_path_given: str, checkpoint_journal
+) -> None:
+    """
+    Write the completion manifest of a shard, once all of its presets are written.
+    """
+
+    manifest = {
+        "shard": str(shard_plan),
+        "input": str(input_path_given),
+        "units": shard_plan.units,
+        "total_units": shard_plan.total_units,
+        "estimated_cost": shard_plan.estimated_cost,
+        "completed": checkpoint_journal.completed,
+        "failed": checkpoint_journal.failed,
+        "skipped": checkpoint_journal.skipped,
+        "complete": checkpoint_journal.failed == 0,
+        "journal": checkpoint_journal.path.name,
+        "time": datetime.datetime.now().isoformat(),
+    }
+
+    with atomic_output_path(path) as temporary_path:
+        temporary_path.write_text(json.dumps(manifest, indent=2) + "\n")
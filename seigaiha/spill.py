@@ -0,0 +1,211 @@
+import tempfile
+from itertools import chain
+
+import numpy as np
+
+from seigaiha.paths import PATH_BATCH_RINGS
+
+# Vertices per memory-mapped segment, 4M vertices take 64 MB
+SPILL_SEGMENT_SIZE = 1 << 22
+
+
+class PatternSpill:
+    """
+    Pattern spill.
+
+    Stores the cells of a pattern, grouped by row, with their ring vertices in memory-mapped temporary files.
+    Cells are appended and read back one row at a time, so only a single row of cells has to fit in memory.
+    The temporary files are removed once the spill is no longer referenced.
+    """
+
+    def __init__(self, segment_size: int = SPILL_SEGMENT_SIZE):
+        self.segment_size = segment_size
+
+        self._segments: list = []
+        self._segment_fill = 0
+        self._colours: list = []
+        self._colour_indices: dict = {}
+        self._rows: list = []
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __iter__(self):
+        return self.rows()
+
+    @classmethod
+    def from_rows(cls, rows, segment_size: int = SPILL_SEGMENT_SIZE):
+        """
+        Returns a spill with all rows of an iterable of pattern rows.
+        """
+        pattern_spill = cls(segment_size)
+        for row_cells in rows:
+            pattern_spill.append_row(row_cells)
+
+        return pattern_spill
+
+    def append_row(self, row_cells: list) -> None:
+        """
+        Append a row of pattern cells.
+        """
+        cell_rings: list = []
+        ring_lengths: list = []
+        ring_counts: list = []
+        images: dict = {}
+        for column, cell in enumerate(row_cells):
+            rings = [ring for ring in cell["polygon"] if not isinstance(ring, str)]
+            cell_rings.append(rings)
+            ring_lengths.extend(len(ring) for ring in rings)
+            ring_counts.append(len(rings))
+
+            cell_images = [image for image in cell["polygon"] if isinstance(image, str)]
+            if cell_images:
+                images[column] = cell_images
+
+        vertex_count = sum(ring_lengths)
+        segment_index, segment_start = self._allocate(vertex_count)
+        self._segments[segment_index][1][
+            segment_start : segment_start + vertex_count
+        ] = np.fromiter(
+            chain.from_iterable(chain.from_iterable(chain.from_iterable(cell_rings))),
+            dtype=np.float64,
+            count=vertex_count * 2,
+        ).reshape(
+            vertex_count, 2
+        )
+
+        self._rows.append(
+            {
+                "segment": segment_index,
+                "start": segment_start,
+                "vertices": vertex_count,
+                "ring_lengths": np.asarray(ring_lengths, dtype=np.int32),
+                "ring_counts": np.asarray(ring_counts, dtype=np.int32),
+                "images": images,
+                "broken": np.asarray(
+                    [cell["broken"] is True for cell in row_cells], dtype=bool
+                ),
+                "colour": np.asarray(
+                    [self._colour_index(cell["colour"]) for cell in row_cells],
+                    dtype=np.int32,
+                ),
+            }
+        )
+
+    def row(self, row: int) -> list:
+        """
+        Returns a row of pattern cells.
+        """
+        stored_row = self._rows[row]
+        segment_start = stored_row["start"]
+        coordinates = (
+            self._segments[stored_row["segment"]][1][
+                segment_start : segment_start + stored_row["vertices"]
+            ]
+            .ravel()
+            .tolist()
+        )
+        ring_lengths = stored_row["ring_lengths"].tolist()
+
+        row_cells = []
+        vertex = 0
+        ring = 0
+        for column, (ring_count, is_broken, colour_index) in enumerate(
+            zip(
+                stored_row["ring_counts"].tolist(),
+                stored_row["broken"].tolist(),
+                stored_row["colour"].tolist(),
+            )
+        ):
+            cell_coordinates: list = []
+            for ring_length in ring_lengths[ring : ring + ring_count]:
+                ring_coordinates = coordinates[2 * vertex : 2 * (vertex + ring_length)]
+                cell_coordinates.append(
+                    list(zip(ring_coordinates[0::2], ring_coordinates[1::2]))
+                )
+                vertex += ring_length
+            ring += ring_count
+            cell_coordinates.extend(stored_row["images"].get(column, []))
+
+            row_cells.append(
+                {
+                    "polygon": cell_coordinates,
+                    "broken": is_broken,
+                    "colour": self._colours[colour_index],
+                }
+            )
+
+        return row_cells
+
+    def rows(self, row_start: int = 0, row_stop: int | None = None):
+        """
+        Yields the pattern rows from row start up to row stop.
+        """
+        for row in range(row_start, len(self._rows) if row_stop is None else row_stop):
+            yield self.row(row)
+
+    def _allocate(self, vertex_count: int) -> tuple:
+        # A row is stored contiguously, so start a new segment if it does not fit in the current one
+        if not self._segments or self._segment_fill + vertex_count > len(
+            self._segments[-1][1]
+        ):
+            segment_file = tempfile.TemporaryFile(prefix="seigaiha-spill-")
+            segment = np.memmap(
+                segment_file,
+                dtype=np.float64,
+                mode="w+",
+                shape=(max(self.segment_size, vertex_count, 1), 2),
+            )
+            self._segments.append((segment_file, segment))
+            self._segment_fill = 0
+
+        segment_start = self._segment_fill
+        self._segment_fill += vertex_count
+
+        return len(self._segments) - 1, segment_start
+
+    def _colour_index(self, colours: list) -> int:
+        # Cells share the same colour lists, so store every list once
+        colour_key = id(colours)
+        if colour_key not in self._colour_indices:
+            self._colour_indices[colour_key] = len(self._colours)
+            self._colours.append(colours)
+
+        return self._colour_indices[colour_key]
+
+
+class PatternDocument:
+    """
+    Pattern document.
+
+    SVG document of which the pattern rows are serialised while it is iterated, so the document never has to
+    be held in memory as a whole.
+    """
+
+    def __init__(self, svg_maker, svg_string: str, pattern_spill: PatternSpill):
+        self.svg_maker = svg_maker
+        self.pattern_spill = pattern_spill
+        self.head, self.tail = svg_string.split(svg_maker.poly_placeholder, 1)
+
+    def __iter__(self):
+        yield self.head
+        if self.svg_maker.preset.output.svg.merge_paths:
+            for path_index, path in enumerate(
+                self.svg_maker.xml_iter_merged_pattern(
+                    self.pattern_spill, PATH_BATCH_RINGS
+                )
+            ):
+                if path_index:
+                    yield "\r\n"
+                yield path
+            yield self.tail
+            return
+
+        for row, row_cells in enumerate(self.pattern_spill):
+            if row:
+                yield "\r\n"
+            yield self.svg_maker.xml_create_pattern([row_cells])["string"]
+        yield self.tail
+
+    def __str__(self) -> str:
+        return "".join(self)
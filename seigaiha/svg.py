@@ -1,15 +1,31 @@
+import gzip
+import io
 import json
 import re
 import base64
 import datetime
 import random
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
 import numpy as np
 from cairocffi import CairoError  # type: ignore[import-untyped]
 from cairosvg import svg2png  # type: ignore[import-untyped]
-
-from seigaiha.exception import InvalidViewBoxError, SvgToPngImageError
+from cairosvg.parser import Tree  # type: ignore[import-untyped]
+from cairosvg.surface import PNGSurface  # type: ignore[import-untyped]
+from PIL import Image
+
+from seigaiha.exception import (
+    InvalidViewBoxError,
+    MissingOptionalDependencyError,
+    SvgToPngImageError,
+)
+from seigaiha.helper import atomic_output_path
+from seigaiha.paths import PathBatcher
+from seigaiha.preset import SVG_COMPRESS_LEVELS, Preset
+from seigaiha.rng import PresetRandom
+from seigaiha.sampling import sample_broken_cells
 
 
 def _get_formatted_datetime():
@@ -20,6 +36,36 @@ def _get_formatted_datetime():
     return datetime.datetime.now().strftime("%d-%m-%Y_%H-%M-%S-%f")
 
 
+def _content_parts(content):
+    """
+    Yield the string parts of content, which is either a string or an iterable of strings.
+    """
+
+    if isinstance(content, str):
+        yield content
+        return
+
+    yield from content
+
+
+def _encoded_chunks(content, chunk_size: int = 1 << 20):
+    """
+    Yield UTF-8 encoded chunks of content, without encoding all content at once.
+    """
+
+    for part in _content_parts(content):
+        for chunk_start in range(0, len(part), chunk_size):
+            yield part[chunk_start : chunk_start + chunk_size].encode("utf-8")
+
+
+def _coordinate_decimals(magnitude: float) -> int:
+    """
+    Decimals of coordinates up to a magnitude, at the 16 significant digits a coordinate holds.
+    """
+
+    return max(0, 16 - len(str(int(magnitude))))
+
+
 class SVGmaker:
     """
     SVG maker.
@@ -31,15 +77,31 @@ class SVGmaker:
 
     def __init__(
         self,
-        user_preset: dict,
+        user_preset: Preset,
         image_dimensions: list,
         image_view_box: list = [0, 0, -1, -1],
     ):
         self.preset = user_preset
         self.safe_base_encoded_preset = base64.b64encode(
-            json.dumps(self.preset).encode("utf-8")
+            json.dumps(self.preset.source).encode("utf-8")
         ).decode("utf-8")
 
+        # Random streams, the legacy algorithm uses the global random number generator instead
+        self.preset_random = None
+        if self.preset.rng == "philox":
+            self.preset_random = PresetRandom(self.preset.seed)
+
+        # Path fills by colour, so every colour is formatted once
+        self._path_fills: dict = {}
+
+        # Relative path data by base ring, so every base ring is formatted once
+        self._relative_paths: dict = {}
+
+        # PNG output sizes, rasterised from a single parsed document
+        self.png_sizes = list(self.preset.output.sizes)
+        self._png_trees: dict = {}
+        self._png_trees_lock = threading.Lock()
+
         # Initial image dimensions
         self.width, self.height = image_dimensions
 
@@ -53,39 +115,32 @@ class SVGmaker:
             self.view_box[-2:] = image_dimensions
 
         # Pattern
-        pattern = user_preset.get("pattern", False)
-        if isinstance(pattern, dict):
+        pattern = user_preset.pattern
+        if pattern is not None:
             # Alternate
-            self.repeat_alternate = pattern.get("alternate", 1)
+            self.repeat_alternate = pattern.alternate
 
             # Amount and spacing
-            self.repeat_horizontal = pattern.get(
-                "horizontal", {"amount": None, "spacing": None}
-            )
-            self.repeat_horizontal_amount = self.repeat_horizontal.get("amount", None)
-            self.repeat_horizontal_spacing = self.repeat_horizontal.get("spacing", None)
-            self.repeat_vertical = pattern.get(
-                "vertical", {"amount": None, "spacing": None}
-            )
-            self.repeat_vertical_amount = self.repeat_vertical.get("amount", None)
-            self.repeat_vertical_spacing = self.repeat_vertical.get("spacing", None)
-
-            self.repeat_broken_factor = pattern.get("broken", {"factor": None}).get(
-                "factor"
+            self.repeat_horizontal_amount = pattern.horizontal.amount
+            self.repeat_horizontal_spacing = pattern.horizontal.spacing
+            self.repeat_vertical_amount = pattern.vertical.amount
+            self.repeat_vertical_spacing = pattern.vertical.spacing
+
+            broken = pattern.broken
+            self.repeat_broken_factor = broken.factor if broken else None
+            self.repeat_broken_factor_rounding = (
+                broken.factor_rounding if broken else "round"
             )
-            self.repeat_broken_factor_rounding = pattern.get(
-                "broken", {"factor_rounding": "round"}
-            ).get("factor_rounding")
 
             # Skip edges so they do not contain any broken elements
-            self.repeat_broken_skip_edge = pattern.get(
-                "broken", {"skip_edge": True}
-            ).get("skip_edge")
+            self.repeat_broken_skip_edge = broken.skip_edge if broken else True
+
+            # Spatial distribution of the broken elements
+            self.repeat_broken_strategy = broken.strategy if broken else "uniform"
+            self.repeat_broken_cluster_size = broken.cluster_size if broken else 4
 
             # Image placeholder
-            self.repeat_broken_images = pattern.get("broken", {"images": []}).get(
-                "images"
-            )
+            self.repeat_broken_images = list(broken.images) if broken else []
             if self.repeat_broken_images:
                 for broken_image_index, broken_image in enumerate(
                     self.repeat_broken_images
@@ -119,7 +174,7 @@ class SVGmaker:
                     )
 
             self.is_broken = False
-            self.broken_factor = 0
+            self.broken_factor: int | float = 0
             if self.repeat_broken_factor:
                 self.is_broken = True
                 if self.repeat_broken_factor > 0:
@@ -144,7 +199,51 @@ class SVGmaker:
                 self.calculated_single_polygon_width_for_pattern / self.width
             )
 
+    def __getstate__(self):
+        # Caches, parsed documents and their locks stay in this process
+        state = self.__dict__.copy()
+        state["_path_fills"] = {}
+        state["_relative_paths"] = {}
+        state["_png_trees"] = {}
+        del state["_png_trees_lock"]
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._png_trees_lock = threading.Lock()
+
     def xml_initialise(self) -> str:
+        return self._xml_document(
+            str(self.width) + "px", str(self.height) + "px", self.view_box
+        )
+
+    def xml_initialise_pattern(self) -> str:
+        """
+        Init XML pattern.
+        """
+        return self._xml_document(
+            str(self.pattern_width) + "px",
+            str(self.pattern_height) + "px",
+            self.pattern_view_box(),
+        )
+
+    def xml_initialise_seamless(self, tile_view_box: list) -> str:
+        """
+        Init XML seamless tile, at the same scale as the pattern.
+        """
+        scale_x, scale_y, _, _ = self.pattern_viewport_transform()
+
+        return self._xml_document(
+            str(tile_view_box[2] * scale_x) + "px",
+            str(tile_view_box[3] * scale_y) + "px",
+            tile_view_box,
+        )
+
+    def _xml_document(self, width: str, height: str, view_box: list) -> str:
+        """
+        XML document with the polygon placeholder.
+        """
         xml_string = '<?xml version="1.0" encoding="UTF-8"?>\r\n'
         xml_string += (
             '<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN" '
@@ -152,21 +251,14 @@ class SVGmaker:
         )
         xml_string += (
             '<svg version="1.1" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" preserveAspectRatio="'
-            + self.preset.get("output", {})
-            .get("svg", {})
-            .get("preserveAspectRatio", "xMinYMin meet")
+            + self.preset.output.svg.preserve_aspect_ratio
             + '" '
         )
-        xml_string += (
-            'width="' + str(self.width) + 'px" height="' + str(self.height) + 'px" '
-        )
-        xml_string += 'viewBox="' + self._join_view_box_list(self.view_box) + '">\r\n'
+        xml_string += 'width="' + width + '" height="' + height + '" '
+        xml_string += 'viewBox="' + self._join_view_box_list(view_box) + '">\r\n'
         xml_string += (
             '<g style="shape-rendering: '
-            + self.preset.get("output", {})
-            .get("svg", {})
-            .get("style", {})
-            .get("shape-rendering", "geometricPrecision")
+            + self.preset.output.svg.shape_rendering
             + ';">\r\n'
         )
         xml_string += self.poly_placeholder
@@ -184,55 +276,109 @@ class SVGmaker:
 
         return xml_string
 
-    def xml_initialise_pattern(self) -> str:
+    def pattern_view_box(self) -> list:
         """
-        Init XML pattern.
+        View box of the pattern.
+        """
+        return [
+            self.view_box[0] + self.width,
+            self.view_box[1] + self.height,
+            self.view_box[2] * self.repeat_horizontal_amount - self.width,
+            self.view_box[3] / self.repeat_vertical_amount,
+        ]
+
+    def pattern_viewport_transform(self) -> tuple:
+        """
+        Returns the scale and offset (sx, sy, ox, oy) mapping the pattern view box to pixels.
         """
-        view_box = self.view_box
-        view_box[0] = view_box[0] + self.width
-        view_box[1] = view_box[1] + self.height
-        view_box[2] = view_box[2] * self.repeat_horizontal_amount - self.width
-        view_box[3] = view_box[3] / self.repeat_vertical_amount
+        return self.viewport_transform(
+            [self.pattern_width, self.pattern_height], self.pattern_view_box()
+        )
+
+    def viewport_transform(self, canvas_size: list, view_box: list) -> tuple:
+        """
+        Returns the scale and offset (sx, sy, ox, oy) mapping a view box to a canvas of pixels.
+        """
+        scale_x = canvas_size[0] / view_box[2]
+        scale_y = canvas_size[1] / view_box[3]
+
+        align, _, meet_or_slice = (
+            self.preset.output.svg.preserve_aspect_ratio.partition(" ")
+        )
+        if align == "none":
+            return scale_x, scale_y, 0.0, 0.0
+
+        scale = min(scale_x, scale_y)
+        if meet_or_slice == "slice":
+            scale = max(scale_x, scale_y)
 
+        align_factors = {"Min": 0.0, "Mid": 0.5, "Max": 1.0}
+        offset_x = (canvas_size[0] - view_box[2] * scale) * align_factors[align[1:4]]
+        offset_y = (canvas_size[1] - view_box[3] * scale) * align_factors[align[5:8]]
+
+        return scale, scale, offset_x, offset_y
+
+    def xml_initialise_tile(
+        self, tile_view_box: list, tile_size: int, canvas_size: list
+    ) -> str:
+        """
+        Init XML tile, showing the part of the pattern canvas within the tile view box.
+        """
         xml_string = '<?xml version="1.0" encoding="UTF-8"?>\r\n'
         xml_string += (
-            '<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN" '
-            '"http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">\r\n'
+            '<svg version="1.1" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+            'width="' + str(tile_size) + 'px" height="' + str(tile_size) + 'px" '
         )
+        xml_string += 'viewBox="' + self._join_view_box_list(tile_view_box) + '">\r\n'
         xml_string += (
-            '<svg version="1.1" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" preserveAspectRatio="'
-            + self.preset.get("output", {})
-            .get("svg", {})
-            .get("preserveAspectRatio", "xMinYMin meet")
+            '<svg preserveAspectRatio="'
+            + self.preset.output.svg.preserve_aspect_ratio
             + '" '
         )
         xml_string += (
-            'width="'
-            + str(self.pattern_width)
-            + 'px" '
-            + 'height="'
-            + str(self.pattern_height)
-            + 'px" '
+            'x="0" y="0" width="'
+            + str(canvas_size[0])
+            + '" height="'
+            + str(canvas_size[1])
+            + '" '
+        )
+        xml_string += (
+            'viewBox="' + self._join_view_box_list(self.pattern_view_box()) + '">\r\n'
         )
-        xml_string += 'viewBox="' + self._join_view_box_list(view_box) + '">\r\n'
         xml_string += (
             '<g style="shape-rendering: '
-            + self.preset.get("output", {})
-            .get("svg", {})
-            .get("style", {})
-            .get("shape-rendering", "geometricPrecision")
+            + self.preset.output.svg.shape_rendering
             + ';">\r\n'
         )
         xml_string += self.poly_placeholder
         xml_string += "</g>\r\n"
+        xml_string += "</svg>\r\n"
+        xml_string += "</svg>"
+
+        return xml_string
+
+    def xml_image_tile(self, tile_size: int, png_bytes: bytes) -> str:
+        """
+        XML tile showing a PNG image of the tile.
+        """
+        xml_string = '<?xml version="1.0" encoding="UTF-8"?>\r\n'
         xml_string += (
-            "<desc>"
-            + self.svg_description
-            + " | Created at: "
-            + _get_formatted_datetime()
-            + " | Options: "
-            + self.safe_base_encoded_preset
-            + "</desc>"
+            '<svg version="1.1" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+            'width="' + str(tile_size) + 'px" height="' + str(tile_size) + 'px" '
+        )
+        xml_string += (
+            'viewBox="'
+            + self._join_view_box_list([0, 0, tile_size, tile_size])
+            + '">\r\n'
+        )
+        xml_string += (
+            '<image x="0" y="0" width="'
+            + str(tile_size)
+            + '" height="'
+            + str(tile_size)
+            + '" xlink:href="data:image/png;base64,'
+            + base64.b64encode(png_bytes).decode("utf-8")
+            + '"/>\r\n'
         )
         xml_string += "</svg>"
 
@@ -241,11 +387,18 @@ class SVGmaker:
     def xml_polygon_points(self, polygons_and_colours: list):
         """Create polygon segments"""
 
+        if self.preset.output.svg.merge_paths:
+            path_batcher = PathBatcher(self)
+            path_batcher.add_cells(polygons_and_colours)
+
+            return "".join(path_batcher.flush())
+
         xml_final = ""
         for _, part in enumerate(polygons_and_colours):
             xml_poly = "<g>"
             poly = part["polygon"]
             colours = part["colour"]
+            base_rings = part.get("base_rings")
 
             for current_index_polygon, poly_slice in enumerate(poly):
                 # Check if image was substituted in broken polygon
@@ -253,26 +406,98 @@ class SVGmaker:
                     xml_poly += poly_slice
                     continue
 
-                polygon_hexadecimal_colours = self.rgb_to_hexadecimal_notation(
-                    colours[current_index_polygon][0],
-                    colours[current_index_polygon][1],
-                    colours[current_index_polygon][2],
-                )
-
                 xml_poly += (
-                    '<path d="M'
-                    + " ".join("%s,%s" % tup for tup in poly_slice)
-                    + 'Z" fill="'
-                    + polygon_hexadecimal_colours
-                    + '" fill-opacity="'
-                    + str(colours[current_index_polygon][3])
-                    + '"/>'
+                    '<path d="'
+                    + self._ring_path(
+                        poly_slice,
+                        (
+                            base_rings[current_index_polygon]
+                            if base_rings is not None
+                            else None
+                        ),
+                    )
+                    + self._path_fill(colours[current_index_polygon])
                 )
             xml_poly += "</g>"
             xml_final += xml_poly
 
         return xml_final
 
+    def _ring_path(self, ring: list, base_ring: list | None = None) -> str:
+        """
+        Path data of a ring, without closing it.
+
+        With relative paths, a ring translated from a base ring only has its first vertex formatted, followed by the
+        relative path of the base ring, which is formatted once.
+        """
+        if (
+            base_ring is None
+            or len(base_ring) < 2
+            or not self.preset.output.svg.relative_paths
+        ):
+            return "M" + " ".join("%s,%s" % tup for tup in ring)
+
+        # The base ring is kept with its path, so its id is not reused
+        relative_path = self._relative_paths.get(id(base_ring))
+        if relative_path is None or relative_path[0] is not base_ring:
+            relative_path = (base_ring, self._relative_ring_path(base_ring))
+            self._relative_paths[id(base_ring)] = relative_path
+
+        return "M%s,%s" % ring[0] + relative_path[1]
+
+    def _relative_ring_path(self, base_ring: list) -> str:
+        """
+        Relative path data of a base ring, following its first vertex.
+
+        Offsets are rounded to the decimals of the largest absolute coordinates of the pattern. Every vertex is
+        rounded relative to the first vertex, so rounding errors do not add up along the ring.
+        """
+        view_box = self.pattern_view_box()
+        decimals = _coordinate_decimals(
+            max(
+                abs(view_box[0]),
+                abs(view_box[1]),
+                abs(view_box[0] + view_box[2]),
+                abs(view_box[1] + view_box[3]),
+            )
+        )
+
+        first_x, first_y = base_ring[0]
+        offsets = [
+            (round(vertex_x - first_x, decimals), round(vertex_y - first_y, decimals))
+            for vertex_x, vertex_y in base_ring
+        ]
+
+        # Adding zero turns negative zero into zero
+        return "l" + " ".join(
+            "%s,%s"
+            % (
+                round(offset_x - previous_x, decimals) + 0.0,
+                round(offset_y - previous_y, decimals) + 0.0,
+            )
+            for (previous_x, previous_y), (offset_x, offset_y) in zip(
+                offsets, offsets[1:]
+            )
+        )
+
+    def _path_fill(self, colour) -> str:
+        """End of a path with its fill, formatted once per colour"""
+
+        # Opacities of equal value but different type are formatted differently
+        colour_key = (colour, type(colour[3]))
+        path_fill = self._path_fills.get(colour_key)
+        if path_fill is None:
+            path_fill = (
+                'Z" fill="'
+                + self.rgb_to_hexadecimal_notation(colour[0], colour[1], colour[2])
+                + '" fill-opacity="'
+                + str(colour[3])
+                + '"/>'
+            )
+            self._path_fills[colour_key] = path_fill
+
+        return path_fill
+
     def xml_setup_pattern(self):
         """Setup pattern"""
         x_linspace = np.linspace(
@@ -300,66 +525,107 @@ class SVGmaker:
             self.repeat_vertical_amount + 1,
         ).tolist()[:-1]
 
-        pattern_list = [[] for _ in y_linspace]
-        for current_y_index, _ in enumerate(y_linspace):
-            ix_list = []
-            xll = x_linspace
-            if current_y_index % 2 != 0:
-                xll = x_linspace_alt
-            for _, current_x_value in enumerate(xll):
-                ix_list.append(
-                    (
-                        self.single_polygon_x_center + current_x_value,
-                        self.single_polygon_y_center + y_linspace[current_y_index],
-                        {"broken": False, "edge": False, "invisible_edge": False},
-                    )
-                )
+        x_positions = [self.single_polygon_x_center + v for v in x_linspace]
+        x_positions_alt = [self.single_polygon_x_center + v for v in x_linspace_alt]
+        y_positions = [self.single_polygon_y_center + v for v in y_linspace]
 
-            pattern_list[current_y_index] = ix_list
+        pattern_list = [
+            [
+                (
+                    x_position,
+                    y_position,
+                    {"broken": False, "edge": False, "invisible_edge": False},
+                )
+                for x_position in (
+                    x_positions_alt if current_y_index % 2 != 0 else x_positions
+                )
+            ]
+            for current_y_index, y_position in enumerate(y_positions)
+        ]
 
         x_boundary = {"low": pattern_list[0][0][0], "high": pattern_list[-2][-1][0]}
         y_boundary = {"low": pattern_list[1][0][1], "high": pattern_list[-1][-1][1]}
 
-        total_visible_count = 0
-        complete_index_collection = []
-        non_edge_index_collection = []
-        for row, item in enumerate(pattern_list):
-            for column, coord_tuple_collection in enumerate(item):
-                if (
-                    coord_tuple_collection[0] < x_boundary["low"]
-                    or coord_tuple_collection[0] > x_boundary["high"]
-                    or coord_tuple_collection[1] < y_boundary["low"]
-                    or coord_tuple_collection[1] > y_boundary["high"]
-                ):
-                    pattern_list[row][column][-1]["edge"] = True
-                    pattern_list[row][column][-1]["invisible_edge"] = True
-                    continue
-
-                if (
-                    coord_tuple_collection[0] <= x_boundary["low"]
-                    or coord_tuple_collection[0] >= x_boundary["high"]
-                    or coord_tuple_collection[1] <= y_boundary["low"]
-                    or coord_tuple_collection[1] >= y_boundary["high"]
-                ):
-
-                    pattern_list[row][column][-1]["edge"] = True
-                    complete_index_collection.append((row, column))
+        # Classify all cells at once, on arrays of their positions
+        xs = np.where(
+            (np.arange(len(y_positions)) % 2 != 0)[:, None],
+            np.asarray(x_positions_alt)[None, :],
+            np.asarray(x_positions)[None, :],
+        )
+        ys = np.broadcast_to(np.asarray(y_positions)[:, None], xs.shape)
 
-                    total_visible_count += 1
-                    continue
+        is_invisible = (
+            (xs < x_boundary["low"])
+            | (xs > x_boundary["high"])
+            | (ys < y_boundary["low"])
+            | (ys > y_boundary["high"])
+        )
+        is_edge = (
+            is_invisible
+            | (xs <= x_boundary["low"])
+            | (xs >= x_boundary["high"])
+            | (ys <= y_boundary["low"])
+            | (ys >= y_boundary["high"])
+        )
 
-                total_visible_count += 1
-                non_edge_index_collection.append((row, column))
-                complete_index_collection.append((row, column))
+        for row, column in np.argwhere(is_edge).tolist():
+            pattern_list[row][column][-1]["edge"] = True
+        for row, column in np.argwhere(is_invisible).tolist():
+            pattern_list[row][column][-1]["invisible_edge"] = True
 
         if self.is_broken is False:
             return pattern_list
 
+        is_visible = ~is_invisible
+        is_non_edge = ~is_edge
+        total_visible_count = int(np.count_nonzero(is_visible))
+
         max_amount_broken_polygons = int(
             self._round_value(self.broken_factor * total_visible_count)
         )
 
-        random.seed(self.preset.get("seed", None))
+        if self.preset_random is None and self.repeat_broken_strategy == "uniform":
+            sampled_broken_list = self._legacy_sample_broken_cells(
+                [tuple(cell) for cell in np.argwhere(is_visible).tolist()],
+                [tuple(cell) for cell in np.argwhere(is_non_edge).tolist()],
+                max_amount_broken_polygons,
+            )
+        else:
+            # Strategies other than uniform always draw from the seeded streams
+            preset_random = self.preset_random or PresetRandom(self.preset.seed)
+            row_stride = xs.shape[1]
+            sampled_broken_indices = sample_broken_cells(
+                self.repeat_broken_strategy,
+                preset_random,
+                np.flatnonzero(
+                    is_non_edge if self.repeat_broken_skip_edge else is_visible
+                ),
+                max_amount_broken_polygons,
+                xs.ravel() / self.width,
+                ys.ravel() / self.width,
+                self.repeat_broken_cluster_size,
+            )
+            sampled_broken_list = [
+                divmod(broken_index, row_stride)
+                for broken_index in sampled_broken_indices.tolist()
+            ]
+
+        for broken_index_first_layer, broken_index_second_layer in sampled_broken_list:
+            pattern_list[broken_index_first_layer][broken_index_second_layer][-1][
+                "broken"
+            ] = True
+
+        return pattern_list
+
+    def _legacy_sample_broken_cells(
+        self,
+        complete_index_collection: list,
+        non_edge_index_collection: list,
+        max_amount_broken_polygons: int,
+    ) -> list:
+        """Sample broken cells with the global random number generator"""
+
+        random.seed(self.preset.seed)
         sampled_broken_list = random.sample(
             complete_index_collection, max_amount_broken_polygons
         )
@@ -372,16 +638,16 @@ class SVGmaker:
                 non_edge_index_collection, max_amount_broken_polygons
             )
 
-        for broken_index_first_layer, broken_index_second_layer in sampled_broken_list:
-            pattern_list[broken_index_first_layer][broken_index_second_layer][-1][
-                "broken"
-            ] = True
-
-        return pattern_list
+        return sampled_broken_list
 
     def xml_create_pattern(self, polygons: list):
         """Create XML pattern"""
 
+        if self.preset.output.svg.merge_paths:
+            xml_pattern = list(self.xml_iter_merged_pattern(polygons))
+
+            return {"paths": xml_pattern, "string": "\r\n".join(xml_pattern)}
+
         xml_pattern = []
         for current_polygon in polygons:
             xml_pattern.append(
@@ -390,6 +656,44 @@ class SVGmaker:
 
         return {"paths": xml_pattern, "string": "\r\n".join(xml_pattern)}
 
+    def xml_iter_merged_pattern(self, rows, batch_rings: int | None = None):
+        """
+        Yield the compound paths of pattern rows, merged by colour.
+
+        With batch rings, merging starts over after every batch of rings, so rows are serialised while they are read.
+        """
+
+        path_batcher = PathBatcher(self)
+        for row_cells in rows:
+            path_batcher.add_cells(row_cells)
+            if batch_rings is not None and path_batcher.rings >= batch_rings:
+                yield from path_batcher.flush()
+
+        yield from path_batcher.flush()
+
+    def xml_create_native_pattern(
+        self, polygons: list, tile_view_box: list, pattern_area: list
+    ) -> str:
+        """Create XML pattern definition of a single repeating unit, filling the pattern area"""
+
+        xml_pattern = (
+            '<defs><pattern id="seigaiha" patternUnits="userSpaceOnUse" '
+            'x="' + str(tile_view_box[0]) + '" '
+            'y="' + str(tile_view_box[1]) + '" '
+            'width="' + str(tile_view_box[2]) + '" '
+            'height="' + str(tile_view_box[3]) + '">\r\n'
+        )
+        xml_pattern += self.xml_create_pattern(polygons)["string"]
+        xml_pattern += "\r\n</pattern></defs>\r\n"
+        xml_pattern += (
+            '<rect x="' + str(pattern_area[0]) + '" '
+            'y="' + str(pattern_area[1]) + '" '
+            'width="' + str(pattern_area[2]) + '" '
+            'height="' + str(pattern_area[3]) + '" fill="url(#seigaiha)"/>\r\n'
+        )
+
+        return xml_pattern
+
     def xml_result(self, polygon_output) -> str:
         svg_str = self.xml_initialise()
         svg_poly = self.xml_polygon_points(polygon_output)
@@ -406,34 +710,193 @@ class SVGmaker:
     ) -> Path:
         output_extension_with_leading_dot = "." + output_extension.lstrip(".")
         if output_path.is_dir():
-            output_file = output_path.joinpath(
-                input_file.stem + output_extension_with_leading_dot
-            )
+            output_file = str(output_path.joinpath(input_file.stem))
         else:
-            output_file = Path(
-                f"{output_path.with_suffix('')}{output_extension_with_leading_dot}"
-            )
+            output_file = str(output_path.with_suffix(""))
 
         # Use file prefix in output filename
-        output_file = Path(
-            f"{output_file.with_suffix('')}{'_' + file_prefix if file_prefix else ''}{output_extension_with_leading_dot}"
-        )
+        if file_prefix:
+            output_file += "_" + file_prefix
 
         if unique_output_file_name:
-            output_file = f"{output_file.with_suffix('')}_{_get_formatted_datetime()}{output_extension_with_leading_dot}"
+            output_file += "_" + _get_formatted_datetime()
 
-        return output_file
+        return Path(output_file + output_extension_with_leading_dot)
 
     def save_svg(self, content, output_path: Path) -> None:
-        text_file = open(str(output_path), "wt")
-        text_file.write(content)
-        text_file.close()
+        with atomic_output_path(output_path) as temporary_path:
+            text_file = open(str(temporary_path), "wt")
+            for part in _content_parts(content):
+                text_file.write(part)
+            text_file.close()
+
+    def save_svgz(self, content, output_path: Path) -> None:
+        with atomic_output_path(output_path) as temporary_path:
+            with gzip.open(
+                str(temporary_path),
+                "wb",
+                compresslevel=self._svg_compress_level("svgz"),
+            ) as compressed_file:
+                for chunk in _encoded_chunks(content):
+                    compressed_file.write(chunk)
+
+    def save_svg_br(self, content, output_path: Path) -> None:
+        try:
+            import brotli  # type: ignore[import-not-found,import-untyped,unused-ignore]
+        except ImportError:
+            raise MissingOptionalDependencyError("brotli", "svg.br")
 
-    def save_png(self, content, output_path: Path) -> None:
+        compressor = brotli.Compressor(
+            mode=brotli.MODE_TEXT, quality=self._svg_compress_level("svg.br")
+        )
+        with atomic_output_path(output_path) as temporary_path:
+            with open(str(temporary_path), "wb") as compressed_file:
+                for chunk in _encoded_chunks(content):
+                    compressed_file.write(compressor.process(chunk))
+                compressed_file.write(compressor.finish())
+
+    def save_svg_zst(self, content, output_path: Path) -> None:
         try:
-            svg2png(bytestring=content, write_to=str(output_path))
-        except CairoError as e:
-            raise SvgToPngImageError(str(e))
+            import zstandard  # type: ignore[import-not-found,import-untyped,unused-ignore]
+        except ImportError:
+            raise MissingOptionalDependencyError("zstandard", "svg.zst")
+
+        compressor = zstandard.ZstdCompressor(level=self._svg_compress_level("svg.zst"))
+        with atomic_output_path(output_path) as temporary_path:
+            with open(str(temporary_path), "wb") as compressed_file:
+                with compressor.stream_writer(compressed_file) as stream_writer:
+                    for chunk in _encoded_chunks(content):
+                        stream_writer.write(chunk)
+
+    def sized_output_path(self, output_path: Path, size: int | float) -> Path:
+        """
+        Returns the output path of an output size.
+        """
+        output_path = Path(output_path)
+
+        return output_path.with_name(f"{output_path.stem}_{size}{output_path.suffix}")
+
+    def save_png(
+        self, content, output_path: Path, size: int | float | None = None
+    ) -> None:
+        png_options = self.preset.output.png
+
+        with atomic_output_path(output_path) as temporary_path:
+            try:
+                if size is not None:
+                    png_bytes = self._rasterise(content, size)
+                    if png_options is None:
+                        temporary_path.write_bytes(png_bytes)
+                        return
+
+                    png_image: Image.Image = Image.open(io.BytesIO(png_bytes))
+                else:
+                    # Rasterising needs the document as a whole
+                    if not isinstance(content, str):
+                        content = str(content)
+
+                    if png_options is None:
+                        svg2png(bytestring=content, write_to=str(temporary_path))
+                        return
+
+                    png_image = Image.open(io.BytesIO(svg2png(bytestring=content)))
+            except CairoError as e:
+                raise SvgToPngImageError(str(e))
+
+            self._write_png_image(png_image, temporary_path)
+
+    def save_png_image(self, png_image: Image.Image, output_path: Path) -> None:
+        """
+        Save a raster image as PNG, with the PNG options of the preset.
+        """
+        with atomic_output_path(output_path) as temporary_path:
+            self._write_png_image(png_image, temporary_path)
+
+    def _write_png_image(self, png_image: Image.Image, path: Path) -> None:
+        png_options = self.preset.output.png
+        if png_options is None:
+            png_image.save(str(path), format="PNG")
+            return
+
+        # Patterns often have few colours, which fit in a much smaller palette image
+        palette_colours = png_options.colours
+        if palette_colours:
+            png_image = png_image.quantize(
+                colors=palette_colours, method=Image.Quantize.FASTOCTREE
+            )
+
+        png_image.save(
+            str(path),
+            format="PNG",
+            compress_level=png_options.compress_level,
+        )
+
+    def _rasterise(self, content, size: int | float) -> bytes:
+        """Rasterise content to PNG at an output size, relative to the resolution"""
+
+        output = io.BytesIO()
+        with self._shared_png_tree(content) as tree:
+            PNGSurface(
+                tree, output, 96, scale=size / self.preset.output.resolution
+            ).finish()
+
+        return output.getvalue()
+
+    def hold_png_tree(self, content, count: int) -> None:
+        """
+        Keeps the parsed document of content for PNG sizes, until it is released as many times as it is held.
+
+        Sizes of content which is not held are rendered from a document of their own.
+        """
+
+        with self._png_trees_lock:
+            shared_tree = self._png_trees.setdefault(
+                id(content),
+                {
+                    "content": content,
+                    "tree": None,
+                    "lock": threading.Lock(),
+                    "holds": 0,
+                },
+            )
+            shared_tree["holds"] += count
+
+    def release_png_tree(self, content) -> None:
+        """
+        Releases a single hold of the parsed document of content, which is dropped once no holds remain.
+        """
+
+        with self._png_trees_lock:
+            shared_tree = self._png_trees.get(id(content))
+            if shared_tree is None:
+                return
+
+            shared_tree["holds"] -= 1
+            if shared_tree["holds"] <= 0:
+                del self._png_trees[id(content)]
+
+    @contextmanager
+    def _shared_png_tree(self, content):
+        """
+        Yields the parsed document of content, which is parsed once for all PNG sizes while it is held.
+
+        Rendering changes the parsed document, so sizes are rendered one at a time.
+        """
+
+        with self._png_trees_lock:
+            shared_tree = self._png_trees.get(id(content))
+
+        if shared_tree is None:
+            yield Tree(bytestring=content if isinstance(content, str) else str(content))
+            return
+
+        with shared_tree["lock"]:
+            if shared_tree["tree"] is None:
+                shared_tree["tree"] = Tree(
+                    bytestring=content if isinstance(content, str) else str(content)
+                )
+
+            yield shared_tree["tree"]
 
     # noinspection PyMethodMayBeStatic
     def _join_view_box_list(self, view_box, deli=" ") -> str:
@@ -530,6 +993,15 @@ class SVGmaker:
 
         return view_box
 
+    def _svg_compress_level(self, extension: str) -> int:
+        """Compression level for compressed SVG output"""
+
+        compress_level = self.preset.output.svg.compress_level
+        if compress_level is None:
+            return SVG_COMPRESS_LEVELS[extension][2]
+
+        return compress_level
+
     # noinspection PyMethodMayBeStatic
     def _round_value(self, val) -> int:
         match self.repeat_broken_factor_rounding:
@@ -0,0 +1,258 @@
+from contextlib import ExitStack
+from pathlib import Path
+
+import cairocffi  # type: ignore[import-untyped]
+from cairosvg.parser import Tree  # type: ignore[import-untyped]
+from cairosvg.surface import Surface  # type: ignore[import-untyped]
+
+from seigaiha.exception import VectorOutputError
+from seigaiha.helper import atomic_output_path
+from seigaiha.svg import _get_formatted_datetime
+
+VECTOR_EXTENSIONS = ["pdf", "eps"]
+
+# Points per pixel, as CairoSVG draws PDF and EPS output at 96 DPI
+POINTS_PER_PIXEL = 72 / 96
+
+
+class _ImageSurface(Surface):
+    """
+    Recording surface of a broken image, in the user space of the page it is drawn on.
+    """
+
+    device_units_per_user_units = 1
+
+    def _create_surface(self, width, height):
+        return (
+            cairocffi.RecordingSurface(cairocffi.CONTENT_COLOR_ALPHA, None),
+            width,
+            height,
+        )
+
+
+class VectorPage:
+    """
+    Vector page.
+
+    Page of a PDF or EPS document, drawing the rings of pattern cells straight onto a cairo surface in painting
+    order. Rows are drawn one at a time, so the cells of a pattern spill are never held in memory as a whole.
+
+    With a repeat of (tile view box, area), the cells form a single tile, which is repeated over the area.
+    """
+
+    def __init__(
+        self,
+        svg_maker,
+        size: list,
+        view_box: list,
+        rows,
+        repeat: tuple | None = None,
+    ):
+        self.svg_maker = svg_maker
+        self.size = size
+        self.view_box = view_box
+        self.rows = rows
+        self.repeat = repeat
+
+    @property
+    def page_size(self) -> tuple:
+        """
+        Page size in points.
+        """
+        return self.size[0] * POINTS_PER_PIXEL, self.size[1] * POINTS_PER_PIXEL
+
+    def draw(self, context) -> None:
+        """
+        Draw the page onto a cairo context of the page size.
+        """
+        scale_x, scale_y, offset_x, offset_y = self.svg_maker.viewport_transform(
+            self.size, self.view_box
+        )
+
+        context.save()
+        context.scale(POINTS_PER_PIXEL, POINTS_PER_PIXEL)
+        context.rectangle(0, 0, self.size[0], self.size[1])
+        context.clip()
+        context.translate(offset_x, offset_y)
+        context.scale(scale_x, scale_y)
+        context.translate(-self.view_box[0], -self.view_box[1])
+
+        if self.repeat is None:
+            self._draw_rows(context, self.rows)
+        else:
+            tile_view_box, area = self.repeat
+            tile_surface = cairocffi.RecordingSurface(
+                cairocffi.CONTENT_COLOR_ALPHA, tuple(tile_view_box)
+            )
+            self._draw_rows(cairocffi.Context(tile_surface), self.rows)
+
+            tile_pattern = cairocffi.SurfacePattern(tile_surface)
+            tile_pattern.set_extend(cairocffi.EXTEND_REPEAT)
+            context.set_source(tile_pattern)
+            context.rectangle(*area)
+            context.fill()
+
+        context.restore()
+
+    def _draw_rows(self, context, rows) -> None:
+        rgb_boundary = self.svg_maker._rgb_boundary
+        for row_cells in rows:
+            for cell in row_cells:
+                colours = cell["colour"]
+                for ring_index, ring in enumerate(cell["polygon"]):
+                    # Check if image was substituted in broken polygon
+                    if isinstance(ring, str):
+                        self._draw_image(context, ring)
+                        continue
+
+                    if not ring:
+                        continue
+
+                    context.move_to(*ring[0])
+                    for vertex in ring[1:]:
+                        context.line_to(*vertex)
+                    context.close_path()
+
+                    colour = colours[ring_index]
+                    context.set_source_rgba(
+                        rgb_boundary(colour[0]) / 255,
+                        rgb_boundary(colour[1]) / 255,
+                        rgb_boundary(colour[2]) / 255,
+                        colour[3],
+                    )
+                    context.fill()
+
+    def _draw_image(self, context, image: str) -> None:
+        # Images are SVG fragments positioned in user space, which CairoSVG draws as vector graphics
+        image_surface = _ImageSurface(
+            Tree(
+                bytestring=(
+                    '<svg version="1.1" xmlns="http://www.w3.org/2000/svg" '
+                    'xmlns:xlink="http://www.w3.org/1999/xlink" width="1" height="1" overflow="visible">'
+                    + image
+                    + "</svg>"
+                )
+            ),
+            None,
+            96,
+        )
+        context.set_source_surface(image_surface.cairo, 0, 0)
+        context.paint()
+
+
+class VectorDocument:
+    """
+    Vector document.
+
+    PDF document with a page for every added page, so the output of a whole batch of presets ends up in a single
+    file. Every page is written to the document once it is drawn, and the document replaces its output path once
+    it is closed. Pages are drawn to a recording surface first, so pages failing halfway are left out.
+    """
+
+    def __init__(self, output_path: Path):
+        self.output_path = output_path
+        self.pages = 0
+
+        self._exit_stack = ExitStack()
+        self._surface = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_page(self, page: VectorPage) -> None:
+        """
+        Draw a page and append it to the document.
+        """
+        try:
+            page_surface = cairocffi.RecordingSurface(
+                cairocffi.CONTENT_COLOR_ALPHA, (0, 0, *page.page_size)
+            )
+            page.draw(cairocffi.Context(page_surface))
+
+            if self._surface is None:
+                temporary_path = self._exit_stack.enter_context(
+                    atomic_output_path(self.output_path)
+                )
+                self._surface = cairocffi.PDFSurface(
+                    str(temporary_path), *page.page_size
+                )
+            else:
+                self._surface.set_size(*page.page_size)
+
+            context = cairocffi.Context(self._surface)
+            context.set_source_surface(page_surface, 0, 0)
+            context.paint()
+            context.show_page()
+        except cairocffi.CairoError as e:
+            raise VectorOutputError("pdf", str(e))
+
+        self.pages += 1
+
+    def close(self) -> None:
+        """
+        Write the document to its output path, if it has any pages.
+        """
+        if self._surface is not None:
+            self._surface.finish()
+            self._surface = None
+
+        self._exit_stack.close()
+
+
+def get_vector_document_path(
+    output_path: Path,
+    input_path_given: str,
+    unique_output_file_name: bool = False,
+    shard=None,
+) -> Path:
+    """
+    Returns the path of the PDF document of a batch, named after its input.
+
+    Shards of a batch each write a document of their own, as they write to the same output concurrently.
+    """
+
+    if output_path.is_dir():
+        document_name = (
+            "stdin" if input_path_given == "-" else Path(input_path_given).stem
+        )
+        document_file = str(output_path.joinpath(document_name))
+    else:
+        document_file = str(output_path.with_suffix(""))
+
+    if shard is not None:
+        document_file += f"_{shard.index}-of-{shard.count}"
+
+    if unique_output_file_name:
+        document_file += "_" + _get_formatted_datetime()
+
+    return Path(document_file + ".pdf")
+
+
+def save_vector_pdf(page: VectorPage, output_path: Path) -> None:
+    """
+    Save a page as PDF document.
+    """
+    with atomic_output_path(output_path) as temporary_path:
+        try:
+            surface = cairocffi.PDFSurface(str(temporary_path), *page.page_size)
+            page.draw(cairocffi.Context(surface))
+            surface.finish()
+        except cairocffi.CairoError as e:
+            raise VectorOutputError("pdf", str(e))
+
+
+def save_vector_eps(page: VectorPage, output_path: Path) -> None:
+    """
+    Save a page as EPS document.
+    """
+    with atomic_output_path(output_path) as temporary_path:
+        try:
+            surface = cairocffi.PSSurface(str(temporary_path), *page.page_size)
+            surface.set_eps(True)
+            page.draw(cairocffi.Context(surface))
+            surface.finish()
+        except cairocffi.CairoError as e:
+            raise VectorOutputError("eps", str(e))
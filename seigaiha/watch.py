@@ -0,0 +1,181 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+from seigaiha.helper import PresetManifest, files_in_dir
+
+# Events of interest, including the moves and creations of editors saving through a temporary file
+INOTIFY_MASK = (
+    0x00000002  # IN_MODIFY
+    | 0x00000008  # IN_CLOSE_WRITE
+    | 0x00000040  # IN_MOVED_FROM
+    | 0x00000080  # IN_MOVED_TO
+    | 0x00000100  # IN_CREATE
+    | 0x00000200  # IN_DELETE
+)
+
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class _Inotify:
+    """
+    Minimal inotify binding, only used to wake up once any watched directory changed.
+    """
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.file_descriptor = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.file_descriptor < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self._watched: set = set()
+
+    def watch(self, directory: Path) -> None:
+        if directory in self._watched:
+            return
+
+        # Directories removed in the meantime are picked up by the next snapshot
+        if (
+            self._libc.inotify_add_watch(
+                self.file_descriptor, os.fsencode(directory), INOTIFY_MASK
+            )
+            >= 0
+        ):
+            self._watched.add(directory)
+
+    def wait(self, timeout: float | None) -> bool:
+        readable, _, _ = select.select([self.file_descriptor], [], [], timeout)
+        if not readable:
+            return False
+
+        # Only the fact that something changed matters, so drain all events
+        while True:
+            try:
+                if not os.read(self.file_descriptor, 64 * INOTIFY_EVENT.size):
+                    break
+            except BlockingIOError:
+                break
+
+        return True
+
+    def close(self) -> None:
+        os.close(self.file_descriptor)
+
+
+class InputWatcher:
+    """
+    Input watcher.
+
+    Waits for changes of input paths, being preset files, manifests or directories of preset files. Changes are
+    detected with inotify on Linux, and by polling the modification times of the files elsewhere. Changes are
+    debounced, so an editor saving a file in several steps results in a single change.
+    """
+
+    def __init__(self, paths: list, debounce: float = 0.5, poll_interval: float = 1.0):
+        self.paths = [Path(path) for path in paths]
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+        self._inotify = None
+        if sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify()
+            except (AttributeError, OSError):
+                self._inotify = None
+
+        self.snapshot = self._snapshot()
+        self._polled_snapshot = self.snapshot
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._inotify is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def wait(self) -> tuple:
+        """
+        Blocks until input files changed, and returns the (changed, removed) file paths.
+
+        Created files are part of the changed files.
+        """
+        while True:
+            if not self._wait_for_event(None):
+                continue
+
+            while self._wait_for_event(self.debounce):
+                pass
+
+            snapshot = self._snapshot()
+            changed = {
+                path
+                for path, signature in snapshot.items()
+                if self.snapshot.get(path) != signature
+            }
+            removed = self.snapshot.keys() - snapshot.keys()
+            self.snapshot = snapshot
+            if changed or removed:
+                return changed, removed
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _wait_for_event(self, timeout: float | None) -> bool:
+        if self._inotify is not None:
+            return self._inotify.wait(timeout)
+
+        time.sleep(self.poll_interval if timeout is None else timeout)
+        snapshot = self._snapshot()
+        if snapshot == self._polled_snapshot:
+            return False
+
+        self._polled_snapshot = snapshot
+
+        return True
+
+    def _snapshot(self) -> dict:
+        """
+        Returns the (modification time, size) of all watched files, watching new directories with inotify.
+        """
+        snapshot = {}
+        for path in self.paths:
+            if path.is_dir():
+                if self._inotify is not None:
+                    self._inotify.watch(path)
+                    for directory, _, _ in os.walk(path):
+                        self._inotify.watch(Path(directory))
+                files = files_in_dir(path)
+            else:
+                # Watch the parent directory, as editors often replace the file instead of writing to it
+                if self._inotify is not None:
+                    self._inotify.watch(path.parent)
+                files = [path]
+
+            for file in files:
+                try:
+                    stat_result = file.stat()
+                except OSError:
+                    continue
+                snapshot[file] = (stat_result.st_mtime_ns, stat_result.st_size)
+
+        return snapshot
+
+
+def is_watchable(resolved_input) -> bool:
+    """
+    Returns if resolved input paths can be watched, which is all input except manifests read from stdin.
+    """
+
+    return not (
+        isinstance(resolved_input, PresetManifest) and resolved_input.path is None
+    )
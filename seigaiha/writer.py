@@ -0,0 +1,158 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from loguru import logger
+
+from seigaiha.helper import fsync_paths
+
+
+class OutputWriter:
+    """
+    Output writer.
+
+    Writes output files in a bounded pool of threads, so rendering the next preset overlaps with writing
+    the previous one. Written files are optionally flushed to disk in batches.
+
+    Failed writes are logged and reported through the future returned by `submit`, so a single failed file
+    does not stop the remaining writes.
+
+    With a memory budget in bytes, the memory predicted for a preset is held until all of its outputs are written,
+    and the next preset is only admitted once it fits the budget next to the presets still being written.
+    """
+
+    def __init__(
+        self, workers: int = 4, fsync_batch_size: int = 0, memory_budget: int = 0
+    ):
+        self.workers = workers
+        self.fsync_batch_size = fsync_batch_size
+        self.memory_budget = memory_budget
+
+        self._executor = None
+        if self.workers > 0:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="seigaiha-writer"
+            )
+
+        self._pending: set = set()
+        self._written: list = []
+        self._written_lock = threading.Lock()
+        self._memory = 0.0
+        self._memory_released = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(wait_for_pending=exc_type is None)
+
+    def submit(
+        self, save_function, content, output_path: Path, description: str
+    ) -> Future:
+        """
+        Write content with the save function, blocking while too many writes are pending.
+        """
+        if self._executor is None:
+            future: Future = Future()
+            try:
+                self._write(save_function, content, output_path, description)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(output_path)
+
+            return future
+
+        # Every pending write holds its content in memory, so limit the amount of pending writes
+        while len(self._pending) >= self.workers * 2:
+            _, self._pending = wait(self._pending, return_when=FIRST_COMPLETED)
+
+        future = self._executor.submit(
+            self._write, save_function, content, output_path, description
+        )
+        self._pending.add(future)
+
+        return future
+
+    def admit(self, memory: float) -> None:
+        """
+        Block until the memory of a preset fits the budget, or until no memory is held by other presets.
+        """
+        if self.memory_budget <= 0:
+            return
+
+        with self._memory_released:
+            while self._memory > 0 and self._memory + memory > self.memory_budget:
+                self._memory_released.wait()
+
+    def hold(self, futures: list, memory: float) -> None:
+        """
+        Hold the memory of a preset until all of its futures are done.
+        """
+        futures = [future for future in futures if future is not None]
+        if self.memory_budget <= 0 or not futures:
+            return
+
+        with self._memory_released:
+            self._memory += memory
+
+        remaining = [len(futures)]
+
+        def _on_done(_):
+            with self._memory_released:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+
+                self._memory -= memory
+                self._memory_released.notify_all()
+
+        for future in futures:
+            future.add_done_callback(_on_done)
+
+    def flush(self) -> None:
+        """
+        Wait for all pending writes and flush written files to disk.
+        """
+        pending, self._pending = self._pending, set()
+        wait(pending)
+
+        with self._written_lock:
+            written, self._written = self._written, []
+
+        if written:
+            fsync_paths(written)
+
+    def close(self, wait_for_pending: bool = True) -> None:
+        if wait_for_pending:
+            self.flush()
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait_for_pending, cancel_futures=True)
+
+    def _write(
+        self, save_function, content, output_path: Path, description: str
+    ) -> Path:
+        try:
+            save_function(content, output_path)
+        except Exception as e:
+            logger.error(
+                f"Failed to save Seigaiha {description} to `{str(output_path)}`: {e}"
+            )
+            raise
+
+        logger.info(f"Saved Seigaiha {description} to `{str(output_path)}`.")
+
+        if self.fsync_batch_size <= 0:
+            return output_path
+
+        with self._written_lock:
+            self._written.append(output_path)
+            if len(self._written) < self.fsync_batch_size:
+                return output_path
+
+            written, self._written = self._written, []
+
+        fsync_paths(written)
+
+        return output_path
@@ -47,6 +47,7 @@ setup(
     install_requires=parse_requirements("requirements.txt"),
     extras_require={
         "dev": parse_requirements("requirements.dev.txt"),
+        "compression": ["brotli>=1.1", "zstandard>=0.22"],
     },
     python_requires=">=3.11",
 )